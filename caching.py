@@ -0,0 +1,208 @@
+"""In-memory caches shared across DatabaseAPI instances by a long-running process such as the database server."""
+
+import collections, copy, json, time
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+import geo_utils
+
+DEFAULT_RESPONSE_CACHE_SIZE = 1024  # Max cached responses
+DEFAULT_CIRCLE_CACHE_SIZE = 256  # Max cached search circles. Lookups scan them all, so keep this modest.
+DEFAULT_CIRCLE_CACHE_TTL = 300  # Seconds a cached search circle stays usable
+
+
+class LRUCache:
+    """Size-bounded mapping that evicts the least recently used entry, and counts hits, misses, and evictions."""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries = collections.OrderedDict()  # Least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the value cached for key and marks it most recently used, or returns default."""
+        if not key in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, value) -> None:
+        """Caches value under key, evicting the least recently used entry if the cache is full."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            evicted_key, evicted_value = self._entries.popitem(last=False)
+            self.evictions += 1
+            self._on_evict(evicted_key, evicted_value)
+
+    def pop(self, key, default=None):
+        """Removes key without counting it as an eviction, and returns its value or default."""
+        return self._entries.pop(key, default)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+    def _on_evict(self, key, value) -> None:
+        """Hook for subclasses that track extra state per entry."""
+        pass
+
+
+class ResponseCache(LRUCache):
+    """
+    Cache of DatabaseAPI responses keyed by method name and query data. Each entry is tagged with the
+    (model_name, object_id) pairs its response was built from, and writes to any of those objects invalidate it.
+
+    Only writes that go through a DatabaseAPI holding this cache invalidate entries. Anything else writing to the
+    same stored data needs to call invalidate() itself.
+    """
+
+    def __init__(self, max_entries: int=DEFAULT_RESPONSE_CACHE_SIZE):
+        super().__init__(max_entries)
+        self._tagged_keys = {}  # Keys are (model_name, object_id) tuples, values are sets of cache keys that depend on that object
+        self.invalidations = 0
+
+    def get_response(self, method: str, query_data: dict):
+        """Returns a copy of the cached response for this call, or None."""
+        entry = self.get(self._key(method, query_data))
+        if entry is None:
+            return None
+        return copy.deepcopy(entry[0])  # Callers may modify what they get back
+
+    def put_response(self, method: str, query_data: dict, response, tags: Iterable[Tuple[str, str]]) -> None:
+        """
+        Caches a response.
+
+        Args:
+            method (str): DatabaseAPI method name.
+            query_data (dict): The query_data the method was called with.
+            response: JSON-serializable return value of the call.
+            tags (iterable[tuple[str, str]]): (model_name, object_id) pairs for every stored object the response depends on.
+        """
+        key = self._key(method, query_data)
+        if key in self:
+            self._untag(key, self.pop(key)[1])
+        tags = frozenset(tags)
+        for tag in tags:
+            self._tagged_keys.setdefault(tag, set()).add(key)
+        self.put(key, (copy.deepcopy(response), tags))
+
+    def invalidate(self, tags: Iterable[Tuple[str, str]]) -> None:
+        """Drops every cached response that depends on any of the (model_name, object_id) pairs in tags."""
+        for tag in tags:
+            for key in self._tagged_keys.pop(tag, set()):
+                entry = self.pop(key)
+                if entry is not None:
+                    self.invalidations += 1
+                    self._untag(key, entry[1])
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["invalidations"] = self.invalidations
+        return stats
+
+    def _key(self, method: str, query_data: dict) -> str:
+        return f"{method} {json.dumps(query_data, sort_keys=True)}"
+
+    def _untag(self, key: str, tags: frozenset) -> None:
+        for tag in tags:
+            tagged_keys = self._tagged_keys.get(tag)
+            if tagged_keys is not None:
+                tagged_keys.discard(key)
+                if not tagged_keys:
+                    del self._tagged_keys[tag]
+
+    def _on_evict(self, key, value) -> None:
+        self._untag(key, value[1])
+
+
+class CircleCache(LRUCache):
+    """
+    Cache of geographic search results keyed by the (lat, lon, radius) circle searched. A search for a circle that
+    lies entirely inside a cached one is answered by filtering the cached circle's results down to the smaller
+    circle, without searching again.
+
+    Entries expire ttl seconds after they're cached. Each entry belongs to a namespace, e.g. one per data source,
+    and lookups only consider entries in the namespace asked for.
+    """
+
+    def __init__(self, max_entries: int=DEFAULT_CIRCLE_CACHE_SIZE, ttl: float=DEFAULT_CIRCLE_CACHE_TTL):
+        super().__init__(max_entries)
+        self._ttl = ttl
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get_within(self, namespace: str, location: tuple, radius: float) -> List[tuple]:
+        """
+        Returns the cached items less than radius meters from location, if a cached circle in namespace contains that
+        whole circle. Otherwise returns None.
+
+        Returns:
+            (list[tuple[float, object]]): (distance in meters, item) tuples sorted from nearest to farthest.
+        """
+        now = time.time()
+        for key in reversed(list(self._entries)):  # Most recently used first
+            entry_namespace, center, cached_radius = key
+            if entry_namespace != namespace:
+                continue
+            if self._entries[key][0] <= now:
+                self.pop(key)
+                self.expirations += 1
+                continue
+            if geo_utils.haversine(center, location) + radius <= cached_radius:
+                expires_at, items, locations = self.get(key)  # Counts the hit and marks it most recently used
+                indices, distances = geo_utils.query_radius(location, locations, radius)
+                return [(float(distances[i]), items[indices[i]]) for i in range(len(indices))]
+        self.misses += 1
+        return None
+
+    def put_circle(self, namespace: str, location: tuple, radius: float, items: list, locations: list) -> None:
+        """
+        Caches the results of searching a circle.
+
+        Args:
+            namespace (str): Which data source the results came from.
+            location (tuple[float]): Latitude-longitude tuple at the center of the circle searched.
+            radius (float): Radius in meters of the circle searched.
+            items (list): Every result found in the circle.
+            locations (list[tuple[float]]): Latitude-longitude location of each item in items.
+        """
+        key = (namespace, (float(location[0]), float(location[1])), float(radius))
+        self.put(key, (time.time() + self._ttl, list(items), np.asarray(locations, dtype=float).reshape(-1, 2)))
+
+    def invalidate_location(self, location: tuple) -> None:
+        """Drops every cached circle that contains location, in any namespace, e.g. because a new object was stored there."""
+        for key in list(self._entries):
+            entry_namespace, center, cached_radius = key
+            if geo_utils.haversine(center, location) < cached_radius:
+                self.pop(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drops every cached circle."""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["expirations"] = self.expirations
+        stats["invalidations"] = self.invalidations
+        return stats
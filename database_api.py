@@ -5,21 +5,39 @@ methods and return JSON.
 Goal is for external calling code to be unaffected by SQL vs. NoSQL and similar issues.
 """
 
-import sys, os, dotenv
-from typing import List
+import sys, os, dotenv, time, json, copy
+from typing import Iterator, List
 
 import model_interfaces, models
+import caching
 
 import api_clients.yelp_api_client
 from project_constants import *
 
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passes before the DatabaseAPI call working on it finishes."""
+    pass
+
 class DatabaseAPI:
 
-    def __init__(self, json_map_filename: str=MOCK_JSON_DB_MAP, live_google_maps: bool=False, live_yelp: bool=False):
+    def __init__(self, json_map_filename: str=MOCK_JSON_DB_MAP, live_google_maps: bool=False, live_yelp: bool=False, deadline: float=None,
+                response_cache: caching.ResponseCache=None, circle_cache: caching.CircleCache=None):
+        """
+        Args:
+            deadline (float): UNIX timestamp after which the caller no longer wants the result. Long-running methods
+                check it between steps and raise DeadlineExceeded once it has passed. None means no deadline.
+            response_cache (ResponseCache): Cache of get_* responses shared across DatabaseAPI instances. Writes made
+                through this instance invalidate the entries they affect. None means no caching.
+            circle_cache (CircleCache): Cache of datespot search circles shared across DatabaseAPI instances, for both
+                stored and live Yelp searches. None means no caching.
+        """
         self._valid_model_names = {"user", "datespot", "match", "review", "message", "chat"}
         self._json_map_filename = json_map_filename
         self._live_google_maps = live_google_maps # TODO implement different dispatching for the datespot queries based on this setting
         self._live_yelp = live_yelp # TODO one combined boolean toggle "live mode"
+        self.deadline = deadline
+        self._response_cache = response_cache
+        self._circle_cache = circle_cache
 
         if self._live_yelp:
             self._yelp_client = api_clients.yelp_api_client.YelpClient()
@@ -56,7 +74,11 @@ class DatabaseAPI:
         object_model_name = args_data["object_model_name"]
         new_data = args_data["object_data"]
         self._validate_model_name(object_model_name)
+        if object_model_name == "match":  # Both users' matches lists change
+            self._invalidate_cached_responses([("user", new_data["user1_id"]), ("user", new_data["user2_id"])])
         new_object_id = self._model_interface(object_model_name).create(new_data)
+        if object_model_name == "datespot" and self._circle_cache is not None:  # Searches covering it no longer have complete results
+            self._circle_cache.invalidate_location(new_data["location"])
         if new_object_id:
             return new_object_id
         else:
@@ -72,6 +94,9 @@ class DatabaseAPI:
         
         model_interface = self._model_interface(object_model_name)
         model_interface.update(object_id, update_data)
+        self._invalidate_cached_responses([(object_model_name, object_id)])
+        if object_model_name == "datespot" and "location" in update_data and self._circle_cache is not None:
+            self._circle_cache.clear()  # Don't know every circle the old location was in without re-reading it
 
     def put_json(self, object_model_name:str, object_id:int, new_json: str) -> None: # TODO return success/error message as JSON
         """
@@ -87,6 +112,9 @@ class DatabaseAPI:
         #   works for all models. All the MIs should name their updater to work with that.
         model_interface = self._model_interface(object_model_name)
         model_interface.update(object_id, new_json)
+        self._invalidate_cached_responses([(object_model_name, object_id)])
+        if object_model_name == "datespot" and "location" in new_json and self._circle_cache is not None:
+            self._circle_cache.clear()
     
     def post_decision(self, query_data: dict) -> str:
         """
@@ -110,12 +138,13 @@ class DatabaseAPI:
         if not isinstance(outcome, bool): # TODO need comprehensive approach to validation
             raise TypeError(f"Expected outcome to be of type bool, actual type was {type(outcome)}")
         response_data = {"match_created": False}
+        self._invalidate_cached_responses([("user", user_id), ("user", candidate_id)])  # Pending likes, blacklist, or matches change
         user_db = self._model_interface("user")
         if not outcome:
             user_db.blacklist(user_id, candidate_id)
         else:
             # first check if the other user already liked the active user:
-            if user_db.lookup_is_user_in_pending_likes(candidate_id, user_id):
+            if user_db.lookup_is_liked_by(user_id, candidate_id):
                 response_data["match_created"] = True
                 match_db = self._model_interface("match")  # Handle Match creation here
                 match_id = match_db.create({
@@ -144,6 +173,9 @@ class DatabaseAPI:
 
             - user_id is the only required field
         """
+        cached_response = self._cached_response("get_login_user_info", query_data)
+        if cached_response is not None:
+            return cached_response
         response = {}
         user_id = query_data["user_id"]
         user_db = self._model_interface("user")
@@ -151,6 +183,7 @@ class DatabaseAPI:
             response["error"] = f"Invalid user id: '{user_id}'"
         else:
             response = user_db.render_user(user_id)
+            self._cache_response("get_login_user_info", query_data, response, [("user", user_id)])
         return response
 
     def get_next_candidate(self, query_data: dict) -> dict:  # TODO: Return censored JSON appropriate for a Tinder-type front-end.  A React front end calling this doesn't have
@@ -186,8 +219,6 @@ class DatabaseAPI:
                     "location": [40.737291166191476, -74.00704685527774]
                 }
         """
-        # Todo: Ultimately, we want to check the cache first, there might've just been a query at that location
-        #   such that another API call is wasteful recomputation on the same reviews data.
         location = tuple(query_data["location"]) # TODO validate json
         radius = DEFAULT_RADIUS
         if "radius" in query_data:
@@ -195,9 +226,6 @@ class DatabaseAPI:
         if not self._live_yelp: # todo add "and if not live google"?
             return self._get_cached_datespots_near(location, radius)
         elif self._live_yelp: # TODO create a middleman script to permit 100% tests-coverage of this module?
-            # Todo: First, analyze whether we have cached data sufficient to respond to the query. If so, return self._get_cached_datespots_near(),
-            #   even if we're in live-yelp mode. Maybe an LRU cache of lat lon radius circles--if there was a search inside that circle recently enough
-            #   to still be in the LRU cache, then return cached results?
             return self._get_yelp_datespots_near(location, radius)
     
     # TODO rename to "suggestion candidates". There are "suggestion candidates" and "match candidates".
@@ -220,18 +248,22 @@ class DatabaseAPI:
         midpoint = match_obj.midpoint
         distance = match_obj.distance
 
-        radius = max(DEFAULT_RADIUS, distance)  # Query a radius of at least DEFAULT_RADIUS, but if users are farther apart than that, query 
-                                                #   from the center of a circle that has each user location on its perimeter.
-        results = self.get_datespots_near({"location": midpoint, "radius": radius})
-        max_possible_radius = (EARTH_CIRCUMFERENCE_KM // 2) * 1000  # Maximum logical query radius, in meters. Querying radius equal to 1/2 Earth's circumference
-                                                                    #   would query all points on Earth. 
+        radius = max(DEFAULT_RADIUS, distance)  # Take everything within a radius of at least DEFAULT_RADIUS, but if users are farther apart than that, 
+                                                #   everything within the circle that has each user location on its perimeter.
+        if self._live_yelp:
+            self._get_yelp_datespots_near(midpoint, radius)  # Caches what Yelp knows of before searching the stored datespots
         
         # TODO Set the min suggestion candidates higher, to at least 10, once the system is more robust
-        while len(results) < MIN_SUGGESTION_CANDIDATES and radius < max_possible_radius:  # If no results, double the query radius and try again until querying entire Earth
-            radius *= 2  # TODO In many cases might make more sense to intelligently move the location instead of expanding the radius
-            results = self.get_datespots_near({"location": midpoint, "radius": radius})  
-
-        return results
+        datespots_db = self._model_interface("datespot")
+        nearest_ids = []
+        for datespot_distance, datespot_id in datespots_db.iter_datespot_ids_nearest(midpoint):  # Expands outward, so stopping early skips the farther ones
+            if datespot_distance >= radius and len(nearest_ids) >= MIN_SUGGESTION_CANDIDATES:
+                break
+            nearest_ids.append((datespot_distance, datespot_id))
+            if len(nearest_ids) < MIN_SUGGESTION_CANDIDATES:
+                self._check_deadline()  # Still short, so the search may widen. Stop if the caller already gave up.
+        datespot_objs = datespots_db.lookup_objs([datespot_id for datespot_distance, datespot_id in nearest_ids])  # One read for all of them
+        return [(datespot_distance, datespot_obj) for (datespot_distance, datespot_id), datespot_obj in zip(nearest_ids, datespot_objs)]
 
         # Perform a geographic query using that midpoint
         #candidate_datespots = self.get_datespots_near({"location": midpoint}) # todo can one-liner this into passing match_obj.midpoint as the arg
@@ -251,8 +283,26 @@ class DatabaseAPI:
             (list[dict]): List containing one dictionary of rendering appropriate/relevant data for each specified
                 Match of which the specified User is a member.
         """
+        return list(self.iter_matches_list(query_data))
+
+    def iter_matches_list(self, query_data: dict) -> Iterator[dict]:
+        """
+        Generator version of get_matches_list, for streaming. Yields one match's data at a time.
+
+        The response is only cached once the generator is exhausted.
+        """
+        cached_response = self._cached_response("get_matches_list", query_data)
+        if cached_response is not None:
+            yield from cached_response
+            return
         user_id = query_data["user_id"]
-        return self._model_interface("user").render_matches_list(user_id)
+        matches_list = []
+        for match_data in self._model_interface("user").iter_matches_list(user_id):
+            self._check_deadline()
+            matches_list.append(match_data)
+            yield match_data
+        partner_tags = [("user", match_data["match_partner_info"]["user_id"]) for match_data in matches_list]  # Partners' names are rendered
+        self._cache_response("get_matches_list", query_data, matches_list, [("user", user_id)] + partner_tags)
     
     def get_suggestions_list(self, query_data: dict) -> List[dict]:
         """
@@ -265,14 +315,69 @@ class DatabaseAPI:
         Returns:
             (list[dict]): List of dictionaries of data about each Datespot.
         """
+        return list(self.iter_suggestions_list(query_data))
+
+    def iter_suggestions_list(self, query_data: dict) -> Iterator[dict]:
+        """
+        Generator version of get_suggestions_list, for streaming. Yields one suggested Datespot's data at a time.
+
+        Refreshing the suggestions, if they need it, happens before the first item. The response is only cached once
+        the generator is exhausted.
+        """
+        cached_response = self._cached_response("get_suggestions_list", query_data)
+        if cached_response is not None:
+            yield from cached_response
+            return
         match_id = query_data["match_id"]
 
         match_db = self._model_interface("match")
         if match_db.suggestion_candidates_needed(match_id):
             candidates = self.get_candidate_datespots(query_data)
+            self._check_deadline()  # Scoring the candidates is the other expensive step
             match_db.refresh_suggestion_candidates(match_id, candidates)
 
-        return self._model_interface("match").render_suggestions_list(match_id)
+        suggestions_list = []
+        for suggestion in match_db.iter_suggestions_list(match_id):
+            self._check_deadline()
+            suggestions_list.append(suggestion)
+            yield suggestion
+        datespot_tags = [("datespot", datespot_id) for datespot_id in match_db.query_suggestion_datespot_ids(match_id)]
+        self._cache_response("get_suggestions_list", query_data, suggestions_list, [("match", match_id)] + datespot_tags)
+
+    def recompute_match_midpoints(self, threshold: float=MIDPOINT_REFRESH_THRESHOLD) -> List[str]:
+        """
+        Batch job. Recomputes every Match's midpoint and distance from its Users' current locations, and flags the
+        Matches whose midpoint moved more than threshold meters so their suggestions are refreshed on next request.
+
+        Returns:
+            (list[str]): Ids of the Matches newly flagged.
+        """
+        flagged_ids = self._model_interface("match").recompute_midpoints(threshold)
+        self._invalidate_cached_responses([("match", match_id) for match_id in flagged_ids])
+        return flagged_ids
+
+    def refill_candidate_feeds(self) -> List[str]:
+        """
+        Batch job. Tops up the candidate feed of every User whose feed fell below the low-water mark, so that
+        get_next_candidate can serve from the head of the feed instead of searching for nearby users.
+
+        Returns:
+            (list[str]): Ids of the Users whose feeds gained candidates.
+        """
+        return self._model_interface("user").refill_candidate_feeds() # No cached response includes a feed, so nothing to invalidate
+
+    def warm_up(self) -> None:
+        """
+        Loads everything the first call of each kind would otherwise pay for: the NLP resources used to analyze
+        messages and reviews, the datespot baseline scoring data, and every stored data file.
+        """
+        models.nlp_resources.warm_up()
+        models.datespot.baseline_scoring_data()
+        with open(self._json_map_filename, 'r') as fobj:
+            json_map = json.load(fobj)
+        for model_name in sorted(self._valid_model_names):
+            if f"{model_name}_data" in json_map: # Not every map stores every model
+                self._model_interface(model_name)._get_all_data()
 
 
     ### Private methods ###
@@ -306,19 +411,50 @@ class DatabaseAPI:
         elif model_name == "chat":
             return model_interfaces.ChatModelInterface(json_map_filename=self._json_map_filename)
 
+    def _cached_response(self, method: str, query_data: dict):
+        """Returns the cached response for this call, or None if there isn't one or this instance has no cache."""
+        if self._response_cache is None:
+            return None
+        return self._response_cache.get_response(method, query_data)
+
+    def _cache_response(self, method: str, query_data: dict, response, tags: list) -> None:
+        """Caches a response, tagged with the (model_name, object_id) pairs it was built from."""
+        if self._response_cache is not None:
+            self._response_cache.put_response(method, query_data, response, tags)
+
+    def _invalidate_cached_responses(self, tags: list) -> None:
+        """Drops cached responses built from any of the (model_name, object_id) pairs in tags."""
+        if self._response_cache is not None:
+            self._response_cache.invalidate(tags)
+
+    def _check_deadline(self) -> None:
+        """
+        Raise DeadlineExceeded if this instance's deadline has passed.
+        """
+        if self.deadline is not None and time.time() > self.deadline:
+            raise DeadlineExceeded(f"Deadline {self.deadline} passed")
+
     def _validate_model_name(self, model_name: str):
         if not model_name in self._valid_model_names:
             raise ValueError(f"Invalid model name: {model_name}")
 
     def _cache_datespots(self, datespot_dict_list: list):
         datespot_db = self._model_interface("datespot")
-        for datespot_dict in datespot_dict_list:
-            if not datespot_db.is_known_name_location(datespot_name=datespot_dict["name"], datespot_location=datespot_dict["location"]):
-                datespot_db.create(datespot_dict)  # TODO unittest confirming this won't duplicatively enter the same restaurant
+        new_datespot_ids = datespot_db.create_many(datespot_dict_list, skip_known=True)  # One read and one write for the whole batch, skipping ones already known
+        if self._circle_cache is not None:
+            for datespot_dict in datespot_dict_list:
+                if datespot_dict.get("datespot_id") in new_datespot_ids:
+                    self._circle_cache.invalidate_location(datespot_dict["location"])
                 
     def _get_yelp_datespots_near(self, location, radius):
+        if self._circle_cache is not None:  # A recent Yelp search of a circle containing this one already has the answer
+            cached_results = self._circle_cache.get_within("yelp", location, radius)
+            if cached_results is not None:
+                return [copy.deepcopy(datespot_dict) for distance, datespot_dict in cached_results]
         datespot_json_list = self._yelp_client.search_businesses_near(location, radius)
         self._cache_datespots(datespot_json_list)
+        if self._circle_cache is not None:
+            self._circle_cache.put_circle("yelp", location, radius, copy.deepcopy(datespot_json_list), [datespot_dict["location"] for datespot_dict in datespot_json_list])
         return datespot_json_list # todo we want this and get_cached_datespots_near to return identically structured lists
                                     #  Rn, this returns list of strings, other one returns list of dicts. 
 
@@ -330,7 +466,14 @@ class DatabaseAPI:
         #   one for having the client make a real API call.
         datespots_db = self._model_interface("datespot")
         # todo validate the location and radius here?
+        if self._circle_cache is not None:
+            cached_results = self._circle_cache.get_within("stored", location, radius)
+            if cached_results is not None:  # Skip the spatial query, but still look up the current data for each Datespot
+                datespot_objs = datespots_db.lookup_objs([datespot_id for distance, datespot_id in cached_results])
+                return [(distance, datespot_obj) for (distance, datespot_id), datespot_obj in zip(cached_results, datespot_objs)]
         results = datespots_db.query_datespot_objs_near(location, radius)
+        if self._circle_cache is not None:
+            self._circle_cache.put_circle("stored", location, radius, [datespot.id for distance, datespot in results], [datespot.location for distance, datespot in results])
         return results
 
 def test_live_yelp(location, radius=DEFAULT_RADIUS):
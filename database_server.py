@@ -10,8 +10,13 @@ Protocol for transmissions between Node and Python:
     - Requests and Responses are JSON-legal strings.
     - Requests state the packet size in bytes, then provide the main request as nested JSON
     - Responses state the packet size in bytes, a binary status code, and the main response as nested JSON
-    - Status codes are 0 for normal response, 1 for error
+    - Status codes are 0 for normal response, 1 for error, 2 if the server was overloaded and shed the request
+      without running it (safe to retry after backing off), 3 if the request's deadline passed first
     - If error, the main response JSON provides an error message.
+    - Response packet size is the byte length of the complete encoded response.
+    - Requests may carry a "request_id" key alongside "body_json", which the response echoes back. Use it to
+      match responses to requests, since the server doesn't answer queued requests in arrival order (see
+      admission control below).
 
 Request format:
 
@@ -31,16 +36,107 @@ Response format:
         "body_json": <return value of the underlying DatabaseAPI method, or error message>
     }
 
+Batch requests carry an ordered list of method calls in place of the usual query data. The calls are
+executed in order against a single DatabaseAPI instance, and the response body is a list with one
+{"status_code", "body_json"} item per call. An error in one call doesn't abort the calls after it.
+
+    request (str) = {
+        "packet_size": <int>,
+        "body_json": {
+            "method": "batch",
+            "query_data": {
+                "calls": [
+                    {"method": <str>, "query_data": {<args>}},
+                    ...
+                ]
+            }
+        }
+    }
+
+Binary encoding:
+    - JSON is always supported. If the msgpack package is installed, requests and responses may instead be
+      msgpack-encoded binary frames: a zero marker byte, a 4-byte big-endian payload length, then the payload.
+    - Binary frames carry the same dicts as the JSON format, minus the packet_size key (the length prefix
+      replaces it). The server always responds in the encoding of the request.
+    - Clients negotiate with the "negotiate_encoding" method, listing encodings in order of preference. The
+      response body names the first one the server supports, falling back to "json":
+
+        {"method": "negotiate_encoding", "query_data": {"encodings": ["msgpack", "json"]}}
+            -> {"status_code": 0, "body_json": {"encoding": "msgpack"}}
+
+Deadlines:
+    - Requests may carry a "deadline" key alongside "body_json": the UNIX timestamp (seconds, float) after which
+      the client no longer wants the response. Node and Python share a clock since they run on the same machine.
+    - A request whose deadline has passed by the time it leaves the queue isn't run. Long-running DatabaseAPI
+      paths check the deadline between steps and abandon the call once it has passed. Either way the response
+      has status code 3. In a batch, calls after the deadline each get status code 3.
+
+Admission control:
+    - Requests read from the pipe wait in a bounded queue. Each method belongs to a class ("interactive",
+      "write", or "heavy"), and each class has its own queue limit. A request arriving while its class's
+      queue is full is answered immediately with status code 2.
+    - Queued interactive requests run before queued writes, and writes before heavy requests. Requests in
+      the same class run in arrival order.
+
+Server stats:
+    - The "get_server_stats" method returns per-method call counts, error counts, bytes in and out, and
+      p50/p95/p99 latencies in milliseconds, plus response cache hit and miss counts. Its query_data is ignored.
+    - Run with --stats-file to also have the server periodically overwrite that file with the same stats.
+
+Streaming:
+    - get_matches_list and get_suggestions_list can stream their response as a sequence of frames, so the client
+      can render the first items before the rest are ready. Request it with "stream": true alongside "body_json",
+      and optionally "chunk_size": <int> items per frame (default 10). The flag is ignored for other methods.
+    - Every frame of a streamed response is an ordinary response frame, plus "stream_seq" (0, 1, 2, ...) and
+      "final". Each frame's body is a list holding the next chunk of items. The last frame has "final": true and
+      may hold fewer items than chunk_size, or none.
+    - If the method fails partway, the stream ends with a final frame carrying the error status and message.
+      Items already sent stand.
+
+        {"status_code": 0, "body_json": [<item>, ...], "stream_seq": 0, "final": false, "packet_size": <int>}
+        {"status_code": 0, "body_json": [<item>, ...], "stream_seq": 1, "final": true, "packet_size": <int>}
+
+Shared-memory transport:
+    - Run with --transport shm to take requests through a shared-memory channel under /dev/shm instead of the
+      named pipes. See shm_transport.py for the buffer layout. The same frames go through it, in the same format.
+    - The server creates the channel files (<name>_web_to_db and <name>_db_to_web, each with a ".doorbell" FIFO)
+      before signalling readiness, and removes them on exit. The client only opens them.
+
+Background jobs:
+    - When no requests are queued, the server tops up the candidate feeds of users running low, at most once every
+      --feed-refill-interval seconds. get_next_candidate then serves from the head of the stored feed. The refill's
+      timings appear in the server stats under "<refill_candidate_feeds>".
+    - Likewise, at most once every --midpoint-refresh-interval seconds, it recomputes every Match's midpoint and flags
+      the Matches whose Users moved far enough to need fresh suggestions. Stats key "<recompute_match_midpoints>".
+    - At most one job runs per idle moment, so the server checks for requests between jobs.
+
+Startup:
+    - Before creating the inbound pipe, the server loads the NLP resources, the datespot scoring data, and every
+      stored data file, so the first requests don't pay for them.
+    - Once the inbound pipe (or shared-memory channel) is open, the server prints a line reading
+      "DATABASE SERVER READY" to stdout. Run with --ready-file to also have it create that file at the same point,
+      holding {"pid", "ready_time", "warm_up_seconds"}. The file is removed when the server exits.
+
 """
 
 from multiprocessing import Process, Pipe # TODO Tbd if there will be any communication between Python processes that can use this instead of the IPC FIFO pipes
 
 import os
 import select
-from typing import ByteString
+import struct
+import heapq
+from typing import ByteString, Iterator, List, Tuple
 import json
 
-from database_api import DatabaseAPI
+try:
+    import msgpack
+except ImportError: # Binary encoding is optional; JSON is always available
+    msgpack = None
+
+from database_api import DatabaseAPI, DeadlineExceeded
+from server_stats import ServerStats
+import caching
+import shm_transport
 
 import argparse
 import time
@@ -51,12 +147,110 @@ FIFO_DB_TO_WEB = 'http-server/fifo_python_to_node'
 
 DEFAULT_PACKET_SIZE = 1024
 
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+BINARY_FRAME_MARKER = b"\x00" # JSON frames always start with "{" or whitespace, so a zero byte can't be mistaken for one
+BINARY_FRAME_HEADER = struct.Struct(">cI") # Marker byte, then unsigned 4-byte big-endian payload length
+
+STATUS_OVERLOADED = 2
+STATUS_DEADLINE_EXCEEDED = 3
+
+METHOD_CLASS_PRIORITIES = { # Lower runs first
+    "interactive": 0,
+    "write": 1,
+    "heavy": 2
+}
+
+DEFAULT_QUEUE_LIMITS = { # Max requests of each method class waiting to run
+    "interactive": 64,
+    "write": 32,
+    "heavy": 8
+}
+
+DEFAULT_STATS_INTERVAL = 60 # Seconds between dumps of the server stats file
+DEFAULT_FEED_REFILL_INTERVAL = 30 # Seconds between idle-time refills of the users' candidate feeds
+DEFAULT_MIDPOINT_REFRESH_INTERVAL = 300 # Seconds between idle-time recomputations of the Matches' midpoints
+IDLE_JOB_STATS_KEY = "<{}>" # Stats key for a background job, bracketed so it can't collide with a request method
+INVALID_METHOD_STATS_KEY = "<invalid>" # Stats key for requests that didn't name a valid method, so arbitrary client strings can't add keys
+DEFAULT_STREAM_CHUNK_SIZE = 10 # Items per frame in a streamed response
+READY_LINE = "DATABASE SERVER READY" # Printed to stdout once the server is warmed up and listening
+
+def find_json_frame_end(text: str, start: int) -> int:
+    """
+    Returns the index just past the closing brace that balances the opening brace at text[start], or None if the
+    text ends before the frame does.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth <= 0:
+                return i + 1
+    return None
+
 class DatabaseServer:
 
-    def __init__(self):
+    def __init__(self, stats_file: str=None, stats_interval: float=DEFAULT_STATS_INTERVAL, queue_limits: dict=None,
+                response_cache_size: int=caching.DEFAULT_RESPONSE_CACHE_SIZE, ready_file: str=None,
+                circle_cache_size: int=caching.DEFAULT_CIRCLE_CACHE_SIZE, feed_refill_interval: float=DEFAULT_FEED_REFILL_INTERVAL,
+                midpoint_refresh_interval: float=DEFAULT_MIDPOINT_REFRESH_INTERVAL):
+        """
+        Args:
+            stats_file (str): If provided, path of a file to periodically overwrite with the server stats as JSON.
+            stats_interval (float): Seconds between writes of the stats file.
+            queue_limits (dict): Max queued requests per method class. Classes left out keep their default limit.
+            response_cache_size (int): Max responses to keep in the get_* response cache. 0 disables the cache.
+            ready_file (str): If provided, path of a file to create once the server is warmed up and listening.
+            circle_cache_size (int): Max datespot search circles to keep in the circle cache. 0 disables the cache.
+            feed_refill_interval (float): Min seconds between idle-time refills of the candidate feeds. 0 disables the refill.
+            midpoint_refresh_interval (float): Min seconds between idle-time recomputations of the Match midpoints, which
+                flag Matches whose Users moved as needing fresh suggestions. 0 disables the recomputation.
+        """
 
         self._pipe_in = None
         self._pipe_out = None
+        self._read_buffer = b"" # Bytes read from the pipe that don't yet make up a complete request frame
+        self._ready_file = ready_file
+        self._warm_up_seconds = None
+
+        self._supported_encodings = [ENCODING_JSON]
+        if msgpack:
+            self._supported_encodings.append(ENCODING_MSGPACK)
+
+        self._stats = ServerStats()
+        self._stats_file = stats_file
+        self._stats_interval = stats_interval
+        self._last_stats_dump = time.time()
+
+        self._queue_limits = dict(DEFAULT_QUEUE_LIMITS)
+        if queue_limits:
+            self._queue_limits.update(queue_limits)
+        self._request_queue = [] # Heap of (class_priority, arrival_number, request_dict, encoding, frame_size)
+        self._queued_counts = {method_class: 0 for method_class in METHOD_CLASS_PRIORITIES}
+        self._arrival_number = 0 # Tiebreaker so requests in the same class run in arrival order
+
+        self._response_cache = caching.ResponseCache(response_cache_size) if response_cache_size else None # Shared by every DatabaseAPI the server creates
+        self._circle_cache = caching.CircleCache(circle_cache_size) if circle_cache_size else None # Same
+
+        self._idle_jobs = { # Keys are DatabaseAPI batch job method names, values are [min seconds between runs, time of last run]
+            "refill_candidate_feeds": [feed_refill_interval, 0.0], # Last run 0.0, so each job runs at the first idle moments after startup
+            "recompute_match_midpoints": [midpoint_refresh_interval, 0.0]
+        }
 
         self._valid_database_methods = { # TODO Programmatically list all public methods of DatabaseAPI class, for easier maintenance.
                                         #   See https://stackoverflow.com/questions/1911281/how-do-i-get-list-of-methods-in-a-python-class
@@ -69,10 +263,37 @@ class DatabaseServer:
             "get_suggestions_list"
         }
 
+        self._server_methods = { # Handled by the server itself rather than passed through to a DatabaseAPI method
+            "batch",
+            "negotiate_encoding",
+            "get_server_stats"
+        }
+
+        self._streaming_methods = { # Methods that can stream their response. Keys are request method names, values are the DatabaseAPI generator methods
+            "get_matches_list": "iter_matches_list",
+            "get_suggestions_list": "iter_suggestions_list"
+        }
+
+        self._method_classes = { # Methods not listed here, including invalid ones, are "interactive" since they're cheap to run or reject
+            "post_object": "write",
+            "post_decision": "write",
+            "get_matches_list": "heavy",
+            "get_suggestions_list": "heavy",
+            "batch": "heavy"
+        }
+
         self._error_messages = {
             "invalid dict size": lambda dict_len : f"Invalid dict length: {dict_len}",
             "invalid method": lambda method : f"Invalid method: {method}",
-            "no method": lambda : f"Request didn't specify method for DatabaseAPI call"  # If some of them are weirdly lambdas, at least slightly less confusing if all of them are
+            "no method": lambda : f"Request didn't specify method for DatabaseAPI call",  # If some of them are weirdly lambdas, at least slightly less confusing if all of them are
+            "invalid batch": lambda : f"Batch request must provide a list of calls",
+            "nested batch": lambda : f"Batch requests can't contain further batch requests",
+            "malformed request": lambda error : f"Malformed request: {error}",
+            "unsupported encoding": lambda encoding : f"Unsupported encoding: {encoding}",
+            "overloaded": lambda method_class : f"Server overloaded: too many queued {method_class} requests",
+            "deadline exceeded": lambda deadline : f"Deadline exceeded: {deadline}",
+            "invalid deadline": lambda deadline : f"Invalid deadline: {deadline}",
+            "invalid chunk size": lambda chunk_size : f"Invalid chunk size: {chunk_size}"
         }
     
     def _read_request_bytes(self, packet_size=DEFAULT_PACKET_SIZE):
@@ -103,22 +324,138 @@ class DatabaseServer:
         #   and that setting a comfortably large buffer won't cause problems. These are strings not image files.
         # TODO OTOH, might need to know the size to tell where one transmission ends and the next begins.
 
-        return os.read(self._pipe_in, packet_size)
+        request_bytes = b""
+        while True: # Drain everything currently in the pipe, since a single read can end mid-frame
+            try:
+                chunk = os.read(self._pipe_in, packet_size)
+            except BlockingIOError: # Non-blocking pipe is empty
+                break
+            request_bytes += chunk
+            if len(chunk) < packet_size:
+                break
+        return request_bytes
     
-    def _handle_request(self):
+    def _handle_request(self) -> List[ByteString]:
         """
+        Reads everything available from the inbound pipe and queues the complete requests in it.
+
         Returns:
-            (ByteString): Bytes ready to be written into the outbound DB->Web pipe
+            (list[ByteString]): Bytes ready to be written into the outbound DB->Web pipe, one item for each request
+                that was shed rather than queued.
         """
-        request_bytes = self._read_request_bytes()
-        request_json = self._decode_request_bytes(request_bytes)
-        response_json = self._dispatch_request(request_json)
-        return response_json.encode("utf-8")
-        
-    def _decode_request_bytes(self, request_bytes: ByteString):
-        assert isinstance(request_bytes, ByteString)
-        request_json = request_bytes.decode("utf-8")  # TODO "ENCODING" global constant?
-        return request_json
+        self._read_buffer += self._read_request_bytes()
+        return self._enqueue_requests()
+
+    def _enqueue_requests(self) -> List[ByteString]:
+        """
+        Moves each complete request frame in the read buffer to the request queue, or sheds it if its method class's
+        queue is full.
+
+        Returns:
+            (list[ByteString]): Encoded "overloaded" responses for the shed requests.
+        """
+        shed_responses = []
+        for request_dict, encoding, frame_size in self._split_request_frames():
+            method_class = self._method_class(request_dict)
+            if self._queued_counts[method_class] >= self._queue_limits[method_class]:
+                shed_responses.append(self._shed(request_dict, encoding, frame_size, method_class))
+                continue
+            self._queued_counts[method_class] += 1
+            self._arrival_number += 1
+            heapq.heappush(self._request_queue, (METHOD_CLASS_PRIORITIES[method_class], self._arrival_number, request_dict, encoding, frame_size))
+        return shed_responses
+
+    def _process_next_request(self) -> Iterator[ByteString]:
+        """
+        Runs the highest-priority queued request.
+
+        Returns:
+            (Iterator[ByteString]): The response frames, each produced as it's ready to be written. Only streamed
+                responses have more than one frame. None if the queue is empty.
+        """
+        if not self._request_queue:
+            return None
+        priority, arrival_number, request_dict, encoding, frame_size = heapq.heappop(self._request_queue)
+        self._queued_counts[self._method_class(request_dict)] -= 1
+        if self._is_stream_request(request_dict):
+            return self._respond_stream(request_dict, encoding, frame_size)
+        return iter([self._respond(request_dict, encoding, frame_size)])
+
+    def _method_class(self, request_dict: dict) -> str:
+        """Returns the name of the method class a request belongs to."""
+        body_dict = request_dict.get("body_json") if isinstance(request_dict, dict) else None
+        method = body_dict.get("method") if isinstance(body_dict, dict) else None
+        return self._method_classes.get(method, "interactive")
+
+    def _shed(self, request_dict: dict, encoding: str, request_size: int, method_class: str) -> ByteString:
+        """Returns an "overloaded" response for a request that won't be run."""
+        response_dict = {"status_code": STATUS_OVERLOADED, "body_json": self._error_messages["overloaded"](method_class)}
+        if isinstance(request_dict, dict) and "request_id" in request_dict:
+            response_dict["request_id"] = request_dict["request_id"]
+        response = self._encode_response(response_dict, encoding)
+        body_dict = request_dict.get("body_json") if isinstance(request_dict, dict) else None
+        method = self._stats_method_name(body_dict)
+        self._stats.record_shed(method)
+        self._stats.record_bytes(method, request_size, len(response))
+        return response
+
+    def _split_request_frames(self) -> List[Tuple[dict, str]]:
+        """
+        Consumes every complete request frame at the front of the read buffer, leaving any trailing partial frame
+        in the buffer for the next read.
+
+        Returns:
+            (list[tuple[dict, str, int]]): List of (request_dict, encoding, frame_size) tuples. A frame that can't be
+                decoded comes back as a dict with an "error" key in place of the request.
+        """
+        frames = []
+        while self._read_buffer:
+            buffer_size = len(self._read_buffer)
+            if self._read_buffer[:1] == BINARY_FRAME_MARKER:
+                if len(self._read_buffer) < BINARY_FRAME_HEADER.size:
+                    break
+                payload_size = BINARY_FRAME_HEADER.unpack_from(self._read_buffer)[1]
+                frame_end = BINARY_FRAME_HEADER.size + payload_size
+                if len(self._read_buffer) < frame_end:
+                    break
+                payload = self._read_buffer[BINARY_FRAME_HEADER.size:frame_end]
+                self._read_buffer = self._read_buffer[frame_end:]
+                if not msgpack:
+                    frames.append(({"error": self._error_messages["unsupported encoding"](ENCODING_MSGPACK)}, ENCODING_JSON, frame_end))
+                    continue
+                try:
+                    frames.append((msgpack.unpackb(payload), ENCODING_MSGPACK, frame_end))
+                except Exception as e:
+                    frames.append(({"error": self._error_messages["malformed request"](repr(e))}, ENCODING_MSGPACK, frame_end))
+            else:
+                try:
+                    request_text = self._read_buffer.decode("utf-8")
+                except UnicodeDecodeError as e: # Buffer may end partway through a multi-byte character
+                    if e.reason != "unexpected end of data":
+                        self._read_buffer = b""
+                        frames.append(({"error": self._error_messages["malformed request"](str(e))}, ENCODING_JSON, buffer_size))
+                        break
+                    request_text = self._read_buffer[:e.start].decode("utf-8")
+                frame_start = len(request_text) - len(request_text.lstrip())
+                if frame_start == len(request_text): # Nothing but whitespace
+                    self._read_buffer = self._read_buffer[len(request_text.encode("utf-8")):]
+                    if not request_text:
+                        break
+                    continue
+                if request_text[frame_start] != "{":
+                    self._read_buffer = b"" # Can't tell where a frame that doesn't open with a brace ends, so discard what's buffered
+                    frames.append(({"error": self._error_messages["malformed request"]("expected '{'")}, ENCODING_JSON, buffer_size))
+                    break
+                frame_end = find_json_frame_end(request_text, frame_start)
+                if frame_end is None: # Incomplete frame, wait for the rest of it
+                    break
+                frame_size = len(request_text[:frame_end].encode("utf-8"))
+                self._read_buffer = self._read_buffer[frame_size:]
+                try:
+                    frames.append((json.loads(request_text[frame_start:frame_end]), ENCODING_JSON, frame_size))
+                except json.JSONDecodeError as e:
+                    frames.append(({"error": self._error_messages["malformed request"](str(e))}, ENCODING_JSON, frame_size))
+        return frames
 
     def _validate_request(self, request_dict: dict) -> dict:
         """Returns error-message dict if request is not appropriate to pass to DatabaseAPI, else returns dict with status code 0 and no other content,
@@ -127,7 +464,9 @@ class DatabaseServer:
         error_message = None
         if not "method" in request_dict:
             error_message = self._error_messages["no method"]()
-        elif request_dict["method"] not in self._valid_database_methods:
+        elif not "query_data" in request_dict: # Checked here so no caller reads request_dict["query_data"] unguarded
+            error_message = self._error_messages["malformed request"]("missing query_data")
+        elif request_dict["method"] not in self._valid_database_methods | self._server_methods:
             error_message = self._error_messages["invalid method"](request_dict["method"])
         elif len(request_dict) != 2:  # Should have exactly two keys: Method and arguments dict
             error_message = self._error_messages["invalid dict size"](len(request_dict))
@@ -142,33 +481,254 @@ class DatabaseServer:
 
     def _dispatch_request(self, request_json: str) -> str:
         request_dict = json.loads(request_json)
-        request_dict = request_dict["body_json"] # Continue with only the body JSON, packet size not relevant going forward 
+        return self._respond(request_dict, ENCODING_JSON, len(request_json.encode("utf-8"))).decode("utf-8")
+
+    def _respond(self, request_dict: dict, encoding: str, request_size: int=0) -> ByteString:
+        """
+        Executes a decoded request and returns the encoded response.
+
+        Args:
+            request_dict (dict): Full request dict, including the "body_json" key.
+            encoding (str): Encoding the request arrived in, which the response will use too.
+            request_size (int): Size in bytes of the request frame, for the server stats.
+
+        Returns:
+            (ByteString): Bytes of the complete response frame.
+        """
+        request_id = request_dict.get("request_id") if isinstance(request_dict, dict) else None
+        if isinstance(request_dict, dict) and "error" in request_dict:
+            response_dict = {"status_code": 1, "body_json": request_dict["error"]}
+            self._stats.record_call(INVALID_METHOD_STATS_KEY, 0.0, error=True)
+        elif not isinstance(request_dict, dict) or not isinstance(request_dict.get("body_json"), dict):
+            response_dict = {"status_code": 1, "body_json": self._error_messages["malformed request"]("missing body_json")}
+            self._stats.record_call(INVALID_METHOD_STATS_KEY, 0.0, error=True)
+        elif not isinstance(request_dict.get("deadline"), (int, float, type(None))):
+            response_dict = {"status_code": 1, "body_json": self._error_messages["invalid deadline"](request_dict["deadline"])}
+            self._stats.record_call(INVALID_METHOD_STATS_KEY, 0.0, error=True)
+        else:
+            deadline = request_dict.get("deadline")
+            request_dict = request_dict["body_json"] # Continue with only the body JSON, packet size not relevant going forward 
+            db = DatabaseAPI(deadline=deadline, response_cache=self._response_cache, circle_cache=self._circle_cache) # Let it use default JSON map
+            response_dict = self._execute_request(db, request_dict)
+        if request_id is not None:
+            response_dict["request_id"] = request_id
+        response = self._encode_response(response_dict, encoding)
+        self._stats.record_bytes(self._stats_method_name(request_dict), request_size, len(response))
+        return response
+
+    def _is_stream_request(self, request_dict: dict) -> bool:
+        """Returns True if request_dict asks for a streamed response from a method that supports streaming."""
+        if not isinstance(request_dict, dict) or not request_dict.get("stream") is True:
+            return False
+        body_dict = request_dict.get("body_json")
+        return isinstance(body_dict, dict) and body_dict.get("method") in self._streaming_methods
+
+    def _respond_stream(self, request_dict: dict, encoding: str, request_size: int=0) -> Iterator[ByteString]:
+        """
+        Executes a decoded streaming request and yields its encoded response frames as the items are produced.
+
+        Args:
+            request_dict (dict): Full request dict, including the "body_json" key and "stream": true.
+            encoding (str): Encoding the request arrived in, which the response will use too.
+            request_size (int): Size in bytes of the request frame, for the server stats.
+
+        Yields:
+            (ByteString): Bytes of each complete response frame, in order.
+        """
+        method = self._stats_method_name(request_dict["body_json"])
+        start_time = time.perf_counter()
+        bytes_out = 0
+        error = False
+        for stream_seq, response_dict in enumerate(self._execute_stream(request_dict)):
+            response_dict["stream_seq"] = stream_seq
+            if "request_id" in request_dict:
+                response_dict["request_id"] = request_dict["request_id"]
+            error = error or response_dict["status_code"] != 0
+            response = self._encode_response(response_dict, encoding)
+            bytes_out += len(response)
+            yield response
+        self._stats.record_call(method, time.perf_counter() - start_time, error=error)  # Includes time spent waiting on the client to take each frame
+        self._stats.record_bytes(method, request_size, bytes_out)
+
+    def _execute_stream(self, request_dict: dict) -> Iterator[dict]:
+        """
+        Runs a streaming DatabaseAPI method and yields response dicts of up to chunk_size items each. Every one but
+        the last has "final": false. An error ends the stream with a final error response.
+        """
+        chunk_size = request_dict.get("chunk_size", DEFAULT_STREAM_CHUNK_SIZE)
+        deadline = request_dict.get("deadline")
+        body_dict = request_dict["body_json"]
+        if not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or chunk_size < 1:
+            yield {"status_code": 1, "body_json": self._error_messages["invalid chunk size"](chunk_size), "final": True}
+            return
+        if not isinstance(deadline, (int, float, type(None))):
+            yield {"status_code": 1, "body_json": self._error_messages["invalid deadline"](deadline), "final": True}
+            return
+        if deadline is not None and time.time() > deadline:
+            yield {"status_code": STATUS_DEADLINE_EXCEEDED, "body_json": self._error_messages["deadline exceeded"](deadline), "final": True}
+            return
+        response_dict = self._validate_request(body_dict)
+        if response_dict["status_code"] != 0:
+            response_dict["final"] = True
+            yield response_dict
+            return
+
+        db = DatabaseAPI(deadline=deadline, response_cache=self._response_cache, circle_cache=self._circle_cache)
+        items = getattr(db, self._streaming_methods[body_dict["method"]])(query_data=body_dict["query_data"])
+        chunk = []
+        try:
+            for item in items:
+                chunk.append(item)
+                if len(chunk) == chunk_size:
+                    yield {"status_code": 0, "body_json": chunk, "final": False}
+                    chunk = []
+        except DeadlineExceeded:
+            yield {"status_code": STATUS_DEADLINE_EXCEEDED, "body_json": self._error_messages["deadline exceeded"](deadline), "final": True}
+            return
+        except Exception as e:
+            print(repr(e))
+            yield {"status_code": 1, "body_json": f"Database error: {repr(e)}", "final": True}
+            return
+        yield {"status_code": 0, "body_json": chunk, "final": True}  # Empty if the item count was a multiple of chunk_size
+
+    def _encode_response(self, response_dict: dict, encoding: str=ENCODING_JSON) -> ByteString:
+        """
+        Encodes a response dict to the bytes of a complete response frame, serializing the response body only once.
+
+        Args:
+            response_dict (dict): Response dict with a status code and body, not yet stamped with a packet size.
+            encoding (str): One of the supported encoding names.
+
+        Returns:
+            (ByteString): Bytes ready to be written into the outbound DB->Web pipe.
+        """
+        if encoding == ENCODING_MSGPACK:
+            payload = msgpack.packb(response_dict)
+            return BINARY_FRAME_HEADER.pack(BINARY_FRAME_MARKER, len(payload)) + payload
+        response_json = json.dumps(response_dict) # ASCII-only by default, so string length equals byte length
+        response_json = response_json[:-1] + ', "packet_size": ' # Splice the packet size in as the last key
+        packet_size = len(response_json) + 1 # Closing brace
+        while len(response_json) + len(str(packet_size)) + 1 != packet_size: # The size's own digits count toward the size
+            packet_size = len(response_json) + len(str(packet_size)) + 1
+        return f"{response_json}{packet_size}}}".encode("utf-8")
+
+    def _execute_request(self, db: DatabaseAPI, request_dict: dict) -> dict:
+        """
+        Validates a request body and executes it against db.
+
+        Args:
+            db (DatabaseAPI): DatabaseAPI instance to make the call on. Calls in the same batch share one instance.
+            request_dict (dict): Request body dict containing the method and query data.
+
+        Returns:
+            (dict): Response dict with a status code and body, not yet stamped with a packet size.
+        """
+        start_time = time.perf_counter()
+        response_dict = self._execute_method(db, request_dict)
+        self._stats.record_call(self._stats_method_name(request_dict), time.perf_counter() - start_time, error=response_dict["status_code"] != 0)
+        return response_dict
+
+    def _execute_method(self, db: DatabaseAPI, request_dict: dict) -> dict:
+        """Dispatches a request body to the server method or DatabaseAPI method it names."""
+        if db.deadline is not None and time.time() > db.deadline: # Don't start work the client has already given up on
+            return {"status_code": STATUS_DEADLINE_EXCEEDED, "body_json": self._error_messages["deadline exceeded"](db.deadline)}
         response_dict = self._validate_request(request_dict)
         if response_dict["status_code"] == 0:
             method, query_data = request_dict["method"], request_dict["query_data"]
-            db = DatabaseAPI() # Let it use default JSON map
+            if method == "batch":
+                return self._execute_batch(db, query_data)
+            if method == "negotiate_encoding":
+                return self._negotiate_encoding(query_data)
+            if method == "get_server_stats":
+                return {"status_code": 0, "body_json": self._server_stats()}
             try:
-                eval_string =  f"db.{method}(query_data=query_data)"
-                database_response = eval(eval_string)
+                database_response = getattr(db, method)(query_data=query_data)
+            except DeadlineExceeded:
+                response_dict["status_code"] = STATUS_DEADLINE_EXCEEDED
+                database_response = self._error_messages["deadline exceeded"](db.deadline)
             except Exception as e:
                 print(f"exception raised by database call")
                 response_dict["status_code"] = 1
                 print(repr(e))
                 database_response = f"Database error: {repr(e)}"  # TODO Pass the Exception from DB API back through the pipe same as any other error message
-            if isinstance(database_response, dict):
-                response_dict["body_json"] = database_response
+            response_dict["body_json"] = database_response
+        return response_dict
+
+    def _execute_batch(self, db: DatabaseAPI, query_data: dict) -> dict:
+        """
+        Executes each call in a batch request in order, and collects a per-call response.
+
+        Returns:
+            (dict): Response dict whose body is the list of per-call response dicts.
+        """
+        calls = query_data.get("calls") if isinstance(query_data, dict) else None
+        if not isinstance(calls, list):
+            return {"status_code": 1, "body_json": self._error_messages["invalid batch"]()}
+        results = []
+        for call_dict in calls:
+            if not isinstance(call_dict, dict):
+                results.append({"status_code": 1, "body_json": self._error_messages["no method"]()})
+            elif call_dict.get("method") == "batch":
+                results.append({"status_code": 1, "body_json": self._error_messages["nested batch"]()})
             else:
-                response_dict["body_json"] = database_response
-        # TODO figure out the right way to get the packet size correctly and efficiently. NB especially that Python string or int object
-        #   with its various Python methods has more bytes than the underlying raw data in memory.
-        response_packet_size = sys.getsizeof(json.dumps(response_dict)) # TODO duplicative call to json.dumps, surely a better way
-        response_packet_size += sys.getsizeof(response_packet_size)
-        response_dict["packet_size"] = response_packet_size
-        response_json = json.dumps(response_dict)
-        return response_json
+                results.append(self._execute_request(db, call_dict))
+        return {"status_code": 0, "body_json": results}
+
+    def _negotiate_encoding(self, query_data: dict) -> dict:
+        """
+        Picks the first encoding in the client's order of preference that this server supports.
+
+        Returns:
+            (dict): Response dict whose body names the chosen encoding. Falls back to JSON.
+        """
+        requested_encodings = query_data.get("encodings", []) if isinstance(query_data, dict) else []
+        chosen_encoding = ENCODING_JSON
+        for encoding in requested_encodings:
+            if encoding in self._supported_encodings:
+                chosen_encoding = encoding
+                break
+        return {"status_code": 0, "body_json": {"encoding": chosen_encoding}}
+
+    def _stats_method_name(self, request_dict: dict) -> str:
+        """Returns the method name to file a request's stats under."""
+        if isinstance(request_dict, dict) and request_dict.get("method") in self._valid_database_methods | self._server_methods:
+            return request_dict["method"]
+        return INVALID_METHOD_STATS_KEY
+
+    def _server_stats(self) -> dict:
+        """Returns the current server stats as a JSON-serializable dict."""
+        stats = self._stats.snapshot()
+        if self._response_cache is not None:
+            stats["response_cache"] = self._response_cache.stats()
+        if self._circle_cache is not None:
+            stats["circle_cache"] = self._circle_cache.stats()
+        return stats
+
+    def _dump_stats(self) -> None:
+        """Overwrites the stats file with the current server stats, if it's time to."""
+        if not self._stats_file or time.time() - self._last_stats_dump < self._stats_interval:
+            return
+        with open(self._stats_file, 'w') as fobj:
+            json.dump(self._server_stats(), fobj, indent=2)
+        self._last_stats_dump = time.time()
+
+    def warm_up(self) -> None:
+        """Loads the resources that would otherwise make the first requests after startup slow."""
+        start_time = time.perf_counter()
+        DatabaseAPI().warm_up()
+        self._warm_up_seconds = round(time.perf_counter() - start_time, 3)
+        print(f"Warmed up in {self._warm_up_seconds} seconds")
+
+    def _signal_ready(self) -> None:
+        """Announces that the server is warmed up and listening, on stdout and in the ready file if there is one."""
+        if self._ready_file:
+            with open(self._ready_file, 'w') as fobj:
+                json.dump({"pid": os.getpid(), "ready_time": time.time(), "warm_up_seconds": self._warm_up_seconds}, fobj)
+        print(READY_LINE, flush=True)
 
     def run_listener(self):
         """Listens for data transmitted through the web -> DB pipe."""
+        self.warm_up() # Before creating the pipe, so nothing can send a request until it's done
         try:
             os.mkfifo(FIFO_WEB_TO_DB) # Create inbound pipe (web -> DB)
         except FileExistsError: # TODO it should never already exist in this namespace, right? Because that would mean a non-normal
@@ -178,6 +738,7 @@ class DatabaseServer:
         try:
             self._pipe_in = os.open(FIFO_WEB_TO_DB, os.O_RDONLY | os.O_NONBLOCK) # Open Web->DB pipe read-only and in non-blocking mode
             print("Python inbound pipe-end ready")
+            self._signal_ready()
 
             while True: # Wait for the web server to create the DB->Web pipe
                 try:
@@ -193,10 +754,17 @@ class DatabaseServer:
 
                 try:
                     while True:  # TODO what's the best polling frequency?
-                        if (self._pipe_in, select.POLLIN) in poll.poll(1000):  # Poll every 1 second
+                        poll_timeout = 0 if self._request_queue else 1000 # Only wait on the pipe when there's no queued work
+                        if (self._pipe_in, select.POLLIN) in poll.poll(poll_timeout):  # Poll every 1 second
                             print(f"--------  received request at {time.time()} --------")
-                            response = self._handle_request()
-                            os.write(self._pipe_out, response)
+                            for response in self._handle_request(): # Shed requests get their answer right away
+                                os.write(self._pipe_out, response)
+                        if self._request_queue: # Run one request, then check the pipe again so new arrivals can be admitted or shed
+                            for response in self._process_next_request(): # Write each frame of a streamed response as soon as it's ready
+                                os.write(self._pipe_out, response)
+                        else:
+                            self._run_idle_jobs()
+                        self._dump_stats()
                 
                 finally:
                     poll.unregister(self._pipe_in)
@@ -205,7 +773,80 @@ class DatabaseServer:
         finally:
             os.remove(FIFO_WEB_TO_DB)
             os.remove(FIFO_DB_TO_WEB)
+            self._remove_ready_file()
+
+    def run_shm_listener(self, channel_name: str=shm_transport.DEFAULT_CHANNEL_NAME):
+        """Listens for requests on a shared-memory channel instead of the named pipes."""
+        self.warm_up() # Before creating the channel, so nothing can send a request until it's done
+        channel = shm_transport.ShmChannel(channel_name, create=True)
+        try:
+            print(f"Python shared-memory channel {channel_name} ready")
+            self._signal_ready()
+            while True:
+                self._serve_shm(channel, timeout=0 if self._request_queue else 1.0) # Only wait on the channel when there's no queued work
+                if not self._request_queue:
+                    self._run_idle_jobs()
+                self._dump_stats()
+        finally:
+            channel.close()
+            channel.unlink()
+            self._remove_ready_file()
+
+    def _serve_shm(self, channel: shm_transport.ShmChannel, timeout: float) -> None:
+        """
+        Admits or sheds whatever requests have arrived on the channel, waiting up to timeout seconds for some, then
+        runs at most one queued request.
+        """
+        if channel.requests.wait_readable(timeout) if timeout else channel.requests.readable():
+            self._read_buffer += channel.requests.read()
+            for response in self._enqueue_requests(): # Shed requests get their answer right away
+                channel.responses.write_all(response)
+        if self._request_queue:
+            for response in self._process_next_request(): # Write each frame of a streamed response as soon as it's ready
+                channel.responses.write_all(response)
+
+    def _run_idle_jobs(self) -> None:
+        """
+        Runs the first background batch job that's due. Only called when no requests are queued, so jobs don't hold up
+        any, though one that arrives mid-job waits for the job to finish. Runs at most one job per call, so the listener
+        checks for requests again between jobs.
+        """
+        for method, schedule in self._idle_jobs.items():
+            interval, last_run = schedule
+            if not interval or time.time() - last_run < interval:
+                continue
+            start_time = time.perf_counter()
+            error = False
+            try: # Shares the server's caches, so the job's invalidations reach them
+                getattr(DatabaseAPI(response_cache=self._response_cache, circle_cache=self._circle_cache), method)()
+            except Exception as e: # A failed job leaves the data as it was, and mustn't take the server down
+                print(f"exception raised by background job {method}")
+                print(repr(e))
+                error = True
+            self._stats.record_call(IDLE_JOB_STATS_KEY.format(method), time.perf_counter() - start_time, error=error)
+            schedule[1] = time.time()
+            return
+
+    def _remove_ready_file(self) -> None:
+        if self._ready_file and os.path.exists(self._ready_file):
+            os.remove(self._ready_file)
 
 if __name__ == "__main__":
-    server = DatabaseServer()
-    server.run_listener()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Listen for DatabaseAPI requests from the web server.")
+    parser.add_argument("--stats-file", help="Path of a file to periodically overwrite with the server stats as JSON")
+    parser.add_argument("--stats-interval", type=float, default=DEFAULT_STATS_INTERVAL, help="Seconds between stats file writes")
+    parser.add_argument("--response-cache-size", type=int, default=caching.DEFAULT_RESPONSE_CACHE_SIZE, help="Max cached get_* responses, 0 to disable")
+    parser.add_argument("--circle-cache-size", type=int, default=caching.DEFAULT_CIRCLE_CACHE_SIZE, help="Max cached datespot search circles, 0 to disable")
+    parser.add_argument("--feed-refill-interval", type=float, default=DEFAULT_FEED_REFILL_INTERVAL, help="Seconds between idle-time candidate feed refills, 0 to disable")
+    parser.add_argument("--midpoint-refresh-interval", type=float, default=DEFAULT_MIDPOINT_REFRESH_INTERVAL, help="Seconds between idle-time match midpoint recomputations, 0 to disable")
+    parser.add_argument("--ready-file", help="Path of a file to create once the server is warmed up and listening")
+    parser.add_argument("--transport", choices=["fifo", "shm"], default="fifo", help="Named pipes, or a shared-memory channel (x86 only)")
+    parser.add_argument("--shm-channel", default=shm_transport.DEFAULT_CHANNEL_NAME, help="Name of the shared-memory channel to create")
+    args = parser.parse_args()
+    server = DatabaseServer(stats_file=args.stats_file, stats_interval=args.stats_interval, response_cache_size=args.response_cache_size,
+                            ready_file=args.ready_file, circle_cache_size=args.circle_cache_size, feed_refill_interval=args.feed_refill_interval,
+                            midpoint_refresh_interval=args.midpoint_refresh_interval)
+    if args.transport == "shm":
+        server.run_shm_listener(args.shm_channel)
+    else:
+        server.run_listener()
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+On-disk tiles of datespot locations, for radius queries that only touch the neighborhoods they cover.
+
+An offline build groups the stored datespots into fixed latitude-longitude tiles and writes each tile as its own
+.npy file of (lat, lon, datespot_id) records, plus a manifest. A query memory-maps only the tiles that its circle's
+bounding box intersects. Cold-start time and resident memory then scale with the area queried rather than with the
+size of the whole datespot store.
+
+Tiles are a snapshot. The manifest records the datafile's stamp as of the build, and a TileStore whose stamp no
+longer matches the datafile is stale, so callers should fall back to the datafile until the tiles are rebuilt.
+
+Example call:
+
+    Build tiles for the mock database, then point the JSON map's "datespot_tiles" key at the output directory:
+        python3 -m datespot_tiles --json-map jsonMapMock.json --out data_mock/datespot_tiles
+"""
+
+import argparse, json, math, os
+from typing import List, Tuple
+
+import numpy as np
+
+import geo_utils
+from project_constants import *
+
+DEFAULT_TILE_DEGREES = 0.05  # Tile edge length. About 5.5 km north-south, about the size of a metro neighborhood or two.
+MANIFEST_FILENAME = "manifest.json"
+
+
+class TileStore:
+    """Read side of a tile directory. Tiles are memory-mapped the first time a query needs them."""
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        with open(os.path.join(directory, MANIFEST_FILENAME), 'r') as fobj:
+            manifest = json.load(fobj)
+        self._tile_degrees = manifest["tile_degrees"]
+        self._lon_tile_count = math.ceil(360 / self._tile_degrees)
+        self.source_stamp = tuple(manifest["source_stamp"])
+        self._tile_names = set(manifest["tiles"])
+        self._open_tiles = {}  # Keys are tile names, values are memory-mapped record arrays
+
+    @property
+    def open_tile_count(self) -> int:
+        """Number of tiles memory-mapped so far."""
+        return len(self._open_tiles)
+
+    def query_radius(self, location: tuple, radius: float) -> List[Tuple[float, str]]:
+        """
+        Returns the datespots less than radius meters from location.
+
+        Returns:
+            (list[tuple[float, str]]): (distance, datespot_id) tuples sorted from nearest to farthest.
+        """
+        results = []
+        for tile_name in self._covering_tiles(location, radius):
+            records = self._tile(tile_name)
+            indices, distances = geo_utils.query_radius(location, np.column_stack((records["lat"], records["lon"])), radius)
+            results.extend((float(distances[i]), str(records["datespot_id"][indices[i]])) for i in range(len(indices)))
+        results.sort()
+        return results
+
+    ### Private methods ###
+
+    def _tile(self, tile_name: str) -> np.ndarray:
+        if not tile_name in self._open_tiles:
+            self._open_tiles[tile_name] = np.load(os.path.join(self._directory, f"{tile_name}.npy"), mmap_mode='r')
+        return self._open_tiles[tile_name]
+
+    def _covering_tiles(self, location: tuple, radius: float) -> list:
+        """Returns the names of the built tiles that overlap the bounding box of the circle of radius meters around location."""
+        boxes = geo_utils.bounding_box(location, radius)
+        tile_count = sum((max_lat - min_lat) * (max_lon - min_lon) for min_lat, max_lat, min_lon, max_lon in boxes) / self._tile_degrees ** 2
+        if tile_count > len(self._tile_names):  # Cheaper to check every built tile
+            return [tile_name for tile_name in sorted(self._tile_names) if any(self._tile_overlaps(tile_name, box) for box in boxes)]
+        tile_names = set()
+        for min_lat, max_lat, min_lon, max_lon in boxes:
+            for lat_tile in range(math.floor(min_lat / self._tile_degrees), math.floor(max_lat / self._tile_degrees) + 1):
+                for lon_tile in range(math.floor(min_lon / self._tile_degrees), math.floor(max_lon / self._tile_degrees) + 1):
+                    tile_names.add(tile_name_for(lat_tile, lon_tile % self._lon_tile_count))
+        return sorted(tile_names & self._tile_names)
+
+    def _tile_overlaps(self, tile_name: str, box: tuple) -> bool:
+        lat_tile, lon_tile = (int(part) for part in tile_name.split("_"))
+        min_lat, max_lat, min_lon, max_lon = box
+        tile_min_lon = lon_tile * self._tile_degrees
+        if tile_min_lon >= 180:  # Tile numbers count east from 0 degrees, so these are the western hemisphere
+            tile_min_lon -= 360
+        return (lat_tile * self._tile_degrees <= max_lat and (lat_tile + 1) * self._tile_degrees >= min_lat
+                and tile_min_lon <= max_lon and tile_min_lon + self._tile_degrees >= min_lon)
+
+
+def tile_name_for(lat_tile: int, lon_tile: int) -> str:
+    return f"{lat_tile}_{lon_tile}"
+
+def build_tiles(json_map_filename: str, directory: str, tile_degrees: float=DEFAULT_TILE_DEGREES) -> dict:
+    """
+    Writes a tile file for each tile holding at least one stored datespot, and the manifest, replacing any tiles
+    already in directory.
+
+    Args:
+        json_map_filename (str): JSON map naming the datespot datafile to build from.
+        directory (str): Directory to write the tiles to. Created if it doesn't exist.
+        tile_degrees (float): Tile edge length in degrees.
+
+    Returns:
+        (dict): The manifest written.
+    """
+    with open(json_map_filename, 'r') as fobj:
+        datafile = json.load(fobj)["datespot_data"]
+    source_stat = os.stat(datafile)  # Before reading, so a write that lands mid-read makes the tiles stale rather than wrong
+    with open(datafile, 'r') as fobj:
+        datespot_data = json.load(fobj)
+
+    lon_tile_count = math.ceil(360 / tile_degrees)
+    tiles = {}  # Keys are tile names, values are lists of (lat, lon, datespot_id) tuples
+    for datespot_id, data in datespot_data.items():
+        lat, lon = float(data["location"][0]), float(data["location"][1])
+        tile_name = tile_name_for(math.floor(lat / tile_degrees), math.floor(lon / tile_degrees) % lon_tile_count)
+        tiles.setdefault(tile_name, []).append((lat, lon, datespot_id))
+
+    id_length = max((len(datespot_id) for datespot_id in datespot_data), default=1)
+    record_dtype = np.dtype([("lat", "<f8"), ("lon", "<f8"), ("datespot_id", f"<U{id_length}")])
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(directory):  # Clear out the previous build
+        if filename.endswith(".npy") or filename == MANIFEST_FILENAME:
+            os.remove(os.path.join(directory, filename))
+    for tile_name, records in tiles.items():
+        np.save(os.path.join(directory, f"{tile_name}.npy"), np.array(records, dtype=record_dtype))
+
+    manifest = {
+        "tile_degrees": tile_degrees,
+        "source_file": datafile,
+        "source_stamp": [source_stat.st_mtime_ns, source_stat.st_size],
+        "datespot_count": len(datespot_data),
+        "tiles": {tile_name: len(records) for tile_name, records in sorted(tiles.items())}
+    }
+    with open(os.path.join(directory, MANIFEST_FILENAME), 'w') as fobj:  # Last, so a half-built directory has no manifest
+        json.dump(manifest, fobj)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Build on-disk datespot tiles from the stored datespots.")
+    parser.add_argument("--json-map", default=MOCK_JSON_DB_MAP, help="JSON map naming the datespot datafile")
+    parser.add_argument("--out", required=True, help="Directory to write the tiles to, replacing any tiles already there")
+    parser.add_argument("--tile-degrees", type=float, default=DEFAULT_TILE_DEGREES, help="Tile edge length in degrees")
+    args = parser.parse_args()
+    manifest = build_tiles(args.json_map, args.out, args.tile_degrees)
+    print(f"Wrote {len(manifest['tiles'])} tiles holding {manifest['datespot_count']} datespots to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 """Functions for geographical calculations."""
 
-from math import sqrt, radians, cos, sin, asin
+import argparse, json, timeit
+from math import sqrt, radians, degrees, cos, sin, asin, pi
+
+import numpy as np
 
 from project_constants import *
 
@@ -19,7 +22,6 @@ def is_valid_lat_lon(location: tuple) -> bool:
     return (-90 <= lat <= 90) and (-180 <= lon <= 180)
 
 def haversine(location1: tuple, location2: tuple) -> float:
-    # TODO Use numpy if distance computations are intensive enough to become a bottleneck.
     """
     Computes the great circle distance, in meters, between two points represented by latitude-longitude
     coordinate pairs.
@@ -41,6 +43,188 @@ def haversine(location1: tuple, location2: tuple) -> float:
     c = 2 * asin(sqrt(a))  # arcsine * 2 * radius solves for the distance.
     return c * EARTH_RADIUS_KM * 1000  # Convert back to meters.
 
+def equirectangular(location1: tuple, location2: tuple) -> float:
+    """
+    Approximates the great circle distance, in meters, between two points by projecting them onto a flat plane
+    scaled to their mean latitude. Cheaper than haversine() and accurate enough for ranking short distances. See
+    equirectangular_error_bound() for how far off it can be.
+
+    Args:
+        location1 (tuple[float]): Latitude-longitude tuple.
+        location2 (tuple[float]): Second latitude-longitude tuple.
+
+    Returns:
+        (float): Approximate distance in meters between location1 and location2.
+    """
+    lat1, lon1, lat2, lon2 = map(radians, [location1[0], location1[1], location2[0], location2[1]])
+    lon_distance = (lon2 - lon1 + pi) % (2 * pi) - pi  # Shorter way around, so points either side of the antimeridian are close
+    x, y = lon_distance * cos((lat1 + lat2) / 2), lat2 - lat1
+    return sqrt(x * x + y * y) * EARTH_RADIUS_KM * 1000
+
+def equirectangular_one_to_many(location: tuple, locations) -> np.ndarray:
+    """
+    Vectorized equirectangular(). Approximates the distance, in meters, from one point to each of many points.
+
+    Args:
+        location (tuple[float]): Latitude-longitude tuple.
+        locations (array-like): Sequence of latitude-longitude pairs, or an array of shape (n, 2).
+
+    Returns:
+        (np.ndarray): Array of n approximate distances in meters, in the same order as locations.
+    """
+    locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+    lats2 = locations[:, 0]
+    lon_distances = locations[:, 1] - location[1]  # In degrees, converting once at the end
+    if len(lon_distances) and (lon_distances.max() > 180 or lon_distances.min() < -180): # Only wrap when something is the other way around
+        lon_distances = (lon_distances + 180) % 360 - 180
+    x, y = lon_distances * np.cos(np.radians((lats2 + location[0]) * 0.5)), lats2 - location[0]
+    return np.sqrt(x * x + y * y) * (pi / 180 * EARTH_RADIUS_KM * 1000)
+
+def equirectangular_error_bound(distance: float, latitude: float) -> float:
+    """
+    Returns the maximum relative error of equirectangular() versus haversine() for points up to distance meters
+    apart, neither of which is farther from the equator than latitude degrees.
+
+    The error comes from the meridians converging, so it grows with the square of the distance and blows up near
+    the poles: at most (d / R)^2 / (8 cos^2(latitude)), for d the distance and R the Earth's radius. For example,
+    about 3.1e-7 (0.3 mm per km) out to 5 km at 60 degrees latitude, and under 3e-4 out to 5 km at 89 degrees:
+
+        >>> f"{equirectangular_error_bound(5000, 60):.1e}"
+        '3.1e-07'
+        >>> f"{equirectangular_error_bound(5000, 89):.1e}"
+        '2.5e-04'
+
+    Args:
+        distance (float): Distance in meters.
+        latitude (float): Absolute latitude in degrees.
+
+    Returns:
+        (float): Relative error, e.g. 0.001 for up to 0.1%. Infinity at the poles.
+    """
+    cos_latitude = cos(radians(min(abs(latitude), 90.0)))
+    if cos_latitude < 1e-12:
+        return float("inf")
+    angular_distance = distance / (EARTH_RADIUS_KM * 1000)
+    return angular_distance ** 2 / (8 * cos_latitude ** 2)
+
+def haversine_one_to_many(location: tuple, locations) -> np.ndarray:
+    """
+    Computes the great circle distance, in meters, from one point to each of many points. Same formula as haversine().
+
+    Args:
+        location (tuple[float]): Latitude-longitude tuple.
+        locations (array-like): Sequence of latitude-longitude pairs, or an array of shape (n, 2).
+
+    Returns:
+        (np.ndarray): Array of n distances in meters, in the same order as locations.
+    """
+    lat1, lon1 = np.radians(location[0]), np.radians(location[1])
+    lats2, lons2 = _radians_columns(locations)
+    return _haversine_radians(lat1, lon1, lats2, lons2)
+
+def haversine_matrix(locations1, locations2) -> np.ndarray:
+    """
+    Computes the great circle distance, in meters, between every point in locations1 and every point in locations2.
+
+    Args:
+        locations1 (array-like): n latitude-longitude pairs.
+        locations2 (array-like): m latitude-longitude pairs.
+
+    Returns:
+        (np.ndarray): Array of shape (n, m) such that element [i][j] is the distance from locations1[i] to locations2[j].
+    """
+    lats1, lons1 = _radians_columns(locations1)
+    lats2, lons2 = _radians_columns(locations2)
+    return _haversine_radians(lats1[:, np.newaxis], lons1[:, np.newaxis], lats2[np.newaxis, :], lons2[np.newaxis, :])
+
+def indices_within_radius(location: tuple, locations, radius: float) -> np.ndarray:
+    """
+    Returns the indices of the points in locations less than radius meters from location, in ascending index order.
+
+    Args:
+        location (tuple[float]): Latitude-longitude tuple.
+        locations (array-like): Sequence of latitude-longitude pairs, or an array of shape (n, 2).
+        radius (float): Radius in meters.
+    """
+    return np.sort(query_radius(location, locations, radius)[0])
+
+def query_radius(location: tuple, locations, radius: float, equirectangular_below: float=EQUIRECTANGULAR_MAX_RADIUS) -> tuple:
+    """
+    Finds the points in locations less than radius meters from location. Points outside the circle's bounding box
+    are rejected with plain comparisons, and only the rest go through a distance formula.
+
+    For radii under equirectangular_below, that's the equirectangular approximation. Which points are within the
+    radius is still exact: the few whose approximate distance is within the error bound of the radius get their
+    haversine distance checked. The distances returned are approximate, to within equirectangular_error_bound().
+
+    Args:
+        location (tuple[float]): Latitude-longitude tuple.
+        locations (array-like): Sequence of latitude-longitude pairs, or an array of shape (n, 2).
+        radius (float): Radius in meters.
+        equirectangular_below (float): Radius in meters under which to approximate. 0 always uses haversine.
+
+    Returns:
+        (tuple[np.ndarray, np.ndarray]): Indices into locations of the points within the radius, and their distances
+            in meters, both sorted from nearest to farthest.
+    """
+    locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+    boxes = bounding_box(location, radius)
+    candidates = np.flatnonzero(in_bounding_boxes(locations, boxes))
+    max_latitude = max(max(abs(box[0]), abs(box[1])) for box in boxes)
+    relative_error = equirectangular_error_bound(radius, max_latitude) if radius < equirectangular_below else float("inf")
+    if relative_error < 0.01:
+        distances = equirectangular_one_to_many(location, locations[candidates])
+        borderline = np.flatnonzero(np.abs(distances - radius) <= radius * relative_error)
+        within = distances < radius
+        if len(borderline): # Too close to the edge to call with the approximation
+            within[borderline] = haversine_one_to_many(location, locations[candidates[borderline]]) < radius
+    else:
+        distances = haversine_one_to_many(location, locations[candidates])
+        within = distances < radius
+    candidates, distances = candidates[within], distances[within]
+    order = np.argsort(distances, kind="stable")
+    return candidates[order], distances[order]
+
+def bounding_box(location: tuple, radius: float) -> list:
+    """
+    Computes latitude-longitude boxes that together contain every point less than radius meters from location.
+
+    Args:
+        location (tuple[float]): Latitude-longitude tuple.
+        radius (float): Radius in meters.
+
+    Returns:
+        (list[tuple[float]]): (min_lat, max_lat, min_lon, max_lon) boxes, in degrees. Two boxes if the circle crosses
+            the antimeridian, one on each side of it. A single box spanning every longitude if the circle contains a pole.
+    """
+    angular_radius = radius / (EARTH_RADIUS_KM * 1000)
+    lat_degrees = degrees(angular_radius)
+    min_lat, max_lat = location[0] - lat_degrees, location[0] + lat_degrees
+    if min_lat <= -90 or max_lat >= 90: # Circle contains a pole
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+    lon_degrees = degrees(asin(min(1.0, sin(angular_radius) / cos(radians(location[0]))))) # Exact half-width of a spherical cap
+    min_lon, max_lon = location[1] - lon_degrees, location[1] + lon_degrees
+    if min_lon < -180:
+        return [(min_lat, max_lat, min_lon + 360, 180.0), (min_lat, max_lat, -180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, max_lat, min_lon, 180.0), (min_lat, max_lat, -180.0, max_lon - 360)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+def in_bounding_boxes(locations, boxes: list) -> np.ndarray:
+    """
+    Returns a boolean array that's True for each location inside any of boxes.
+
+    Args:
+        locations (array-like): Sequence of latitude-longitude pairs, or an array of shape (n, 2).
+        boxes (list[tuple[float]]): (min_lat, max_lat, min_lon, max_lon) boxes as returned by bounding_box().
+    """
+    locations = np.asarray(locations, dtype=float).reshape(-1, 2)
+    lats, lons = locations[:, 0], locations[:, 1]
+    inside = np.zeros(len(locations), dtype=bool)
+    for min_lat, max_lat, min_lon, max_lon in boxes:
+        inside |= (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+    return inside
+
 def midpoint(location1: tuple, location2: tuple) -> tuple:
     """
     Computes the midpoint between two points represented by latitude-longitude coordinate pairs,
@@ -56,4 +240,75 @@ def midpoint(location1: tuple, location2: tuple) -> tuple:
             tuple[1] its longitude.
     """
     lat1, lon1, lat2, lon2 = location1[0], location1[1], location2[0], location2[1]
-    return ((lat1 + lat2) / 2, (lon1 + lon2) / 2)
\ No newline at end of file
+    return ((lat1 + lat2) / 2, (lon1 + lon2) / 2)
+
+def midpoints(locations1, locations2) -> np.ndarray:
+    """
+    Computes the midpoint between each pair of points locations1[i] and locations2[i]. Same formula as midpoint().
+
+    Args:
+        locations1 (array-like): n latitude-longitude pairs.
+        locations2 (array-like): n latitude-longitude pairs.
+
+    Returns:
+        (np.ndarray): Array of shape (n, 2) such that row i is the midpoint of locations1[i] and locations2[i].
+    """
+    locations1 = np.asarray(locations1, dtype=float).reshape(-1, 2)
+    locations2 = np.asarray(locations2, dtype=float).reshape(-1, 2)
+    return (locations1 + locations2) / 2
+
+def haversine_pairwise(locations1, locations2) -> np.ndarray:
+    """
+    Computes the great circle distance, in meters, between each pair of points locations1[i] and locations2[i].
+
+    Args:
+        locations1 (array-like): n latitude-longitude pairs.
+        locations2 (array-like): n latitude-longitude pairs.
+
+    Returns:
+        (np.ndarray): Array of n distances in meters.
+    """
+    lats1, lons1 = _radians_columns(locations1)
+    lats2, lons2 = _radians_columns(locations2)
+    return _haversine_radians(lats1, lons1, lats2, lons2)
+
+def _radians_columns(locations) -> tuple:
+    """Returns arrays of the latitudes and the longitudes in locations, converted to radians."""
+    locations = np.asarray(locations, dtype=float).reshape(-1, 2)  # Reshape so an empty sequence is a (0, 2) array
+    return np.radians(locations[:, 0]), np.radians(locations[:, 1])
+
+def _haversine_radians(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorized haversine formula on broadcastable arrays of coordinates in radians. Returns meters."""
+    lon_distance, lat_distance = lon2 - lon1, lat2 - lat1
+    a = np.sin(lat_distance/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(lon_distance/2)**2
+    c = 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))  # Rounding can push a just past 1 for antipodal points
+    return c * EARTH_RADIUS_KM * 1000
+
+def benchmark(point_count: int=100000, radius: float=2000, repeats: int=20) -> dict:
+    """
+    Returns the mean time in milliseconds for haversine and equirectangular distances from one point to point_count
+    points, and for query_radius() with and without the approximation. The points are scattered over the query
+    circle's bounding box, so nearly all of them get past the bounding-box prefilter.
+    """
+    rng = np.random.default_rng(1)
+    location = (40.7, -74.0)
+    degrees_spread = radius / (EARTH_RADIUS_KM * 1000) * 180 / pi
+    locations = np.column_stack((location[0] + rng.uniform(-degrees_spread, degrees_spread, point_count),
+                                location[1] + rng.uniform(-degrees_spread, degrees_spread, point_count)))
+    timings = {
+        "haversine_one_to_many": lambda: haversine_one_to_many(location, locations),
+        "equirectangular_one_to_many": lambda: equirectangular_one_to_many(location, locations),
+        "query_radius_haversine": lambda: query_radius(location, locations, radius, equirectangular_below=0),
+        "query_radius_equirectangular": lambda: query_radius(location, locations, radius, equirectangular_below=float("inf"))
+    }
+    return {name: round(timeit.timeit(function, number=repeats) / repeats * 1000, 3) for name, function in timings.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the speed of the haversine and equirectangular distance functions.")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--radius", type=float, default=2000, help="Query radius in meters")
+    args = parser.parse_args()
+    print(json.dumps({"points": args.points, "radius": args.radius, "mean_ms": benchmark(args.points, args.radius)}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Load generator for the database server. Replays a JSONL request log, or a synthetic mix of requests, against a
+DatabaseServer and reports throughput, latency percentiles, and error rates.
+
+Example calls:
+
+    Replay a log through the named pipes, with the server already running in another process:
+        python3 -m load_generator --log request_log.jsonl --transport fifo --concurrency 8 --rate 100
+
+    Drive an in-process server with 1000 synthetic requests as fast as it will take them:
+        python3 -m load_generator --synthetic 1000 --transport inprocess
+
+    Drive a server started with --transport shm through its shared-memory channel, to compare against the pipes:
+        python3 -m load_generator --synthetic 1000 --transport shm --concurrency 8
+
+Request log lines are either full request envelopes ({"body_json": {...}, ...}) or bare request bodies
+({"method": ..., "query_data": ...}), which get wrapped in an envelope.
+
+Latency is measured from each request's scheduled send time, not its actual send time, so a backed-up server
+can't hide its queueing delay by slowing down the generator ("coordinated omission").
+
+The fifo and shm transports stand in for the Node web server, so don't run both against the same pipes or channel at once.
+"""
+
+import argparse, collections, itertools, json, os, random, threading, time
+from typing import List
+
+from database_server import DatabaseServer, FIFO_WEB_TO_DB, FIFO_DB_TO_WEB, find_json_frame_end
+import shm_transport
+from server_stats import LatencyHistogram
+from project_constants import *
+
+DEFAULT_SYNTHETIC_MIX = {  # Relative weights of each method in synthetic load
+    "get_login_user_info": 3,
+    "get_next_candidate": 3,
+    "get_matches_list": 2,
+    "get_suggestions_list": 1
+}
+
+FIFO_CONNECT_TIMEOUT = 30  # Seconds to wait for the server to create its inbound pipe or shared-memory channel
+SHM_READ_POLL = 0.1  # Max seconds the shared-memory reader thread waits between checks for the transport being closed
+RESPONSE_TIMEOUT = 30  # Seconds to wait for any one response
+
+
+class InProcessTransport:
+    """
+    Sends requests straight into a DatabaseServer instance in this process, skipping the pipes. Measures the
+    server's own cost, including its admission control, without any IPC.
+    """
+
+    def __init__(self, server: DatabaseServer=None):
+        self._server = server if server else DatabaseServer()
+        self._lock = threading.Lock()  # Neither the server nor the JSON files behind it are safe for concurrent use
+
+    def send(self, request_dict: dict) -> dict:
+        """Returns the decoded response to one request. For a streamed response, that's the final frame."""
+        request_bytes = json.dumps(request_dict).encode("utf-8")
+        with self._lock:
+            self._server._read_buffer += request_bytes
+            shed_responses = self._server._enqueue_requests()
+            responses = shed_responses if shed_responses else list(self._server._process_next_request())
+        return json.loads(responses[-1])
+
+    def close(self) -> None:
+        pass
+
+
+class FifoTransport:
+    """
+    Sends requests through the named pipes to a DatabaseServer running in another process, taking the Node web
+    server's place. Each request is tagged with a request_id so concurrent requests can be matched to their responses.
+    """
+
+    def __init__(self, request_fifo: str=FIFO_WEB_TO_DB, response_fifo: str=FIFO_DB_TO_WEB, timeout: float=RESPONSE_TIMEOUT):
+        self._timeout = timeout
+        connect_deadline = time.time() + FIFO_CONNECT_TIMEOUT
+        while not os.path.exists(request_fifo):  # The server creates the inbound pipe, same as when Node connects
+            if time.time() > connect_deadline:
+                raise TimeoutError(f"Server never created {request_fifo}")
+            time.sleep(0.1)
+        if not os.path.exists(response_fifo):  # The client creates the outbound pipe
+            os.mkfifo(response_fifo)
+        self._response_fd = os.open(response_fifo, os.O_RDWR)  # Read-write so opening doesn't block waiting for the server
+        self._request_fd = os.open(request_fifo, os.O_WRONLY)
+        self._start_reader()
+
+    def _start_reader(self) -> None:
+        """Sets up the request-response matching and starts the reader thread. Call once the transport is connected."""
+        self._request_ids = itertools.count()
+        self._pending = {}  # Keys are request ids, values are [threading.Event, response dict] lists
+        self._reader_error = None  # Set if the response stream became unreadable, which stops the reader
+        self.unmatched_responses = []  # Responses that came back without a request_id, e.g. for a request the server couldn't parse
+        self._write_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader.start()
+
+    def send(self, request_dict: dict) -> dict:
+        """Returns the decoded response to one request. For a streamed response, that's the final frame."""
+        request_id = next(self._request_ids)
+        pending_response = [threading.Event(), None]
+        self._pending[request_id] = pending_response
+        if self._reader_error is not None:  # Checked after registering, so either this or the reader's cleanup catches it
+            self._pending.pop(request_id, None)
+            raise ConnectionError(f"Response stream unreadable: {self._reader_error}") from self._reader_error
+        request_bytes = json.dumps(dict(request_dict, request_id=request_id)).encode("utf-8")
+        with self._write_lock:
+            self._write_request(request_bytes)
+        if not pending_response[0].wait(self._timeout):
+            self._pending.pop(request_id, None) # The reader may have just popped it, if the response landed right after the timeout
+            raise TimeoutError(f"No response to request {request_id}")
+        if pending_response[1] is None:  # Woken by the reader failing rather than by a response
+            raise ConnectionError(f"Response stream unreadable: {self._reader_error}") from self._reader_error
+        return pending_response[1]
+
+    def close(self) -> None:
+        os.close(self._request_fd)
+        os.close(self._response_fd)
+
+    def _write_request(self, request_bytes: bytes) -> None:
+        while request_bytes:  # Writes bigger than the pipe buffer can be partial
+            request_bytes = request_bytes[os.write(self._request_fd, request_bytes):]
+
+    def _read_chunk(self) -> bytes:
+        """Blocks until some response bytes arrive, and returns them. Returns b"" once the transport is closed."""
+        try:
+            return os.read(self._response_fd, 65536)
+        except OSError:  # Pipe closed
+            return b""
+
+    def _read_responses(self) -> None:
+        """Reader thread. Splits the response stream into frames and hands each one to the request waiting on it."""
+        buffer = b""
+        while True:
+            chunk = self._read_chunk()
+            if not chunk:
+                return
+            buffer += chunk
+            try:
+                response_dicts, buffer = split_json_frames(buffer)
+            except ValueError as e:  # Malformed frame. Can't tell where the next one starts, so give up on the stream.
+                self._fail_pending(e)
+                return
+            for response_dict in response_dicts:
+                if response_dict.get("final") is False: # Wait for the end of a streamed response
+                    continue
+                if not "request_id" in response_dict:
+                    self.unmatched_responses.append(response_dict)
+                    continue
+                pending_response = self._pending.pop(response_dict["request_id"], None)
+                if pending_response:
+                    pending_response[1] = response_dict
+                    pending_response[0].set()
+
+    def _fail_pending(self, error: Exception) -> None:
+        """Wakes every request still waiting on a response, so they raise error's ConnectionError instead of timing out."""
+        self._reader_error = error
+        for request_id in list(self._pending):
+            pending_response = self._pending.pop(request_id, None)
+            if pending_response:
+                pending_response[0].set()
+
+
+class ShmTransport(FifoTransport):
+    """
+    Sends requests through a shared-memory channel to a DatabaseServer running in another process with --transport shm.
+    Matches responses to requests the same way FifoTransport does.
+    """
+
+    def __init__(self, channel_name: str=shm_transport.DEFAULT_CHANNEL_NAME, timeout: float=RESPONSE_TIMEOUT):
+        self._timeout = timeout
+        connect_deadline = time.time() + FIFO_CONNECT_TIMEOUT
+        while True:  # The server creates the channel
+            try:
+                self._channel = shm_transport.ShmChannel(channel_name)
+                break
+            except FileNotFoundError:
+                if time.time() > connect_deadline:
+                    raise TimeoutError(f"Server never created shared-memory channel {channel_name}")
+                time.sleep(0.1)
+        self._closed = threading.Event()
+        self._start_reader()
+
+    def close(self) -> None:
+        self._closed.set()
+        self._reader.join()  # Before unmapping the buffers it reads from
+        self._channel.close()
+
+    def _write_request(self, request_bytes: bytes) -> None:
+        self._channel.requests.write_all(request_bytes)
+
+    def _read_chunk(self) -> bytes:
+        while not self._closed.is_set():
+            if self._channel.responses.wait_readable(SHM_READ_POLL):
+                return self._channel.responses.read()
+        return b""
+
+
+def split_json_frames(buffer: bytes) -> tuple:
+    """
+    Splits the complete JSON frames off the front of buffer.
+
+    Returns:
+        (tuple[list[dict], bytes]): The decoded frames, and the bytes left over after the last complete frame.
+    """
+    frames = []
+    while True:
+        try:
+            text = buffer.decode("utf-8")
+        except UnicodeDecodeError as e:  # Buffer may end partway through a multi-byte character
+            text = buffer[:e.start].decode("utf-8")
+        frame_start = len(text) - len(text.lstrip())
+        if frame_start == len(text):
+            return frames, buffer[len(text.encode("utf-8")):] if text else buffer
+        frame_end = find_json_frame_end(text, frame_start)
+        if frame_end is None:
+            return frames, buffer
+        frames.append(json.loads(text[frame_start:frame_end]))
+        buffer = buffer[len(text[:frame_end].encode("utf-8")):]
+
+
+def load_request_log(filename: str) -> List[dict]:
+    """
+    Reads a JSONL request log and returns a list of request envelopes.
+    """
+    requests = []
+    with open(filename, 'r') as fobj:
+        for line in fobj:
+            if not line.strip():
+                continue
+            request_dict = json.loads(line)
+            if not "body_json" in request_dict:  # Bare request body
+                request_dict = {"body_json": request_dict}
+            requests.append(request_dict)
+    return requests
+
+
+def synthetic_requests(count: int, json_map_filename: str=MOCK_JSON_DB_MAP, mix: dict=DEFAULT_SYNTHETIC_MIX, seed: int=1) -> List[dict]:
+    """
+    Returns count request envelopes drawn from mix, with ids of the users and matches stored under json_map_filename.
+
+    Args:
+        count (int): Number of requests.
+        json_map_filename (str): JSON map naming the stored data files to pick ids from.
+        mix (dict): Keys are method names, values are relative weights.
+        seed (int): Random seed, so that runs are repeatable.
+    """
+    with open(json_map_filename, 'r') as fobj:
+        json_map = json.load(fobj)
+    with open(json_map["user_data"], 'r') as fobj:
+        user_ids = list(json.load(fobj))
+    with open(json_map["match_data"], 'r') as fobj:
+        match_ids = list(json.load(fobj))
+
+    mix = dict(mix)
+    if not match_ids:  # Can't ask for suggestions without a match
+        mix.pop("get_suggestions_list", None)
+    if not user_ids:
+        raise ValueError(f"No users stored under {json_map_filename}")
+
+    rng = random.Random(seed)
+    methods, weights = list(mix), list(mix.values())
+    requests = []
+    for method in rng.choices(methods, weights=weights, k=count):
+        if method == "get_suggestions_list":
+            query_data = {"match_id": rng.choice(match_ids)}
+        else:
+            query_data = {"user_id": rng.choice(user_ids)}
+        requests.append({"body_json": {"method": method, "query_data": query_data}})
+    return requests
+
+
+def run_load(transport, requests: List[dict], concurrency: int=1, rate: float=None, deadline_ms: float=None) -> dict:
+    """
+    Sends every request through transport and returns a report of the results.
+
+    Args:
+        transport: InProcessTransport, FifoTransport, or ShmTransport.
+        requests (list[dict]): Request envelopes, sent in order.
+        concurrency (int): Number of requests allowed in flight at once.
+        rate (float): Target requests per second. None sends each request as soon as a worker is free.
+        deadline_ms (float): If provided, give each request a deadline this many milliseconds after it's sent.
+
+    Returns:
+        (dict): Request count, duration, throughput, latency percentiles in milliseconds, response count for each
+            status code, and the fraction of responses that weren't status 0. Responses that came back without a
+            request_id are counted as errors under "unmatched response", on top of the request they answered, which
+            can only time out.
+    """
+    histogram = LatencyHistogram()
+    status_counts = collections.Counter()
+    results_lock = threading.Lock()
+    request_indices = itertools.count()
+    start_time = time.perf_counter()
+
+    def worker():
+        while True:
+            i = next(request_indices)
+            if i >= len(requests):
+                return
+            scheduled_time = start_time + i / rate if rate else time.perf_counter()
+            delay = scheduled_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            request_dict = requests[i]
+            if deadline_ms:
+                request_dict = dict(request_dict, deadline=time.time() + deadline_ms / 1000)
+            try:
+                status = transport.send(request_dict).get("status_code")
+            except Exception as e:
+                status = f"transport error: {type(e).__name__}"
+            latency = time.perf_counter() - scheduled_time
+            with results_lock:
+                histogram.record(latency)
+                status_counts[str(status)] += 1
+
+    workers = [threading.Thread(target=worker) for i in range(concurrency)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    duration = time.perf_counter() - start_time
+    unmatched_responses = getattr(transport, "unmatched_responses", [])
+    if unmatched_responses:
+        status_counts["unmatched response"] += len(unmatched_responses)
+
+    errors = sum(count for status, count in status_counts.items() if status != "0")
+    return {
+        "requests": len(requests),
+        "duration_seconds": round(duration, 3),
+        "throughput_rps": round(len(requests) / duration, 2) if duration else 0.0,
+        "latency_ms": histogram.summary(),
+        "status_counts": dict(sorted(status_counts.items())),
+        "error_rate": round(errors / sum(status_counts.values()), 4) if requests else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay or synthesize load against the database server.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--log", help="JSONL file of requests to replay")
+    source.add_argument("--synthetic", type=int, metavar="COUNT", help="Number of synthetic requests to generate")
+    parser.add_argument("--transport", choices=["fifo", "shm", "inprocess"], default="fifo")
+    parser.add_argument("--shm-channel", default=shm_transport.DEFAULT_CHANNEL_NAME, help="Name of the server's shared-memory channel, for --transport shm")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight at once")
+    parser.add_argument("--rate", type=float, help="Target requests per second; omit to send as fast as possible")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to replay the request list")
+    parser.add_argument("--deadline-ms", type=float, help="Give each request a deadline this many milliseconds after sending")
+    parser.add_argument("--json-map", default=MOCK_JSON_DB_MAP, help="JSON map to draw synthetic user and match ids from")
+    args = parser.parse_args()
+
+    if args.log:
+        requests = load_request_log(args.log)
+    else:
+        requests = synthetic_requests(args.synthetic, json_map_filename=args.json_map)
+    requests = requests * args.repeat
+
+    if args.transport == "fifo":
+        transport = FifoTransport()
+    elif args.transport == "shm":
+        transport = ShmTransport(args.shm_channel)
+    else:
+        transport = InProcessTransport()
+    try:
+        report = run_load(transport, requests, concurrency=args.concurrency, rate=args.rate, deadline_ms=args.deadline_ms)
+    finally:
+        transport.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
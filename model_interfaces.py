@@ -1,23 +1,31 @@
 """Objects for interfacing between stored data and model-object instances."""
-import abc, json, uuid, time, math
+import abc, json, uuid, time, math, os
   # TODO Can't assume this will run on a system with sub-second timestamp precision. time.time() only guarantees non-decreasing values; it can't
                                 #   return more precise timestamps than the underlying system clock supports. https://docs.python.org/3/library/time.html#time.time
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
+
 
 import models
 import geo_utils
+import spatial_index
+import datespot_tiles
+import taste_vectors
 
 from project_constants import *
 
 class ModelInterfaceABC: # Abstract base class
     __metaclasss__ = abc.ABCMeta
 
+    _spatial_indexes = {} # Shared by every model interface in the process. Keys are datafile paths, values are dicts mapping index classes to instances.
+    _spatially_indexed = False # Subclasses that set this True must implement _indexed_location()
+
     @abc.abstractmethod
     def __init__(self, json_map_filename=MOCK_JSON_DB_MAP):
         self._master_datafile = json_map_filename
         self._datafile = None
         self._data = {}
         self.data = self._data #  todo what about assigning this to return of _read_json, and having that method return self._data?
+        self._read_stamp = None # Datafile stamp as of the last read or write, see _file_stamp()
 
     ### Public methods ###
     
@@ -39,20 +47,89 @@ class ModelInterfaceABC: # Abstract base class
         if not self._datafile:
             self._set_datafile()
         json_data = {}
+        self._read_stamp = self._file_stamp() # Before reading, so a write that lands mid-read makes the stamp stale rather than wrong
         with open(self._datafile, 'r') as fobj: # todo there's a way to get the keys to parse to native ints in one pass--consult docs.
             json_data = json.load(fobj)
             fobj.seek(0)
         for key in json_data:
             self._data[key] = json_data[key]
 
-    def _write_json(self):
-        """Overwrite stored JSON for this model to exactly match current state of the API instance's native Python dictionary."""
+    def _write_json(self, changed_ids: list=None):
+        """
+        Overwrite stored JSON for this model to exactly match current state of the API instance's native Python dictionary.
+
+        Args:
+            changed_ids (list[str]): Ids of the objects created, changed, or deleted since the last read, so the spatial
+                index can be updated in place. None means unknown, and the index gets rebuilt on its next use.
+        """
         # Todo: Any safeguards that make sense to reduce risk of accidentally overwriting good data?
         if not self._datafile:
             self._set_datafile()
         with open(self._datafile, 'w') as fobj:
             json.dump(self._data, fobj)
             fobj.seek(0)
+        if self._spatially_indexed:
+            self._update_spatial_index(changed_ids)
+        self._read_stamp = self._file_stamp()
+
+    def _file_stamp(self) -> tuple:
+        """
+        Returns the datafile's (modification time in ns, size in bytes), which changes whenever the file is rewritten.
+        Writes made through a model interface in this process keep the spatial index current directly. The stamp only
+        needs to catch writes from elsewhere, and could miss a same-size rewrite within one tick of the filesystem clock.
+        """
+        file_stat = os.stat(self._datafile)
+        return (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def _spatial_index(self, index_class=spatial_index.GeoGridIndex):
+        """
+        Returns the process-wide spatial index of type index_class over this model's stored objects, first rebuilding it
+        from the datafile if the file changed since the index was last brought up to date.
+
+        Args:
+            index_class: spatial_index.GeoGridIndex or spatial_index.UnitVectorKDTree.
+        """
+        if not self._datafile:
+            self._set_datafile()
+        datafile_indexes = ModelInterfaceABC._spatial_indexes.setdefault(self._datafile, {})
+        index = datafile_indexes.get(index_class)
+        if index is None or index.stamp != self._file_stamp():
+            self._data.clear() # _read_json() merges into what's already here, which could include objects since deleted from the file
+            self._read_json()
+            index = index_class()
+            for object_id, object_data in self._data.items():
+                self._index_object(index, object_id, object_data)
+            if hasattr(index, "rebuild"):
+                index.rebuild()
+            index.stamp = self._read_stamp
+            datafile_indexes[index_class] = index
+        return index
+
+    def _update_spatial_index(self, changed_ids: list) -> None:
+        """
+        Applies a write of changed_ids to each spatial index over this datafile that was up to date as of this
+        instance's last read. Drops the others, to be rebuilt on their next use.
+        """
+        datafile_indexes = ModelInterfaceABC._spatial_indexes.get(self._datafile, {})
+        new_stamp = self._file_stamp()
+        for index_class, index in list(datafile_indexes.items()):
+            if changed_ids is None or self._read_stamp is None or index.stamp != self._read_stamp:
+                del datafile_indexes[index_class]
+                continue
+            for object_id in changed_ids:
+                if object_id in self._data:
+                    self._index_object(index, object_id, self._data[object_id])
+                else:
+                    index.remove(object_id)
+            index.stamp = new_stamp
+
+    def _indexed_location(self, object_data: dict) -> tuple:
+        """Returns the (lat, lon) location to spatially index a stored object under."""
+        raise NotImplementedError
+
+    def _index_object(self, index, object_id: str, object_data: dict) -> None:
+        """Adds a stored object to index, or moves it there. Override for index classes that key on more than location."""
+        index.insert(object_id, self._indexed_location(object_data))
     
     def _validate_object_id(self, object_id: str) -> None:
         """
@@ -96,17 +173,19 @@ class ModelInterfaceABC: # Abstract base class
         """
         self._read_json()
         self._data[object.id] = object.serialize()
-        self._write_json()
+        self._write_json(changed_ids=[object.id])
     
     def delete(self, object_id: int) -> None:
         """Delete the data for key object_id."""
         self._read_json()
         self._validate_object_id(object_id)
         del self._data[object_id]
-        self._write_json()
+        self._write_json(changed_ids=[object_id])
 
 class UserModelInterface(ModelInterfaceABC):
 
+    _spatially_indexed = True
+
     def __init__(self, json_map_filename=None):
         self._model = "user"  # Initialization order matters e.g. if defining self.data to init to the read-in json.
         if json_map_filename:
@@ -124,6 +203,8 @@ class UserModelInterface(ModelInterfaceABC):
             "matches", 
             "pending_likes", 
             "match_blacklist",
+            "exclusions",
+            "liked_by",
             "force_key"
         }
 
@@ -180,7 +261,7 @@ class UserModelInterface(ModelInterfaceABC):
         #   Rationale is that any tastes data comes in later, not at the moment the user is created in the DB for the first time.
 
         self._data[new_user.id] = new_user.serialize()
-        self._write_json()
+        self._write_json(changed_ids=[new_user.id])
         return new_user.id
 
     def _instantiate_obj_from_dict(self, obj_data: dict) -> models.User:
@@ -217,7 +298,8 @@ class UserModelInterface(ModelInterfaceABC):
         candidates = []
         if "candidates" in user_data and len(user_data["candidates"]) > 0:
             for candidate_id in user_data["candidates"]:
-                candidates.append(self._lookup_candidate_obj(candidate_id))
+                self._validate_object_id(candidate_id)
+                candidates.append(self._candidate_obj_from_data(candidate_id, self._data[candidate_id])) # Already read, no need to re-read per candidate
 
         user_obj = models.User(
             user_id = user_id,
@@ -230,13 +312,9 @@ class UserModelInterface(ModelInterfaceABC):
             matches = user_data["matches"],
             pending_likes = user_data["pending_likes"],
             match_blacklist = user_data["match_blacklist"],
-        )
-        if not len(user_obj.candidates) > 0: # TODO SRP. This shouldn't be responsible for refreshing candidates, its only job should be converting the stored data into an object instance
-            nearby_candidate_query_results = self.query_users_currently_near_location(user_obj.predominant_location)
-            for result in nearby_candidate_query_results[::-1]:  # Iterate backward, because query results are sorted by descending distance from user
-                assert isinstance(result[1], models.Candidate)
-                user_obj.candidates.append(result[1])  # Second element of the result tuple is the user id
-
+            exclusions = user_data.get("exclusions"), # Users stored before exclusions existed get them built from their decisions
+            liked_by = self._liked_by(user_id),
+        )  # Candidates are whatever the stored feed holds. Refilling the feed is refill_candidate_feeds' job, not this method's.
         return user_obj
     
     def _lookup_candidate_obj(self, candidate_id: str) -> models.Candidate:
@@ -245,7 +323,12 @@ class UserModelInterface(ModelInterfaceABC):
         """
         self._read_json() #  The relevant data is the wider User data
         self._validate_object_id(candidate_id)
-        candidate_data = self._data[candidate_id]
+        return self._candidate_obj_from_data(candidate_id, self._data[candidate_id])
+
+    def _candidate_obj_from_data(self, candidate_id: str, candidate_data: dict) -> models.Candidate:
+        """
+        Instantiates a Candidate helper-object from that user's stored data, without reading the datafile.
+        """
         return models.Candidate(
             user_id=candidate_id,
             name=candidate_data["name"],
@@ -288,8 +371,10 @@ class UserModelInterface(ModelInterfaceABC):
         for key in new_data: # todo best practice on type() vs isinstance?
             entry_type = type(user_data[key])
             entry = user_data[key]
-            if key == "current_location": # todo location still parses as list, so make sure to overwrite, not append
-                self._data[user_id]["current_location"] = new_data[key]
+            if key in ("current_location", "predominant_location"): # todo location still parses as list, so make sure to overwrite, not append
+                self._data[user_id][key] = new_data[key]
+                if key == "predominant_location": # The queued candidates were chosen for the old neighborhood
+                    self._data[user_id]["candidates"] = []
             elif key == "tastes":
                 new_tastes_data = new_data[key]
                 self._update_tastes(user_id, new_tastes_data)
@@ -297,29 +382,27 @@ class UserModelInterface(ModelInterfaceABC):
                 self._data[user_id][key].extend(new_data[key])
             else:
                 self._data[user_id][key] = new_data[key]
-        self._write_json()
+        self._write_json(changed_ids=[user_id]) # Moves the user in the spatial index if current_location or predominant_location changed
         return
 
     
     # todo all the "query objects near" methods could probably be abstracted to the ABC.
-    def query_users_currently_near_location(self, location: tuple, radius=50000) -> List[models.Candidate]: # todo is the radius parameter totally unnecessary? 
+    def query_users_currently_near_location(self, location: tuple, radius=50000, exclusions: List[str]=None) -> List[models.Candidate]: # todo is the radius parameter totally unnecessary? 
         """
         Return list of Candidate objects whose current location is within radius meters of location.
+
+        Args:
+            exclusions (list[str]): Sorted list of user ids to leave out of the results, as stored in a user's "exclusions" field.
         """
         # Defaults to a very high radius, expectation is that radius won't be specified in most queries.
 
         if (not location) or (not geo_utils.is_valid_lat_lon(location)): # todo best architectural place for validating this?
             raise ValueError(f"Bad lat lon location: {location}\n\ttype = {type(location)}")
-        self._read_json()
-        query_results = []
-        for user_id in self._data:
-            candidate = self._lookup_candidate_obj(user_id)
-            user_location = candidate.predominant_location
-            assert isinstance(user_location[0], float), f"user_location = {user_location}"
-            distance = geo_utils.haversine(location, user_location)
-            if distance < radius:
-                query_results.append((distance, candidate)) # todo no need to put the whole dict into the results, right?
-        query_results.sort()
+        index = self._spatial_index()
+        if self._read_stamp != index.stamp: # Index was already up to date, but this instance's copy of the data might not be
+            self._read_json()
+        query_results = [(distance, self._candidate_obj_from_data(user_id, self._data[user_id])) for distance, user_id in index.query_radius(location, radius)
+                            if not (exclusions and models.user.exclusions_contain(exclusions, user_id))] # todo no need to put the whole dict into the results, right?
         query_results.reverse() # Put nearest candidate at end, for performant pop() calls. 
         return query_results
            
@@ -327,12 +410,10 @@ class UserModelInterface(ModelInterfaceABC):
         """Return the list of users near this user and cache that list of candidates in this user's data."""
         self._read_json()
         query_location = self._data[user_id]["current_location"]
-        query_results = self.query_users_currently_near_location(tuple(query_location))
-        if query_results[-1] == user_id: # Don't include the user in that user's results
-            query_results.pop()
+        query_results = self.query_users_currently_near_location(tuple(query_location), exclusions=self._exclusions(user_id)) # Leaves out the user themself, too
         
         self._data[user_id]["cached_candidates"] = query_results # Fully overwrite to latest and greatest, even the cache already existed:
-        self._write_json()
+        self._write_json(changed_ids=[user_id])
 
         return query_results
     
@@ -346,11 +427,81 @@ class UserModelInterface(ModelInterfaceABC):
         Returns:
             (str): User ID string of the next candidate
         """
+        self._validate_object_id(user_id) # Reads the datafile
+        feed = self._data[user_id]["candidates"]
+        stale_count = 0
+        exclusions = self._exclusions(user_id)
+        while stale_count < len(feed) and (models.user.exclusions_contain(exclusions, feed[stale_count]) or not feed[stale_count] in self._data): # Skip users decided on or deleted since the last refill
+            stale_count += 1
+        if stale_count:
+            del feed[:stale_count]
+            self._write_json(changed_ids=[user_id])
+        if not feed: # Cold start. Normally the background refill keeps the feed from running dry.
+            self.refill_candidate_feeds([user_id])
+            feed = self._data[user_id]["candidates"]
+            if not feed:
+                raise ValueError(f"No candidates within {CANDIDATE_FEED_RADIUS} meters of user {user_id}")
+        return feed[0]
+
+    def users_needing_candidates(self, low_water: int=CANDIDATE_FEED_LOW_WATER) -> List[str]:
+        """
+        Returns the ids of the users whose candidate feeds hold fewer than low_water candidates.
+        """
         self._read_json()
-        user_obj = self.lookup_obj(user_id)
-        self._data[user_id] = user_obj.serialize()
-        self._write_json()
-        return user_obj.next_candidate().id  # Model layer handles the queue, blacklisting, etc.
+        return [user_id for user_id, user_data in self._data.items() if len(user_data.get("candidates", [])) < low_water]
+
+    def refill_candidate_feeds(self, user_ids: List[str]=None, feed_size: int=CANDIDATE_FEED_SIZE) -> List[str]:
+        """
+        Batch job. Tops up each user's candidate feed to feed_size ids with the nearest users not already queued or
+        excluded, so that query_next_candidate only ever has to read the head of the feed. Users who already liked the
+        user go first, earliest like first. The rest are the nearest CANDIDATE_RANKING_POOL eligible users, of which the
+        ones whose tastes are most similar to the user's are queued, most similar first and nearest first among equals.
+        Reads and writes the datafile once for the whole batch.
+
+        Args:
+            user_ids (list[str]): Users whose feeds to top up. Defaults to every user below the low-water mark.
+            feed_size (int): Number of candidate ids to fill each feed to.
+
+        Returns:
+            (list[str]): Ids of the users whose feeds gained candidates.
+        """
+        if user_ids is None:
+            user_ids = self.users_needing_candidates()
+        index = self._spatial_index()
+        if self._read_stamp != index.stamp:
+            self._read_json()
+        refilled_ids = []
+        for user_id in user_ids:
+            if not user_id in self._data: # Not _validate_object_id, which re-reads and would discard the feeds filled so far
+                raise KeyError(f"{self._model} with id (key) {user_id} not found.")
+            feed = self._data[user_id].setdefault("candidates", [])
+            exclusions = self._exclusions(user_id)
+            queued = set(feed)
+            added_count = 0
+            for liker_id, like_time in sorted(self._liked_by(user_id).items(), key=lambda item: item[1]):
+                if len(feed) >= feed_size:
+                    break
+                if liker_id in self._data and not (liker_id in queued or models.user.exclusions_contain(exclusions, liker_id)):
+                    feed.append(liker_id)
+                    queued.add(liker_id)
+                    added_count += 1
+            pool = [] # Eligible users, nearest first
+            for distance, candidate_id in index.iter_nearest(self._indexed_location(self._data[user_id])):
+                if len(pool) >= max(CANDIDATE_RANKING_POOL, feed_size - len(feed)) or distance >= CANDIDATE_FEED_RADIUS:
+                    break
+                if not (candidate_id in queued or models.user.exclusions_contain(exclusions, candidate_id)):
+                    pool.append(candidate_id)
+            if pool and len(feed) < feed_size:
+                similarities = taste_vectors.cosine_similarities(taste_vectors.taste_vector(self._data[user_id]["tastes"]),
+                                                                 taste_vectors.taste_matrix([self._data[candidate_id]["tastes"] for candidate_id in pool]))
+                ranked_ids = [pool[i] for i in taste_vectors.top_k(similarities, feed_size - len(feed))]
+                feed.extend(ranked_ids)
+                added_count += len(ranked_ids)
+            if added_count:
+                refilled_ids.append(user_id)
+        if refilled_ids:
+            self._write_json(changed_ids=refilled_ids)
+        return refilled_ids
     
     def render_user(self, user_id: str) -> dict:
         """
@@ -391,30 +542,53 @@ class UserModelInterface(ModelInterfaceABC):
         Returns:
             (list[dict]): List of dictionaries, each of which contains the rendering-relevant info for one match.
         """
+        return list(self.iter_matches_list(user_id))
+
+    def iter_matches_list(self, user_id: str) -> Iterator[dict]:
+        """
+        Generator version of render_matches_list. Yields the rendering-relevant info for one match at a time.
+        """
         self._read_json()
-        renderable_data = []
         user_obj = self.lookup_obj(user_id)
         for match_data in user_obj.match_data:  # Need to convert each user id to a name
-            renderable_match_data = {
+            yield {
                 "match_id": match_data["match_id"],
                 "match_timestamp": match_data["match_timestamp"],
                 "match_partner_info": self.render_candidate(match_data["match_partner_id"])
             }
-            renderable_data.append(renderable_match_data)
-
-        return renderable_data
 
     def add_to_pending_likes(self, user_id_1: int, user_id_2: int):
-        """Add a second user that this user swiped "yes" on to this user's hash map of pending likes."""
+        """
+        Add a second user that this user swiped "yes" on to this user's hash map of pending likes, and this user to the
+        second user's liked-by index. Also queues this user right behind the head of the second user's candidate feed,
+        since a "yes" from the second user would complete a match.
+        """
         self._read_json()
         user_data = self._data[user_id_1]
-        user_data["pending_likes"][user_id_2] = time.time()
-        self._write_json()
+        like_time = time.time()
+        user_data["pending_likes"][user_id_2] = like_time
+        models.user.add_exclusion(self._exclusions(user_id_1), user_id_2)
+        self._drop_from_candidate_feed(user_data, user_id_2)
+        changed_ids = [user_id_1] + self._index_like(user_id_1, user_id_2, like_time) # Backfilling the index can change every user
+        other_feed = self._data[user_id_2].setdefault("candidates", [])
+        if not models.user.exclusions_contain(self._exclusions(user_id_2), user_id_1):
+            if user_id_1 in other_feed[1:]:
+                other_feed.remove(user_id_1)
+            if not other_feed[:1] == [user_id_1]: # Leave the head alone, the other user may be looking at it right now
+                other_feed.insert(1 if other_feed else 0, user_id_1)
+        self._write_json(changed_ids=changed_ids)
     
     def delete_from_pending_likes(self, current_user_id: int, other_user_id: int):
         """Remove user2 from user1's pending likes."""
         pass
 
+    def lookup_is_liked_by(self, user_id: str, other_user_id: str) -> bool:
+        """Return True if other user previously swiped "yes" on this user, else False. Probes this user's liked-by index."""
+        self._read_json()
+        if not "liked_by" in self._data[user_id]: # Stored before the index existed
+            self._write_json(changed_ids=self._backfill_liked_by())
+        return other_user_id in self._data[user_id]["liked_by"]
+
     def lookup_is_user_in_pending_likes(self, current_user_id: int, other_user_id:int) -> bool: # TODO re-implement in the object-composition based way. Use a User objects, call their method(s), then write each back to the DB
         """Return true if current user previously swiped "yes" on other user, else False."""
         self._read_json()
@@ -430,9 +604,65 @@ class UserModelInterface(ModelInterfaceABC):
             user_data["match_blacklist"] = {other_user_id: time.time()}
         else:
             user_data["match_blacklist"][other_user_id] = time.time()
-        self._write_json()
+        models.user.add_exclusion(self._exclusions(current_user_id), other_user_id)
+        self._drop_from_candidate_feed(user_data, other_user_id)
+        self._write_json(changed_ids=[current_user_id])
 
     ### Private methods ###
+
+    def _indexed_location(self, user_data: dict) -> tuple:
+        location = user_data.get("predominant_location") or user_data["current_location"]
+        return (float(location[0]), float(location[1]))
+
+    def _exclusions(self, user_id: str) -> List[str]:
+        """Returns the user's sorted exclusions list, first building it if the user was stored before exclusions existed."""
+        user_data = self._data[user_id]
+        if not "exclusions" in user_data:
+            user_data["exclusions"] = models.user.build_exclusions(user_id, user_data["pending_likes"], user_data["matches"], user_data.get("match_blacklist", {}))
+        return user_data["exclusions"]
+
+    def _liked_by(self, user_id: str) -> dict:
+        """Returns the user's liked-by index, first backfilling every user's if the user was stored before the index existed."""
+        if not "liked_by" in self._data[user_id]:
+            self._backfill_liked_by()
+        return self._data[user_id]["liked_by"]
+
+    def _backfill_liked_by(self) -> List[str]:
+        """
+        Builds the liked-by index of every user stored without one, from every user's pending likes. One pass over all users,
+        and only needed once, since users created since the index existed start with an empty one.
+
+        Returns:
+            (list[str]): Ids of the users whose data changed.
+        """
+        changed_ids = [user_id for user_id, user_data in self._data.items() if not "liked_by" in user_data]
+        for user_id in changed_ids:
+            self._data[user_id]["liked_by"] = {}
+        changed = set(changed_ids)
+        for user_id, user_data in self._data.items():
+            for liked_id, like_time in user_data["pending_likes"].items():
+                if liked_id in changed:
+                    self._data[liked_id]["liked_by"][user_id] = like_time
+        return changed_ids
+
+    def _index_like(self, user_id: str, liked_id: str, like_time: float) -> List[str]:
+        """
+        Records in liked_id's liked-by index that user_id liked them.
+
+        Returns:
+            (list[str]): Ids of the users whose data changed.
+        """
+        changed_ids = self._backfill_liked_by() if not "liked_by" in self._data[liked_id] else []
+        self._data[liked_id]["liked_by"][user_id] = like_time
+        return changed_ids if liked_id in changed_ids else changed_ids + [liked_id]
+
+    def _drop_from_candidate_feed(self, user_data: dict, candidate_id: str) -> None:
+        """Removes a decided-on candidate from the user's feed. It's almost always the head, since that's the one query_next_candidate served."""
+        feed = user_data.get("candidates", [])
+        if feed and feed[0] == candidate_id:
+            del feed[0]
+        elif candidate_id in feed:
+            feed.remove(candidate_id)
     
     def _update_tastes(self, user_id: int, new_tastes_data:dict) -> None:
         """Helper method to handle calling the User model's tastes updater method."""
@@ -453,6 +683,10 @@ class UserModelInterface(ModelInterfaceABC):
 
 class DatespotModelInterface(ModelInterfaceABC):
 
+    _spatially_indexed = True
+    _tile_stores = {} # Shared by every instance in the process. Keys are JSON map filenames, values are
+                      #   (JSON map mtime, datafile, tiles directory, manifest mtime, TileStore) tuples.
+
     def __init__(self, json_map_filename=None): # The abstract base class handles setting the filename to default if none provided
         self._model = "datespot"
         if json_map_filename:
@@ -479,15 +713,61 @@ class DatespotModelInterface(ModelInterfaceABC):
 
         # Save the object's data to the DB using that hash as the key
         self._data[new_object_id] = datespot_obj.serialize()
-        self._write_json()
+        self._write_json(changed_ids=[new_object_id])
         return new_object_id
 
+    def create_many(self, new_data_list: List[dict], skip_known: bool=True) -> List[str]:
+        """
+        Creates a Datespot for each dict in new_data_list with one read and one write of the persistent JSON, for bulk
+        ingests from Yelp or Google.
+
+        Args:
+            new_data_list (list[dict]): Data for each new datespot, in the same format create() takes.
+            skip_known (bool): If True, skip datespots for which is_known_name_location() is True, including ones
+                that duplicate an earlier entry in new_data_list.
+
+        Returns:
+            (list[str]): Ids of the datespots created, in order.
+        """
+        self._read_json()
+        name_location_index = self._spatial_index(spatial_index.NameLocationIndex) if skip_known else None
+        new_object_ids = []
+        for new_data in new_data_list:
+            if skip_known and self._is_known_name_location(name_location_index, new_data["name"], new_data["location"]):
+                continue
+            if not "datespot_id" in new_data or new_data["datespot_id"] in self._data:
+                new_data["datespot_id"] = uuid.uuid1().hex
+            datespot_obj = self._instantiate_obj_from_dict(new_data)
+            self._data[datespot_obj.id] = datespot_obj.serialize()
+            if skip_known: # So later entries in the same batch are checked against this one too
+                self._index_object(name_location_index, datespot_obj.id, self._data[datespot_obj.id])
+            new_object_ids.append(datespot_obj.id)
+        if new_object_ids:
+            self._write_json(changed_ids=new_object_ids)
+        return new_object_ids
+
     def lookup_obj(self, id: int) -> models.Datespot:
         """Return the datespot object corresponding to key "id"."""
         self._read_json()
         self._validate_object_id(id)
         datespot_data = self._data[id]
         return self._instantiate_obj_from_dict(datespot_data)
+
+    def lookup_objs(self, ids: list) -> List[models.Datespot]:
+        """
+        Return the datespot objects corresponding to each of ids, in the same order. Reads the datafile at most once,
+        and not at all if this instance's copy of the data is already current.
+        """
+        if not ids:
+            return []
+        if not self._datafile:
+            self._set_datafile()
+        if self._read_stamp != self._file_stamp():
+            self._read_json()
+        for datespot_id in ids:
+            if not datespot_id in self._data:
+                raise KeyError(f"{self._model} with id (key) {datespot_id} not found.")
+        return [self._instantiate_obj_from_dict(self._data[datespot_id]) for datespot_id in ids]
     
     def render_obj(self, object_id: str) -> dict:
         """
@@ -537,7 +817,7 @@ class DatespotModelInterface(ModelInterfaceABC):
                 else: # Any field other than the traits dict can just be overwritten entirely
                     datespot_data[field] = new_value
 
-        self._write_json()
+        self._write_json(changed_ids=[id])
 
     def query_num_datespots(self): # Todo hasty, more code-elegant ways to do this
         """Return the number of datespots in this API instance's data."""
@@ -554,17 +834,32 @@ class DatespotModelInterface(ModelInterfaceABC):
         """ 
         if (not location) or (not geo_utils.is_valid_lat_lon(location)): # todo best architectural place for validating this?
             raise ValueError(f"Bad lat lon location: {location}")
-        self._read_json()
-        query_results = [] # list of two element tuples of (distance_from_query_location, serialized_datespot_dict). I.e. list[tuple[int, dict]]
-        for id_key in self._data:
-            
-            datespot_data = self._data[id_key]
-            place_loc = datespot_data["location"]
-            distance = geo_utils.haversine(location, place_loc)
-            if distance < radius: # todo do we need the full object in the results dict, or would only the lookup key suffice?
-                query_results.append((distance, id_key)) # append as tuple with distance as the tuple's first element
-        query_results.sort() # Todo no reason to heap-sort yet, this method's caller won't necessarily want it as a heap. 
-        return query_results
+        tile_store = self._tile_store()
+        if tile_store is not None: # Reads only the tiles the circle touches
+            return tile_store.query_radius(location, radius)
+        return self._spatial_index().query_radius(location, radius) # Skips reading the datafile when the index is already up to date
+
+    def query_datespots_knn(self, location: tuple, k: int) -> List[Tuple[float, str]]:
+        """
+        Return the k datespots nearest to location, or all of them if there are fewer than k.
+
+        Returns:
+            (list[tuple[float, str]]): (distance in meters, datespot_id) tuples sorted from nearest to farthest.
+        """
+        if (not location) or (not geo_utils.is_valid_lat_lon(location)):
+            raise ValueError(f"Bad lat lon location: {location}")
+        if not isinstance(k, int) or k < 1:
+            raise ValueError(f"k must be a positive int. Was {k}")
+        return self._spatial_index(spatial_index.UnitVectorKDTree).query_knn(location, k)
+
+    def iter_datespot_ids_nearest(self, location: tuple) -> Iterator[Tuple[float, str]]:
+        """
+        Yield every datespot as a (distance in meters, datespot_id) tuple, from nearest to farthest. Searches outward
+        from location, so stopping early skips the datespots farther out.
+        """
+        if (not location) or (not geo_utils.is_valid_lat_lon(location)):
+            raise ValueError(f"Bad lat lon location: {location}")
+        return self._spatial_index().iter_nearest(location)
 
     def query_datespot_objs_near(self, location, radius=2000):
         """
@@ -580,28 +875,15 @@ class DatespotModelInterface(ModelInterfaceABC):
         #   list? OTOH, if the caller is Match algorithms, may end up wanting to factor distance into suggestions (all else equal,
         #   choose the closer restaurant).
 
-        # Todo for now, just wrap the one that returns ids, and then convert each ID to a datespot object
         datespot_ids = self.query_datespot_ids_near(location, radius)
-        query_results = []
-        for composite_element in datespot_ids:
-            distance, id_string = composite_element[0], composite_element[1]
-            datespot_obj = self.lookup_obj(id_string)
-            query_results.append((distance,datespot_obj))
-        return query_results
+        datespot_objs = self.lookup_objs([datespot_id for distance, datespot_id in datespot_ids]) # One read for the whole result, not one per datespot
+        return [(distance, datespot_obj) for (distance, datespot_id), datespot_obj in zip(datespot_ids, datespot_objs)]
 
     def is_known_name_location(self, datespot_name: str, datespot_location: tuple) -> bool:
         """
         Return True if a Datespot with this name at this location is already known to the database, else False.
         """
-        datespot_name = datespot_name.lower()
-        datespot_location = (round(datespot_location[0], LAT_LON_DECIMAL_PLACES), round(datespot_location[1], LAT_LON_DECIMAL_PLACES))
-        self._read_json()
-        for datespot_id in self._data:  
-            datespot_data = self._data[datespot_id]
-            if datespot_data["name"].lower() == datespot_name:  # TODO make this a geo_util?
-                if geo_utils.haversine(datespot_location, datespot_data["location"]) < 50:  # If less than 50m apart and have same name, should be safe to assume it's same establishment
-                    return True
-        return False
+        return self._is_known_name_location(self._spatial_index(spatial_index.NameLocationIndex), datespot_name, datespot_location)
 
     def is_in_db(self, datespot_data) -> bool:  # TODO obviated?
         # TODO this may be needed uniquely for Datespot model, because there's unique risk of entering the same venue's data twice.
@@ -621,6 +903,48 @@ class DatespotModelInterface(ModelInterfaceABC):
     
     ### Private methods ###
 
+    def _indexed_location(self, object_data: dict) -> tuple:
+        return tuple(object_data["location"])
+
+    def _index_object(self, index, object_id: str, object_data: dict) -> None:
+        if isinstance(index, spatial_index.NameLocationIndex):
+            index.insert(object_id, self._indexed_location(object_data), object_data["name"])
+        else:
+            super()._index_object(index, object_id, object_data)
+
+    def _is_known_name_location(self, name_location_index, datespot_name: str, datespot_location: tuple) -> bool:
+        datespot_location = (round(datespot_location[0], LAT_LON_DECIMAL_PLACES), round(datespot_location[1], LAT_LON_DECIMAL_PLACES))
+        return name_location_index.find(datespot_name, datespot_location, DUPLICATE_DATESPOT_RADIUS) is not None # Same name less than that far apart should be safe to assume is the same establishment
+
+    def _tile_store(self) -> datespot_tiles.TileStore:
+        """
+        Returns the TileStore named by the JSON map's "datespot_tiles" key, or None if there isn't one, it hasn't been
+        built, or it was built from an older version of the datafile.
+
+        Only stats files while the JSON map and the manifest are unchanged since the last call, so queries skip parsing them.
+        """
+        map_mtime = os.stat(self._master_datafile).st_mtime_ns
+        cached = DatespotModelInterface._tile_stores.get(self._master_datafile)
+        if cached is None or cached[0] != map_mtime: # JSON map is new to this process or was edited
+            with open(self._master_datafile, 'r') as fobj:
+                json_map = json.load(fobj)
+            cached = (map_mtime, json_map[f"{self._model}_data"], json_map.get("datespot_tiles"), None, None)
+        map_mtime, datafile, tiles_directory, manifest_mtime, tile_store = cached
+        if not self._datafile:
+            self._datafile = datafile
+        if tiles_directory:
+            try:
+                current_manifest_mtime = os.stat(os.path.join(tiles_directory, datespot_tiles.MANIFEST_FILENAME)).st_mtime_ns
+            except FileNotFoundError: # Not built yet, or mid-rebuild
+                current_manifest_mtime, tile_store = None, None
+            if current_manifest_mtime is not None and (tile_store is None or current_manifest_mtime != manifest_mtime): # Tiles were rebuilt since they were last opened
+                tile_store = datespot_tiles.TileStore(tiles_directory)
+            manifest_mtime = current_manifest_mtime
+        DatespotModelInterface._tile_stores[self._master_datafile] = (map_mtime, datafile, tiles_directory, manifest_mtime, tile_store)
+        if tile_store is None or tile_store.source_stamp != self._file_stamp(): # Datafile changed since the build
+            return None
+        return tile_store
+
     def _validate_new_datespot(self):
     # todo query the db by name and location to avoid duplicates. I.e. does a restaurant with that name 
     #   already exist at approximately that location in the db?
@@ -759,15 +1083,19 @@ class MatchModelInterface(ModelInterfaceABC):
         Return list of dictionaries containg information about suggested Datespots relevant and appropriate
         for display to Users in suggestions.
         """
+        return list(self.iter_suggestions_list(match_id))
+
+    def iter_suggestions_list(self, match_id: str) -> Iterator[dict]:
+        """
+        Generator version of render_suggestions_list. Yields the display info for one suggested Datespot at a time.
+        """
         self._read_json()
-        renderable_data = []
         match_obj = self.lookup_obj(match_id)
         datespot_db = DatespotModelInterface(json_map_filename=self._master_datafile)
         for suggestion in match_obj.suggestions_queue:  # TODO it should be an @property that yields, like User.matches
             # TODO whatever Match model code is called here should be solely responsible for updating the suggestions queue if necessary
             datespot_obj = suggestion[1]  # TODO External callers shouldn't have to deal with the indexing like this; Match generators should handle it
-            renderable_data.append(datespot_db.render_obj(datespot_obj.id))
-        return renderable_data
+            yield datespot_db.render_obj(datespot_obj.id)
         
     def update(self, object_id, json_data=None): # Todo
         # e.g. if the current location changed, meaning the Match.midpoint changed
@@ -803,8 +1131,53 @@ class MatchModelInterface(ModelInterfaceABC):
         self._read_json()
         self._validate_object_id(object_id)
         match_data = self._data[object_id]
-        return not match_data["suggestions"]
+        return not match_data["suggestions"] or match_data.get("suggestions_stale", False)
+
+    def recompute_midpoints(self, threshold: float=MIDPOINT_REFRESH_THRESHOLD) -> List[str]:
+        """
+        Recomputes every stored Match's midpoint and distance from its Users' current locations, in one vectorized
+        pass, and flags the Matches whose midpoint moved more than threshold meters as needing fresh suggestions.
+        Doesn't instantiate any Match or User objects.
+
+        Args:
+            threshold (float): Distance in meters.
+
+        Returns:
+            (list[str]): Ids of the Matches newly flagged.
+        """
+        self._read_json()
+        self.user_api_instance._read_json()
+        user_data = self.user_api_instance._data
+        match_ids = list(self._data)
+        if not match_ids:
+            return []
+        user1_locations = [user_data[self._data[match_id]["users"][0]]["current_location"] for match_id in match_ids]
+        user2_locations = [user_data[self._data[match_id]["users"][1]]["current_location"] for match_id in match_ids]
+        new_midpoints = geo_utils.midpoints(user1_locations, user2_locations)
+        new_distances = geo_utils.haversine_pairwise(user1_locations, user2_locations)
+        old_midpoints = [self._data[match_id].get("midpoint") or new_midpoints[i] for i, match_id in enumerate(match_ids)] # Matches stored without a midpoint are flagged below regardless
+        moved = geo_utils.haversine_pairwise(old_midpoints, new_midpoints) > threshold
+
+        flagged_ids = []
+        for i, match_id in enumerate(match_ids):
+            match_data = self._data[match_id]
+            if moved[i] or not match_data.get("midpoint"):
+                if not match_data.get("suggestions_stale"):
+                    flagged_ids.append(match_id)
+                match_data["suggestions_stale"] = True # Cleared when the refreshed suggestions are synced
+            match_data["midpoint"] = (float(new_midpoints[i][0]), float(new_midpoints[i][1]))
+            match_data["distance"] = float(new_distances[i])
+        self._write_json()
+        return flagged_ids
     
+    def query_suggestion_datespot_ids(self, object_id: str) -> List[str]:
+        """
+        Returns the id strings of the Datespots in this match's stored suggestions, in suggestion order.
+        """
+        self._read_json()
+        self._validate_object_id(object_id)
+        return [suggestion[1] for suggestion in self._data[object_id]["suggestions"]]
+
     def refresh_suggestion_candidates(self, object_id: str, candidates: List[Tuple[float, models.Datespot]]) -> None:
         """
         Feeds new external data about Datespots to a Match object, for consideration in suggestions.
@@ -5,6 +5,24 @@ import json
 
 from project_constants import *
 
+_baseline_scoring_data = None
+
+def baseline_scoring_data() -> tuple:
+    """
+    Returns the baseline trait weights and brand reputations, read from disk on the first call only. Every Datespot
+    shares the returned dicts, so callers must not modify them.
+
+    Returns:
+        (tuple[dict, dict]): Trait weights keyed by trait name, and sets of restaurant names keyed by reputational label.
+    """
+    global _baseline_scoring_data
+    if _baseline_scoring_data is None:
+        with open(BASELINE_SCORING_DATA) as fobj:
+            all_json = json.load(fobj)
+        brand_reputations = {label: set(names) for label, names in all_json["brand_reputations"].items()} # hash sets for faster lookup
+        _baseline_scoring_data = (all_json["trait_weights"], brand_reputations)
+    return _baseline_scoring_data
+
 class Datespot(metaclass=DatespotAppType):
 
     # TODO Plan as of 5/18 is that reviews per se aren't related to a datespot. Higher level info is extracted from the reviews--abstract traits about the 
@@ -66,18 +84,10 @@ class Datespot(metaclass=DatespotAppType):
         self.google_id = google_id
 
 
-        with open(BASELINE_SCORING_DATA) as fobj: # TODO each json.load(fobj) call is another pass through the entire json file, right?
-                                                    # Is there a smarter way to ensure a single pass than reading all the json into a 
-                                                    #   dict and then unpacking that dict?
-            all_json = json.load(fobj)
-            self.baseline_trait_weights = all_json["trait_weights"]
-            self.brand_reputations = all_json["brand_reputations"]
+        self.baseline_trait_weights, self.brand_reputations = baseline_scoring_data()
 
         self.baseline_dateworthiness = 0.0
         self.traits = traits  
-        
-        for key in self.brand_reputations: # cast each non-associative array to a hash set for faster lookup
-            self.brand_reputations[key] = set(self.brand_reputations[key])
 
     ### Public methods ###
 
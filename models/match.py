@@ -121,6 +121,8 @@ class Match(metaclass=DatespotAppType):
         return {
             "users": list(self._users),
             "timestamp": self.timestamp,
+            "midpoint": self._midpoint,
+            "distance": self._distance,
             "suggestions": self._serialize_suggestions()
         }
     
@@ -5,10 +5,10 @@ Data and algorithms relevant to ascertaining user tastes and preferences based o
 from models.app_object_type import DatespotAppType
 
 import nltk
-from vaderSentiment import vaderSentiment as vs
 import bisect
 
 import models.user as user
+from models import nlp_resources
 
 from project_constants import *
 
@@ -37,14 +37,7 @@ class Message(metaclass=DatespotAppType):
         self.chat_id = chat_id
         self.text = text
 
-        self._tastes_keywords = [] 
-
-        with open(TASTES_KEYWORDS, 'r') as fobj:
-            for line in fobj.readlines():
-                self._tastes_keywords.append(line.rstrip()) # strip newline character from right
-        assert isinstance(self._tastes_keywords, list)
-        self._tastes_keywords.sort() # for binary search
-            # Todo store it sorted on disk. Have a unit test that reads it from disk and confirms it's sorted.
+        self._tastes_keywords = nlp_resources.tastes_keywords() # Shared sorted list, for binary search
 
         self._sentences = []
         self._sentimient_avg = None
@@ -115,7 +108,7 @@ class Message(metaclass=DatespotAppType):
 
         self._tokenize() # populate the sentences array
         sentiments_sum = 0 # sum of vaderSentiment SentimentIntensityAnalyzer "compound" scores
-        analyzer = vs.SentimentIntensityAnalyzer()
+        analyzer = nlp_resources.sentiment_analyzer()
         for sentence in self._sentences:
             sentence_sentiment = analyzer.polarity_scores(sentence)["compound"]
             sentiments_sum += sentence_sentiment
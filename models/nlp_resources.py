@@ -0,0 +1,43 @@
+"""
+Process-wide NLP resources shared by the Message and Review models. Each is loaded the first time it's needed and reused
+after that, rather than re-read or re-built for every model object.
+"""
+
+import nltk
+from vaderSentiment import vaderSentiment as vs
+
+from project_constants import *
+
+_tastes_keywords = None
+_sentiment_analyzer = None
+
+def tastes_keywords() -> list:
+    """
+    Returns the sorted list of tastes keywords. Callers share the one list, so must not modify it.
+    """
+    global _tastes_keywords
+    if _tastes_keywords is None:
+        with open(TASTES_KEYWORDS, 'r') as fobj:
+            keywords = [line.rstrip() for line in fobj.readlines()] # strip newline character from right
+        keywords.sort() # for binary search
+            # Todo store it sorted on disk. Have a unit test that reads it from disk and confirms it's sorted.
+        _tastes_keywords = keywords
+    return _tastes_keywords
+
+def sentiment_analyzer() -> vs.SentimentIntensityAnalyzer:
+    """
+    Returns the shared VADER analyzer. Building one reads the whole VADER lexicon from disk.
+    """
+    global _sentiment_analyzer
+    if _sentiment_analyzer is None:
+        _sentiment_analyzer = vs.SentimentIntensityAnalyzer()
+    return _sentiment_analyzer
+
+def warm_up() -> None:
+    """
+    Loads every resource in this module, plus NLTK's sentence tokenizer, so the first message or review a process
+    handles doesn't pay for loading them.
+    """
+    tastes_keywords()
+    sentiment_analyzer().polarity_scores("Warm up.")
+    nltk.tokenize.sent_tokenize("Warm up. Loads the punkt tokenizer.")
@@ -1,7 +1,7 @@
 from models.app_object_type import DatespotAppType
 
 import nltk
-from vaderSentiment import vaderSentiment as vs
+from models import nlp_resources
 
 from project_constants import *
 
@@ -72,7 +72,7 @@ class Review(metaclass=DatespotAppType):
     
     def _analyze_sentiment(self) -> float:
         self._tokenize()
-        analyzer = vs.SentimentIntensityAnalyzer()
+        analyzer = nlp_resources.sentiment_analyzer()
         sentiments_sum = 0 # sum of VSA "compound" scores
         for sentence in self._sentences:
             sentiments_sum += analyzer.polarity_scores(sentence)["compound"]
@@ -1,5 +1,6 @@
 from models.app_object_type import DatespotAppType
 
+import bisect
 import collections
 from typing import List
 import time
@@ -24,7 +25,7 @@ class UserBase(metaclass=DatespotAppType):
         self._tastes = tastes  # Private attribute, because the structure of the dict's values is a confusing implementation detail.
         self.travel_propensity= travel_propensity #  todo placeholder. Integer indicating how willing the user is to travel, relative to other users.
 
-        self.pending_likes = pending_likes  # References to Users this user swiped "accept" on, but who haven't yet swiped back. Keys are user ids, values are time.time() timestamps
+        self.pending_likes = dict(pending_likes)  # Copy, so Users don't share the default dict. References to Users this user swiped "accept" on, but who haven't yet swiped back. Keys are user ids, values are time.time() timestamps
 
     def __eq__(self, other):
         if type(self) != type(other):
@@ -79,6 +80,8 @@ class User(UserBase):
         pending_likes: dict={},
         matches: List[tuple]=[],
         match_blacklist: dict={},
+        exclusions: List[str]=None,
+        liked_by: dict={}
         ):
         """
         Args:
@@ -96,6 +99,12 @@ class User(UserBase):
                 - match_id is equal to that Match object's .id attribute
                 - timestamp is the Unix timestamp equal to Match.timestamp
                 - partner_id is the user ID string of the other member of the Match besides this User.
+            
+            exclusions (list[str]): Sorted list of the user IDs that should never be queued as this User's candidates: this
+                User itself, and every User it has blacklisted, liked, or matched with. Built from those if not provided.
+            
+            liked_by (dict): Reverse of other Users' pending_likes. Keys are the user IDs of Users who swiped "accept" on
+                this User, values are the time.time() timestamps of those swipes.
         """
         super().__init__(
             user_id=user_id,
@@ -115,10 +124,14 @@ class User(UserBase):
         self._fixed_predominant_location = False  # True if e.g. the User provided their home address
 
         self.candidates = collections.deque(candidates)  # Deque of User objects
-        self._matches = matches # References to Matches of which this User is a constituent.
+        self._matches = list(matches) # References to Matches of which this User is a constituent.
         self._sort_matches()  # Maintain list in sorted order on the default sort criteria
 
-        self.match_blacklist = match_blacklist # References to Users with whom this user should never be matched. Keys are user ids, values timestamps indicating when the blacklisting happened. 
+        self.match_blacklist = dict(match_blacklist) # References to Users with whom this user should never be matched. Keys are user ids, values timestamps indicating when the blacklisting happened. 
+        if exclusions is None:
+            exclusions = build_exclusions(user_id, pending_likes, matches, match_blacklist)
+        self.exclusions = exclusions
+        self.liked_by = dict(liked_by)
         
         # TODO Can't do it this way, this adds a bunch of other user ids
         # if not self.id in self.match_blacklist: # Prevent this user being matched with themself
@@ -129,7 +142,6 @@ class User(UserBase):
         # TODO We don't want the chat-reader to e.g. massively over-weight Korean restaurants in suggestions for a user who says "I'm Korean" meaning ethnicity.
         #   Maybe there will be enough non-ethnic restaurant traits for it to wash out, TBD.
 
-        # TODO Would it make sense to automatically put each User into their own blacklist, as a simple way to prevent them being in their own candidates feed?
     
     ### Public methods ###
     
@@ -182,8 +194,21 @@ class User(UserBase):
         if not self.has_match(match_id):
             new_match = (match_id, match_timestamp, match_partner_id)
             self._matches.append(new_match)
+            add_exclusion(self.exclusions, match_partner_id)
         self._sort_matches()
 
+    def is_excluded(self, user_id: str) -> bool:
+        """
+        Returns True if user_id should never be queued as this User's candidate, else False.
+        """
+        return exclusions_contain(self.exclusions, user_id)
+
+    def is_liked_by(self, user_id: str) -> bool:
+        """
+        Returns True if the User with user_id already swiped "accept" on this User, else False.
+        """
+        return user_id in self.liked_by
+
     def _sort_matches(self, key="timestamp"):
         if key == "timestamp":
             self._matches.sort(key = lambda match : match[1], reverse=True)
@@ -225,7 +250,9 @@ class User(UserBase):
             "candidates": self._serialize_candidates(),  # List of only the ID hex-strings
             "pending_likes": self.pending_likes,
             "matches": self._matches,
-            "match_blacklist": self.match_blacklist
+            "match_blacklist": self.match_blacklist,
+            "exclusions": self.exclusions,
+            "liked_by": self.liked_by
         }
     
     def _serialize_candidates(self) -> List[str]:
@@ -258,14 +285,17 @@ class User(UserBase):
     
     def next_candidate(self):
         """
-        Returns the next candidate from this User's candidates queue.
+        Returns the next candidate from this User's candidates queue, first dropping any at the head of the queue
+        that this User has decided on since they were queued.
         
         Returns:
-            (Candidate): Candidate object for the next candidate.
+            (Candidate): Candidate object for the next candidate, or None if the queue is empty or held only excluded Users.
 
         """
-        if self.candidates[0].id == self.id: # TODO sloppy hack to prevent matching with self
+        while self.candidates and self.is_excluded(self.candidates[0].id):
             self.candidates.popleft()
+        if not self.candidates:
+            return None
         return self.candidates[0]
     
     def _pop_interacted_candidate(self, candidate):  # The interacted-with candidate (decided yes/no/defer on) should generally be at the head of the queue, but may not always be
@@ -300,6 +330,7 @@ class User(UserBase):
             return True
         else:
             self.pending_likes[accepted_candidate.id] = time.time()
+            add_exclusion(self.exclusions, accepted_candidate.id)
             return False
     
     def reject_candidate(self, rejected_candidate) -> None:
@@ -325,8 +356,27 @@ class User(UserBase):
     def _blacklist(self, rejected_candidate) -> None:
         """Adds a rejected candidate to this User's blacklist."""
         self.match_blacklist[rejected_candidate.id] = time.time()
+        add_exclusion(self.exclusions, rejected_candidate.id)
     
     ### Private methods ###
 
     def _compute_predominant_location(self): # todo, placeholder for more sophisticated
-        return self.current_location
\ No newline at end of file
+        return self.current_location
+
+def build_exclusions(user_id: str, pending_likes: dict, matches: List[tuple], match_blacklist: dict) -> List[str]:
+    """
+    Returns the sorted exclusions list for a User's stored data: the User's own ID, and the IDs of every User it has
+    liked, matched with, or blacklisted.
+    """
+    return sorted({user_id} | set(pending_likes) | {match[2] for match in matches} | set(match_blacklist))
+
+def exclusions_contain(exclusions: List[str], user_id: str) -> bool:
+    """Binary-searches a sorted exclusions list for user_id."""
+    i = bisect.bisect_left(exclusions, user_id)
+    return i < len(exclusions) and exclusions[i] == user_id
+
+def add_exclusion(exclusions: List[str], user_id: str) -> None:
+    """Inserts user_id into a sorted exclusions list in place, keeping it sorted and free of duplicates."""
+    i = bisect.bisect_left(exclusions, user_id)
+    if not (i < len(exclusions) and exclusions[i] == user_id):
+        exclusions.insert(i, user_id)
@@ -7,8 +7,15 @@ DEFAULT_RADIUS = 2000  # Meters
 LAT_LON_DECIMAL_PLACES = 6  # See https://gis.stackexchange.com/questions/8650/measuring-accuracy-of-latitude-and-longitude
 DATESPOT_SCORE_DECIMAL_PLACES = 4
 MIN_SUGGESTION_CANDIDATES = 5
+CANDIDATE_FEED_SIZE = 50  # Candidate ids to keep queued in each User's feed.
+CANDIDATE_FEED_LOW_WATER = 10  # The background refill tops up feeds holding fewer candidates than this.
+CANDIDATE_FEED_RADIUS = 50000  # Meters. Farthest away a User can be and still be queued as another User's candidate.
+CANDIDATE_RANKING_POOL = 200  # Nearest eligible Users to rank by taste similarity when refilling a feed.
+MIDPOINT_REFRESH_THRESHOLD = 500  # Meters. A Match whose midpoint moves farther than this needs fresh suggestions.
+DUPLICATE_DATESPOT_RADIUS = 50  # Meters. Datespots with the same name closer than this are taken to be the same establishment.
 EARTH_RADIUS_KM = 6368  # Radius of the Earth in kilometers.
 EARTH_CIRCUMFERENCE_KM = 40075
+EQUIRECTANGULAR_MAX_RADIUS = 5000  # Meters. Radius queries smaller than this use the equirectangular distance approximation.
 
 # File paths
 MOCK_JSON_DB_MAP = "jsonMapMock.json"
@@ -0,0 +1,137 @@
+"""Request metrics for the database server: per-method call counts, error counts, byte counts, and latency histograms."""
+
+import math, time
+from typing import Dict
+
+HISTOGRAM_MIN_LATENCY = 1e-5  # Seconds. Anything faster lands in the first bucket.
+HISTOGRAM_GROWTH_FACTOR = 1.1  # Each bucket's upper bound is 10% above the previous one's, so percentiles are accurate to within 10%.
+
+
+class LatencyHistogram:
+    """
+    Fixed-memory latency histogram with geometrically sized buckets. Percentiles are estimated as the upper bound
+    of the bucket the percentile falls in.
+    """
+
+    def __init__(self):
+        self._bucket_counts = {}  # Keys are bucket indices, values are how many samples fell in that bucket
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency: float) -> None:
+        """
+        Args:
+            latency (float): Latency of one call, in seconds.
+        """
+        bucket = self._bucket_index(latency)
+        self._bucket_counts[bucket] = self._bucket_counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, percent: float) -> float:
+        """
+        Returns the estimated latency, in seconds, below which percent of the recorded samples fall.
+
+        Args:
+            percent (float): Percentile in [0..100].
+        """
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self._bucket_counts):
+            seen += self._bucket_counts[bucket]
+            if seen >= rank:
+                return min(self._bucket_upper_bound(bucket), self.max)  # Don't report a bound above the slowest sample actually seen
+        return self.max
+
+    def summary(self) -> dict:
+        """Returns the p50, p95, p99, max, and mean latencies in milliseconds."""
+        return {
+            "p50": round(self.percentile(50) * 1000, 3),
+            "p95": round(self.percentile(95) * 1000, 3),
+            "p99": round(self.percentile(99) * 1000, 3),
+            "max": round(self.max * 1000, 3),
+            "mean": round(self.total / self.count * 1000, 3) if self.count else 0.0
+        }
+
+    def _bucket_index(self, latency: float) -> int:
+        if latency <= HISTOGRAM_MIN_LATENCY:
+            return 0
+        return math.ceil(math.log(latency / HISTOGRAM_MIN_LATENCY, HISTOGRAM_GROWTH_FACTOR))
+
+    def _bucket_upper_bound(self, bucket: int) -> float:
+        return HISTOGRAM_MIN_LATENCY * HISTOGRAM_GROWTH_FACTOR ** bucket
+
+
+class MethodStats:
+    """Counters for calls to a single method."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.shed = 0  # Requests answered "overloaded" without being run
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = LatencyHistogram()
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "shed": self.shed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "latency_ms": self.latency.summary()
+        }
+
+
+class ServerStats:
+    """Collects MethodStats for each method the server handles."""
+
+    def __init__(self):
+        self._start_time = time.time()
+        self._methods: Dict[str, MethodStats] = {}
+
+    def record_call(self, method: str, latency: float, error: bool=False) -> None:
+        """
+        Records one executed call.
+
+        Args:
+            method (str): Name of the method called.
+            latency (float): Seconds the call took.
+            error (bool): True if the call returned an error status.
+        """
+        method_stats = self._method_stats(method)
+        method_stats.calls += 1
+        method_stats.errors += int(error)
+        method_stats.latency.record(latency)
+
+    def record_shed(self, method: str) -> None:
+        """Records one request that was rejected without being run because the server was overloaded."""
+        self._method_stats(method).shed += 1
+
+    def record_bytes(self, method: str, bytes_in: int, bytes_out: int) -> None:
+        """Records the request and response frame sizes for one request."""
+        method_stats = self._method_stats(method)
+        method_stats.bytes_in += bytes_in
+        method_stats.bytes_out += bytes_out
+
+    def snapshot(self) -> dict:
+        """
+        Returns a JSON-serializable summary of everything recorded so far.
+        """
+        method_summaries = {method: method_stats.summary() for method, method_stats in sorted(self._methods.items())}
+        return {
+            "uptime_seconds": round(time.time() - self._start_time, 3),
+            "bytes_in": sum(summary["bytes_in"] for summary in method_summaries.values()),
+            "bytes_out": sum(summary["bytes_out"] for summary in method_summaries.values()),
+            "methods": method_summaries
+        }
+
+    def _method_stats(self, method: str) -> MethodStats:
+        if not method in self._methods:
+            self._methods[method] = MethodStats()
+        return self._methods[method]
@@ -0,0 +1,329 @@
+"""
+Shared-memory transport for the database server, as an alternative to the named pipes. Node and Python run on the same
+machine, so request and response bytes can go through a ring buffer in a memory-mapped file under /dev/shm instead of
+through the kernel on every read and write.
+
+Each direction of a channel is one RingBuffer: a single-producer, single-consumer byte stream. Like the named pipes,
+it carries the same self-delimiting request and response frames, so the framing in database_server.py works
+unchanged. A frame may be split across reads.
+
+Ring buffer file layout (all integers little-endian unsigned 64-bit):
+
+    offset 0:   head. Total bytes ever read. Only the reader writes it.
+    offset 8:   tail. Total bytes ever written. Only the writer writes it.
+    offset 16:  reader_waiting. 1 while the reader is about to sleep on the doorbell, else 0.
+    offset 64:  data, capacity bytes. Byte n of the stream lives at data[n % capacity].
+
+The reader spins briefly when the buffer is empty, then sets reader_waiting and sleeps on a doorbell FIFO next to the
+buffer file. After each write, the writer rings the doorbell only if reader_waiting is set, so a busy channel makes no
+syscalls at all. Without memory fences there's a small window where a wakeup can be missed. The reader never sleeps
+longer than WAKEUP_BACKSTOP, which bounds the cost of that case.
+
+x86 only. Python has no memory fences, so publishing with plain stores relies on x86 never reordering a store with an
+earlier store or load: the reader can't see a tail before the bytes behind it, and the writer can't see a head before
+the reader is done with the bytes it frees. ARM and other weakly ordered CPUs make no such promise, so RingBuffer
+refuses to open on them. Use the named pipes there.
+
+Run this module directly to benchmark small-message round trip latency against the named-pipe path:
+
+    python3 -m shm_transport --round-trips 10000 --message-size 128
+"""
+
+import argparse, json, mmap, multiprocessing, os, platform, select, struct, tempfile, time
+
+from server_stats import LatencyHistogram
+
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+DEFAULT_CHANNEL_NAME = "datespot_db"
+DEFAULT_RING_CAPACITY = 1 << 20 # Bytes in each direction
+DEFAULT_SPIN_SECONDS = 50e-6 if (os.cpu_count() or 1) > 1 else 0.0 # How long a reader busy-polls an empty buffer before sleeping on the doorbell.
+                                                                     #   Spinning on a single CPU only delays the writer it's waiting for.
+WAKEUP_BACKSTOP = 0.01 # Max seconds a reader sleeps without rechecking the buffer, in case a doorbell ring was missed
+WRITE_RETRY_SLEEP = 20e-6 # Seconds a writer sleeps between retries while the buffer is full
+
+HEAD_OFFSET = 0
+TAIL_OFFSET = 8
+READER_WAITING_OFFSET = 16
+DATA_OFFSET = 64
+COUNTER = struct.Struct("<Q")
+ORDERED_STORE_MACHINES = {"x86_64", "amd64", "i386", "i686", "x86"} # platform.machine() values for CPUs with x86 store ordering
+
+
+class RingBuffer:
+    """
+    One direction of a shared-memory channel. Exactly one process may write and exactly one may read.
+    """
+
+    def __init__(self, path: str, capacity: int=DEFAULT_RING_CAPACITY, create: bool=False, spin_seconds: float=DEFAULT_SPIN_SECONDS):
+        """
+        Args:
+            path (str): Path of the buffer file. The doorbell FIFO is the same path plus ".doorbell".
+            capacity (int): Size in bytes of the data area. Only used when creating; openers get the creator's capacity.
+            create (bool): True to create (or reset) the buffer and doorbell files, False to open existing ones.
+            spin_seconds (float): How long wait_readable() busy-polls before sleeping on the doorbell.
+        """
+        if not platform.machine().lower() in ORDERED_STORE_MACHINES: # See the module docstring
+            raise RuntimeError(f"Shared-memory transport needs x86 memory ordering, not available on {platform.machine()}. Use the named pipes.")
+        self.path = path
+        self.doorbell_path = f"{path}.doorbell"
+        self._spin_seconds = spin_seconds
+        if create:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.ftruncate(fd, DATA_OFFSET + capacity) # Zero-filled, so head, tail, and reader_waiting start at 0
+            if os.path.exists(self.doorbell_path):
+                os.remove(self.doorbell_path)
+            os.mkfifo(self.doorbell_path, 0o600)
+        else:
+            fd = os.open(path, os.O_RDWR)
+        try:
+            self._mmap = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+        self.capacity = len(self._mmap) - DATA_OFFSET
+        self._data = memoryview(self._mmap)[DATA_OFFSET:]
+        self._doorbell = os.open(self.doorbell_path, os.O_RDWR | os.O_NONBLOCK) # Read-write so opening never blocks on the other end
+        self._poll = select.poll()
+        self._poll.register(self._doorbell, select.POLLIN)
+
+    ### Public methods ###
+
+    def readable(self) -> int:
+        """Returns the number of bytes waiting to be read."""
+        return self._load(TAIL_OFFSET) - self._load(HEAD_OFFSET)
+
+    def write(self, data: bytes) -> int:
+        """
+        Writes as much of data as currently fits, without blocking.
+
+        Returns:
+            (int): Number of bytes written.
+        """
+        head, tail = self._load(HEAD_OFFSET), self._load(TAIL_OFFSET)
+        size = min(len(data), self.capacity - (tail - head))
+        if size <= 0:
+            return 0
+        start = tail % self.capacity
+        first_part = min(size, self.capacity - start)
+        self._data[start:start + first_part] = data[:first_part]
+        if size > first_part: # Wrap around to the front of the data area
+            self._data[:size - first_part] = data[first_part:size]
+        self._store(TAIL_OFFSET, tail + size) # Publish only after the bytes are in place
+        if self._load(READER_WAITING_OFFSET):
+            self._ring()
+        return size
+
+    def write_all(self, data: bytes) -> None:
+        """Writes all of data, waiting for the reader to make room as needed."""
+        data = memoryview(data)
+        while data:
+            written = self.write(data)
+            data = data[written:]
+            if data and not written:
+                time.sleep(WRITE_RETRY_SLEEP)
+
+    def read(self, max_bytes: int=None) -> bytes:
+        """
+        Reads up to max_bytes of what's waiting, without blocking.
+
+        Returns:
+            (bytes): The bytes read, or b"" if there were none.
+        """
+        head, tail = self._load(HEAD_OFFSET), self._load(TAIL_OFFSET)
+        size = tail - head if max_bytes is None else min(tail - head, max_bytes)
+        if size <= 0:
+            return b""
+        start = head % self.capacity
+        first_part = min(size, self.capacity - start)
+        data = bytes(self._data[start:start + first_part])
+        if size > first_part:
+            data += bytes(self._data[:size - first_part])
+        self._store(HEAD_OFFSET, head + size)
+        return data
+
+    def wait_readable(self, timeout: float=None) -> bool:
+        """
+        Waits until there are bytes to read.
+
+        Args:
+            timeout (float): Max seconds to wait. None waits indefinitely.
+
+        Returns:
+            (bool): True if there are bytes to read, False if the timeout ran out first.
+        """
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < self._spin_seconds:
+            if self.readable():
+                return True
+        while True:
+            self._store(READER_WAITING_OFFSET, 1)
+            if self.readable(): # Recheck now that the writer will ring
+                self._store(READER_WAITING_OFFSET, 0)
+                return True
+            remaining = None if timeout is None else timeout - (time.perf_counter() - start_time)
+            if remaining is not None and remaining <= 0:
+                self._store(READER_WAITING_OFFSET, 0)
+                return False
+            sleep_seconds = WAKEUP_BACKSTOP if remaining is None else min(remaining, WAKEUP_BACKSTOP)
+            if self._poll.poll(sleep_seconds * 1000):
+                self._drain_doorbell()
+            self._store(READER_WAITING_OFFSET, 0)
+            if self.readable():
+                return True
+
+    def close(self) -> None:
+        self._data.release()
+        self._mmap.close()
+        os.close(self._doorbell)
+
+    def unlink(self) -> None:
+        """Removes the buffer and doorbell files. Processes that already have them open can keep using them."""
+        for path in (self.path, self.doorbell_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    ### Private methods ###
+
+    def _load(self, offset: int) -> int:
+        return COUNTER.unpack_from(self._mmap, offset)[0]
+
+    def _store(self, offset: int, value: int) -> None:
+        COUNTER.pack_into(self._mmap, offset, value)
+
+    def _ring(self) -> None:
+        try:
+            os.write(self._doorbell, b"\x00")
+        except BlockingIOError: # Doorbell FIFO is full, so a wakeup is already pending
+            pass
+
+    def _drain_doorbell(self) -> None:
+        try:
+            while os.read(self._doorbell, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+
+class ShmChannel:
+    """
+    A pair of RingBuffers: requests from the web server to the database server, and responses back.
+    """
+
+    def __init__(self, name: str=DEFAULT_CHANNEL_NAME, create: bool=False, capacity: int=DEFAULT_RING_CAPACITY, shm_dir: str=SHM_DIR):
+        """
+        Args:
+            name (str): Channel name. The buffer files are named after it.
+            create (bool): True on the side that sets the channel up (the database server), False on the side that joins it.
+            capacity (int): Bytes in each direction's buffer, when creating.
+            shm_dir (str): Directory for the buffer files. Should be a RAM-backed filesystem.
+        """
+        self.requests = RingBuffer(os.path.join(shm_dir, f"{name}_web_to_db"), capacity=capacity, create=create)
+        self.responses = RingBuffer(os.path.join(shm_dir, f"{name}_db_to_web"), capacity=capacity, create=create)
+
+    def close(self) -> None:
+        self.requests.close()
+        self.responses.close()
+
+    def unlink(self) -> None:
+        self.requests.unlink()
+        self.responses.unlink()
+
+
+### Benchmark ###
+
+def _shm_echo(name: str, shm_dir: str, ready) -> None:
+    """Child process for the benchmark. Echoes every request byte back as a response byte until it reads an empty message."""
+    channel = ShmChannel(name, create=True, shm_dir=shm_dir)
+    ready.set()
+    try:
+        while True:
+            channel.requests.wait_readable()
+            data = channel.requests.read()
+            if data == b"\x00":
+                return
+            channel.responses.write_all(data)
+    finally:
+        channel.close()
+        channel.unlink()
+
+def _fifo_echo(request_fifo: str, response_fifo: str) -> None:
+    """Child process for the benchmark. Same as _shm_echo, over a pair of named pipes."""
+    fd_in = os.open(request_fifo, os.O_RDONLY)
+    fd_out = os.open(response_fifo, os.O_WRONLY)
+    try:
+        while True:
+            data = os.read(fd_in, 65536)
+            if data == b"\x00" or not data:
+                return
+            os.write(fd_out, data)
+    finally:
+        os.close(fd_in)
+        os.close(fd_out)
+
+def _time_round_trips(send, receive, message: bytes, round_trips: int) -> LatencyHistogram:
+    histogram = LatencyHistogram()
+    for i in range(round_trips):
+        start_time = time.perf_counter()
+        send(message)
+        received = 0
+        while received < len(message):
+            received += len(receive())
+        histogram.record(time.perf_counter() - start_time)
+    return histogram
+
+def benchmark_shm(round_trips: int, message_size: int) -> dict:
+    """Returns round trip latency stats, in milliseconds, for echoing message_size bytes through a ShmChannel."""
+    name = f"shm_benchmark_{os.getpid()}"
+    ready = multiprocessing.Event()
+    echo = multiprocessing.Process(target=_shm_echo, args=(name, SHM_DIR, ready))
+    echo.start()
+    ready.wait()
+    channel = ShmChannel(name, shm_dir=SHM_DIR)
+
+    def receive():
+        channel.responses.wait_readable()
+        return channel.responses.read()
+
+    try:
+        histogram = _time_round_trips(channel.requests.write_all, receive, b"x" * message_size, round_trips)
+        channel.requests.write_all(b"\x00")
+    finally:
+        echo.join()
+        channel.close()
+    return histogram.summary()
+
+def benchmark_fifo(round_trips: int, message_size: int) -> dict:
+    """Returns round trip latency stats, in milliseconds, for echoing message_size bytes through a pair of named pipes."""
+    fifo_dir = tempfile.mkdtemp()
+    request_fifo, response_fifo = os.path.join(fifo_dir, "requests"), os.path.join(fifo_dir, "responses")
+    os.mkfifo(request_fifo)
+    os.mkfifo(response_fifo)
+    echo = multiprocessing.Process(target=_fifo_echo, args=(request_fifo, response_fifo))
+    echo.start()
+    fd_out = os.open(request_fifo, os.O_WRONLY)
+    fd_in = os.open(response_fifo, os.O_RDONLY)
+    try:
+        histogram = _time_round_trips(lambda data: os.write(fd_out, data), lambda: os.read(fd_in, 65536), b"x" * message_size, round_trips)
+        os.write(fd_out, b"\x00")
+    finally:
+        echo.join()
+        os.close(fd_out)
+        os.close(fd_in)
+        os.remove(request_fifo)
+        os.remove(response_fifo)
+        os.rmdir(fifo_dir)
+    return histogram.summary()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare round trip latency of the shared-memory and named-pipe transports.")
+    parser.add_argument("--round-trips", type=int, default=10000)
+    parser.add_argument("--message-size", type=int, default=128, help="Bytes per message, about the size of a small request")
+    args = parser.parse_args()
+    print(json.dumps({
+        "round_trips": args.round_trips,
+        "message_size": args.message_size,
+        "fifo_latency_ms": benchmark_fifo(args.round_trips, args.message_size),
+        "shm_latency_ms": benchmark_shm(args.round_trips, args.message_size)
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""In-memory spatial indexes over stored objects' locations, for geographic queries that shouldn't scan every object."""
+
+import heapq, math
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+import geo_utils
+from project_constants import *
+
+GRID_CELL_DEGREES = 0.01 # Cell edge length. About 1.1 km north-south, and less east-west away from the equator.
+
+
+class GeoGridIndex:
+    """
+    Buckets object ids into fixed-size latitude-longitude cells. A radius query computes distances only to the
+    objects in the cells that overlap the circle's bounding box, so its cost scales with how many objects are
+    near the query location rather than with how many there are in total.
+    """
+
+    def __init__(self, cell_degrees: float=GRID_CELL_DEGREES):
+        self._cell_degrees = cell_degrees
+        self._lon_cell_count = math.ceil(360 / cell_degrees)
+        self._cells = {} # Keys are (lat_cell, lon_cell) tuples, values are dicts mapping object ids to (lat, lon) tuples
+        self._cell_of = {} # Keys are object ids, values are the cell each one is in
+        self.stamp = None # Owner's marker for which version of the stored data the index reflects
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    def __contains__(self, object_id):
+        return object_id in self._cell_of
+
+    def insert(self, object_id: str, location: tuple) -> None:
+        """Adds object_id at location, moving it if it's already indexed."""
+        self.remove(object_id)
+        location = (float(location[0]), float(location[1]))
+        cell = self._cell(location)
+        self._cells.setdefault(cell, {})[object_id] = location
+        self._cell_of[object_id] = cell
+
+    def remove(self, object_id: str) -> None:
+        """Removes object_id if it's indexed."""
+        cell = self._cell_of.pop(object_id, None)
+        if cell is None:
+            return
+        del self._cells[cell][object_id]
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def query_radius(self, location: tuple, radius: float) -> List[Tuple[float, str]]:
+        """
+        Returns the indexed objects less than radius meters from location.
+
+        Returns:
+            (list[tuple[float, str]]): (distance, object_id) tuples sorted from nearest to farthest.
+        """
+        object_ids, locations = [], []
+        for cell in self._covering_cells(location, radius):
+            for object_id, object_location in self._cells[cell].items():
+                object_ids.append(object_id)
+                locations.append(object_location)
+        if not object_ids:
+            return []
+        indices, distances = geo_utils.query_radius(location, locations, radius) # Covering cells overshoot the circle's bounding box
+        return sorted((float(distances[i]), object_ids[indices[i]]) for i in range(len(indices)))
+
+    def iter_nearest(self, location: tuple) -> Iterator[Tuple[float, str]]:
+        """
+        Yields every indexed object as a (distance, object_id) tuple, from nearest to farthest. Searches outward in
+        square rings of cells, so a caller that stops early never touches the objects farther out, and each object's
+        distance is computed at most once however far the search goes.
+        """
+        center_lat_cell, center_lon_cell = self._cell(location)
+        visited_cells = set()
+        found = [] # Min-heap of (distance, object_id) tuples not yet yielded
+        ring = 0
+        while len(visited_cells) < len(self._cells):
+            ring_cells = self._ring_cells(center_lat_cell, center_lon_cell, ring)
+            if len(ring_cells) > len(self._cells) - len(visited_cells): # Cheaper to take every remaining occupied cell at once
+                ring_cells = [cell for cell in self._cells if cell not in visited_cells]
+            object_ids, locations = [], []
+            for cell in ring_cells:
+                if cell in self._cells and cell not in visited_cells:
+                    visited_cells.add(cell)
+                    object_ids.extend(self._cells[cell])
+                    locations.extend(self._cells[cell].values())
+            if object_ids:
+                distances = geo_utils.haversine_one_to_many(location, locations)
+                for i in range(len(object_ids)):
+                    heapq.heappush(found, (float(distances[i]), object_ids[i]))
+            safe_radius = self._searched_radius(location, center_lat_cell, center_lon_cell, ring)
+            while found and found[0][0] < safe_radius: # Nothing outside the searched square can be closer than safe_radius
+                yield heapq.heappop(found)
+            ring += 1
+        while found:
+            yield heapq.heappop(found)
+
+    ### Private methods ###
+
+    def _ring_cells(self, center_lat_cell: int, center_lon_cell: int, ring: int) -> list:
+        """Returns the cells on the square ring ring cells out from the center cell, wrapping around in longitude."""
+        if ring == 0:
+            return [(center_lat_cell, center_lon_cell)]
+        cells = []
+        for lat_cell in range(center_lat_cell - ring, center_lat_cell + ring + 1):
+            if lat_cell in (center_lat_cell - ring, center_lat_cell + ring): # Top and bottom edges take the whole row
+                lon_offsets = range(-ring, ring + 1)
+            else:
+                lon_offsets = (-ring, ring)
+            cells.extend((lat_cell, (center_lon_cell + lon_offset) % self._lon_cell_count) for lon_offset in lon_offsets)
+        return cells
+
+    def _searched_radius(self, location: tuple, center_lat_cell: int, center_lon_cell: int, ring: int) -> float:
+        """Returns the distance in meters from location to the nearest point outside the square of cells searched so far."""
+        angles = []
+        south_edge, north_edge = (center_lat_cell - ring) * self._cell_degrees, (center_lat_cell + ring + 1) * self._cell_degrees
+        if south_edge > -90:
+            angles.append(math.radians(location[0] - south_edge))
+        if north_edge < 90:
+            angles.append(math.radians(north_edge - location[0]))
+        if 2 * ring + 1 < self._lon_cell_count:
+            west_edge, east_edge = (center_lon_cell - ring) * self._cell_degrees, (center_lon_cell + ring + 1) * self._cell_degrees
+            lon_offset = math.radians(min(90.0, location[1] % 360 - west_edge, east_edge - location[1] % 360))
+            angles.append(math.asin(math.cos(math.radians(location[0])) * math.sin(lon_offset))) # Distance to the nearer edge meridian
+        if not angles:
+            return math.inf
+        return min(angles) * EARTH_RADIUS_KM * 1000
+
+    def _cell(self, location: tuple) -> tuple:
+        return (math.floor(location[0] / self._cell_degrees), math.floor(location[1] / self._cell_degrees) % self._lon_cell_count)
+
+    def _covering_cells(self, location: tuple, radius: float) -> list:
+        """Returns the non-empty cells that overlap the bounding box of the circle of radius meters around location."""
+        boxes = geo_utils.bounding_box(location, radius)
+        min_lat_cell = math.floor(boxes[0][0] / self._cell_degrees)
+        max_lat_cell = math.floor(boxes[0][1] / self._cell_degrees)
+        lon_cells = set()
+        for min_lat, max_lat, min_lon, max_lon in boxes: # Two boxes if the circle crosses the antimeridian
+            first_lon_cell, last_lon_cell = math.floor(min_lon / self._cell_degrees), math.floor(max_lon / self._cell_degrees)
+            lon_cells.update(lon_cell % self._lon_cell_count for lon_cell in range(first_lon_cell, last_lon_cell + 1))
+        if len(lon_cells) >= self._lon_cell_count: # Spans every longitude, e.g. because the circle contains a pole
+            lon_cells = None
+
+        lat_cell_count = max_lat_cell - min_lat_cell + 1
+        covering_cell_count = lat_cell_count * (len(lon_cells) if lon_cells is not None else self._lon_cell_count)
+        if covering_cell_count > len(self._cells): # Cheaper to filter the occupied cells than to enumerate the covering ones
+            return [cell for cell in self._cells if min_lat_cell <= cell[0] <= max_lat_cell and (lon_cells is None or cell[1] in lon_cells)]
+        return [(lat_cell, lon_cell) for lat_cell in range(min_lat_cell, max_lat_cell + 1) for lon_cell in (lon_cells if lon_cells is not None else range(self._lon_cell_count))
+                if (lat_cell, lon_cell) in self._cells]
+
+
+NAME_LOCATION_CELL_DEGREES = 0.001 # About 110 m north-south, so a short radius reaches only the cells next to the query's
+
+
+class NameLocationIndex:
+    """
+    Buckets object ids by normalized name and coarse latitude-longitude cell, for finding an object with a given name
+    near a given location. A lookup probes only the cells with that name that overlap the radius's bounding box,
+    which for short radii is at most the 3x3 block of cells around the query, however many objects are indexed.
+    """
+
+    def __init__(self, cell_degrees: float=NAME_LOCATION_CELL_DEGREES):
+        self._cell_degrees = cell_degrees
+        self._lon_cell_count = math.ceil(360 / cell_degrees)
+        self._buckets = {} # Keys are (normalized_name, lat_cell, lon_cell) tuples, values are dicts mapping object ids to (lat, lon) tuples
+        self._key_of = {} # Keys are object ids, values are the bucket key each one is in
+        self.stamp = None # Owner's marker for which version of the stored data the index reflects
+
+    def __len__(self):
+        return len(self._key_of)
+
+    def __contains__(self, object_id):
+        return object_id in self._key_of
+
+    def insert(self, object_id: str, location: tuple, name: str) -> None:
+        """Adds object_id with name at location, moving it if it's already indexed."""
+        self.remove(object_id)
+        location = (float(location[0]), float(location[1]))
+        key = (normalize_name(name),) + self._cell(location)
+        self._buckets.setdefault(key, {})[object_id] = location
+        self._key_of[object_id] = key
+
+    def remove(self, object_id: str) -> None:
+        """Removes object_id if it's indexed."""
+        key = self._key_of.pop(object_id, None)
+        if key is None:
+            return
+        del self._buckets[key][object_id]
+        if not self._buckets[key]:
+            del self._buckets[key]
+
+    def find(self, name: str, location: tuple, radius: float) -> str:
+        """Returns the id of an indexed object with name less than radius meters from location, or None if there isn't one."""
+        name = normalize_name(name)
+        covering_cells = self._covering_cells(location, radius)
+        if covering_cells is None: # Near a pole, where the box spans every longitude
+            buckets = [bucket for key, bucket in self._buckets.items() if key[0] == name]
+        else:
+            buckets = [self._buckets[(name,) + cell] for cell in covering_cells if (name,) + cell in self._buckets]
+        for bucket in buckets:
+            object_ids = list(bucket)
+            indices, distances = geo_utils.query_radius(location, list(bucket.values()), radius)
+            if len(indices):
+                return object_ids[indices[0]]
+        return None
+
+    ### Private methods ###
+
+    def _cell(self, location: tuple) -> tuple:
+        return (math.floor(location[0] / self._cell_degrees), math.floor(location[1] / self._cell_degrees) % self._lon_cell_count)
+
+    def _covering_cells(self, location: tuple, radius: float) -> set:
+        """Returns the cells overlapping the bounding box of the circle of radius meters around location, or None if that's more than there are buckets."""
+        boxes = geo_utils.bounding_box(location, radius)
+        cell_count = sum((max_lat - min_lat) * (max_lon - min_lon) for min_lat, max_lat, min_lon, max_lon in boxes) / self._cell_degrees ** 2
+        if cell_count > len(self._buckets) + 9:
+            return None
+        cells = set()
+        for min_lat, max_lat, min_lon, max_lon in boxes:
+            lat_cells = range(math.floor(min_lat / self._cell_degrees), math.floor(max_lat / self._cell_degrees) + 1)
+            lon_cells = range(math.floor(min_lon / self._cell_degrees), math.floor(max_lon / self._cell_degrees) + 1)
+            cells.update((lat_cell, lon_cell % self._lon_cell_count) for lat_cell in lat_cells for lon_cell in lon_cells)
+        return cells
+
+
+def normalize_name(name: str) -> str:
+    """Returns name with case and runs of whitespace normalized, so trivially different spellings index together."""
+    return " ".join(name.casefold().split())
+
+
+KD_TREE_LEAF_SIZE = 16 # Max points in a leaf, below which scanning beats splitting further
+KD_TREE_REBUILD_FRACTION = 0.25 # Rebuild once pending inserts plus tombstones exceed this fraction of the tree's points
+KD_TREE_MIN_REBUILD = 64 # ...or this many, whichever is larger, so tiny trees aren't rebuilt on every write
+
+
+class UnitVectorKDTree:
+    """
+    KD-tree over locations converted to 3D unit vectors, for k-nearest-neighbor queries. Straight-line (chord)
+    distance between unit vectors increases with great circle distance, so nearest by chord is nearest on the globe,
+    with no special cases at the antimeridian or the poles.
+
+    Writes don't restructure the tree. Inserts go into a pending buffer that queries scan directly, and removals leave
+    tombstones that queries skip. The tree is rebuilt from scratch once those pile up, so writes are amortized O(log n).
+    """
+
+    def __init__(self, leaf_size: int=KD_TREE_LEAF_SIZE):
+        self._leaf_size = leaf_size
+        self._locations = {} # Keys are object ids, values are (lat, lon) tuples, for every live object
+        self._tree_ids = [] # Object id of each point in the tree, in tree order
+        self._tree_points = np.empty((0, 3)) # Unit vector of each point in the tree, in tree order
+        self._tree_index_of = {} # Keys are ids of live objects in the tree, values are their positions in tree order
+        self._nodes = [] # [split_dim, split_value, left_node, right_node, start, end] lists. Leaves have split_dim -1.
+        self._tombstones = set() # Tree positions of objects removed or moved since the last rebuild
+        self._pending = {} # Keys are ids of objects inserted or moved since the last rebuild, values are their unit vectors
+        self.stamp = None # Owner's marker for which version of the stored data the index reflects
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, object_id):
+        return object_id in self._locations
+
+    def insert(self, object_id: str, location: tuple) -> None:
+        """Adds object_id at location, moving it if it's already indexed."""
+        self.remove(object_id)
+        location = (float(location[0]), float(location[1]))
+        self._locations[object_id] = location
+        self._pending[object_id] = unit_vectors([location])[0]
+        self._rebuild_if_needed()
+
+    def remove(self, object_id: str) -> None:
+        """Removes object_id if it's indexed."""
+        if self._locations.pop(object_id, None) is None:
+            return
+        self._pending.pop(object_id, None)
+        if object_id in self._tree_index_of:
+            self._tombstones.add(self._tree_index_of.pop(object_id))
+        self._rebuild_if_needed()
+
+    def query_knn(self, location: tuple, k: int) -> List[Tuple[float, str]]:
+        """
+        Returns the k indexed objects nearest to location, or all of them if there are fewer than k.
+
+        Returns:
+            (list[tuple[float, str]]): (distance in meters, object_id) tuples sorted from nearest to farthest.
+        """
+        if k < 1 or not self._locations:
+            return []
+        query = unit_vectors([location])[0]
+        nearest = [] # Max-heap of the best k so far, as (-squared_chord, object_id) tuples
+        for object_id, point in self._pending.items():
+            self._offer(nearest, k, float(np.dot(point - query, point - query)), object_id)
+        if self._nodes:
+            self._search(0, query, k, nearest)
+        object_ids = [object_id for negative_squared_chord, object_id in sorted(nearest, reverse=True)]
+        distances = geo_utils.haversine_one_to_many(location, [self._locations[object_id] for object_id in object_ids]) # Same formula as every other query
+        return [(float(distances[i]), object_ids[i]) for i in range(len(object_ids))]
+
+    def rebuild(self) -> None:
+        """Rebuilds the tree from every live object, emptying the pending buffer and tombstones."""
+        object_ids = list(self._locations)
+        points = unit_vectors([self._locations[object_id] for object_id in object_ids]) if object_ids else np.empty((0, 3))
+        order = np.arange(len(object_ids))
+        self._nodes = []
+        if object_ids:
+            self._build(points, order, 0, len(order))
+        self._tree_points = points[order]
+        self._tree_ids = [object_ids[i] for i in order]
+        self._tree_index_of = {object_id: position for position, object_id in enumerate(self._tree_ids)}
+        self._tombstones = set()
+        self._pending = {}
+
+    ### Private methods ###
+
+    def _rebuild_if_needed(self) -> None:
+        if len(self._pending) + len(self._tombstones) > max(KD_TREE_MIN_REBUILD, KD_TREE_REBUILD_FRACTION * len(self._tree_ids)):
+            self.rebuild()
+
+    def _build(self, points: np.ndarray, order: np.ndarray, start: int, end: int) -> int:
+        """Builds the subtree over order[start:end], partitioning that slice of order in place, and returns its node number."""
+        node_number = len(self._nodes)
+        if end - start <= self._leaf_size:
+            self._nodes.append([-1, 0.0, -1, -1, start, end])
+            return node_number
+        subtree_points = points[order[start:end]]
+        split_dim = int(np.argmax(subtree_points.max(axis=0) - subtree_points.min(axis=0))) # Split along the widest spread
+        middle = (end - start) // 2
+        partition = np.argpartition(subtree_points[:, split_dim], middle)
+        order[start:end] = order[start:end][partition]
+        split_value = float(points[order[start + middle], split_dim])
+        node = [split_dim, split_value, -1, -1, start, end]
+        self._nodes.append(node)
+        node[2] = self._build(points, order, start, start + middle)
+        node[3] = self._build(points, order, start + middle, end)
+        return node_number
+
+    def _search(self, node_number: int, query: np.ndarray, k: int, nearest: list) -> None:
+        split_dim, split_value, left, right, start, end = self._nodes[node_number]
+        if split_dim == -1:
+            differences = self._tree_points[start:end] - query
+            squared_chords = np.einsum("ij,ij->i", differences, differences)
+            for offset in np.argsort(squared_chords):
+                position = start + int(offset)
+                if position in self._tombstones:
+                    continue
+                if not self._offer(nearest, k, float(squared_chords[offset]), self._tree_ids[position]):
+                    break # Sorted, so nothing later in this leaf can make it in either
+            return
+        plane_distance = query[split_dim] - split_value
+        near, far = (left, right) if plane_distance < 0 else (right, left)
+        self._search(near, query, k, nearest)
+        if len(nearest) < k or plane_distance ** 2 < -nearest[0][0]: # The far side could still hold something closer
+            self._search(far, query, k, nearest)
+
+    def _offer(self, nearest: list, k: int, squared_chord: float, object_id: str) -> bool:
+        """Adds a candidate to the heap of the best k if it qualifies, and returns whether it did."""
+        if len(nearest) < k:
+            heapq.heappush(nearest, (-squared_chord, object_id))
+            return True
+        if squared_chord < -nearest[0][0]:
+            heapq.heapreplace(nearest, (-squared_chord, object_id))
+            return True
+        return False
+
+
+def unit_vectors(locations) -> np.ndarray:
+    """Returns an (n, 3) array of the unit vectors pointing from the Earth's center to each (lat, lon) location."""
+    locations = np.radians(np.asarray(locations, dtype=float).reshape(-1, 2))
+    lats, lons = locations[:, 0], locations[:, 1]
+    return np.column_stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)))
@@ -0,0 +1,88 @@
+"""
+Fixed-dimension vectors of User tastes, for ranking candidates by how similar their tastes are to the active User's.
+
+Each dimension is one keyword from the tastes keywords vocabulary. A User's value in a dimension is their strength for
+that taste, scaled down when it rests on few datapoints. Tastes outside the vocabulary are left out.
+"""
+
+from typing import List
+
+import numpy as np
+
+import models.nlp_resources
+
+_vocabulary_index = None
+
+def vocabulary_index() -> dict:
+    """
+    Returns the shared dict mapping each tastes keyword to its dimension. Callers must not modify it.
+    """
+    global _vocabulary_index
+    if _vocabulary_index is None:
+        _vocabulary_index = {keyword: i for i, keyword in enumerate(models.nlp_resources.tastes_keywords())}
+    return _vocabulary_index
+
+def taste_vector(tastes: dict) -> np.ndarray:
+    """
+    Returns the taste vector for one User's tastes data.
+
+    Args:
+        tastes (dict): Tastes in the User model's stored format, {taste_name (str): [strength (float), datapoints (int)]}.
+
+    Returns:
+        (np.ndarray): Vector with one float per tastes keyword.
+    """
+    return taste_matrix([tastes])[0]
+
+def taste_matrix(tastes_list: List[dict]) -> np.ndarray:
+    """
+    Returns the taste vectors for many Users' tastes data, one row per User, in the order given.
+    """
+    index = vocabulary_index()
+    matrix = np.zeros((len(tastes_list), len(index)))
+    for row, tastes in enumerate(tastes_list):
+        for taste_name, (strength, datapoints) in tastes.items():
+            column = index.get(taste_name)
+            if column is not None:
+                matrix[row, column] = strength * datapoints / (datapoints + 1) # One datapoint counts half, many count nearly in full
+    return matrix
+
+def cosine_similarities(vector: np.ndarray, matrix: np.ndarray, weights: np.ndarray=None) -> np.ndarray:
+    """
+    Computes the weighted cosine similarity of vector to each row of matrix in one pass.
+
+    Args:
+        vector (np.ndarray): Taste vector of the active User.
+        matrix (np.ndarray): Taste vectors of the candidates, one per row.
+        weights (np.ndarray): Nonnegative weight per dimension. None weights every dimension equally.
+
+    Returns:
+        (np.ndarray): Similarity between -1.0 and 1.0 for each row. 0.0 for rows, or a vector, with no tastes in the vocabulary.
+    """
+    if weights is None:
+        weights = np.ones(len(vector))
+    weighted_vector = vector * weights
+    dot_products = matrix @ weighted_vector
+    norms = np.sqrt(np.sum(matrix * matrix * weights, axis=1)) * np.sqrt(np.dot(weighted_vector, vector))
+    similarities = np.zeros(len(matrix))
+    nonzero = norms > 0
+    similarities[nonzero] = dot_products[nonzero] / norms[nonzero]
+    return similarities
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the indices of the k highest scores, highest first. Ties go to the lower index, so callers can pass scores
+    in order of a secondary ranking, such as distance, to break them.
+
+    Uses a partial selection, so only the k selected scores get sorted.
+    """
+    if k >= len(scores):
+        selected = np.arange(len(scores))
+    elif k <= 0:
+        return np.array([], dtype=int)
+    else:
+        kth_score = -np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(scores > kth_score) # Fewer than k
+        tied = np.flatnonzero(scores == kth_score)[:k - len(above)] # Lowest-index ties fill the rest
+        selected = np.concatenate((above, tied))
+    return selected[np.lexsort((selected, -scores[selected]))]
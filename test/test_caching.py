@@ -0,0 +1,87 @@
+import unittest
+import unittest.mock
+
+from caching import LRUCache, ResponseCache, CircleCache
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")  # "b" is now least recently used
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache(max_entries=2)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("b")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(max_entries=3)
+        self.cache.put_response("get_login_user_info", {"user_id": "1"}, {"name": "Azura"}, [("user", "1")])
+        self.cache.put_response("get_matches_list", {"user_id": "1"}, [{"match_id": "m1"}], [("user", "1"), ("user", "2")])
+        self.cache.put_response("get_login_user_info", {"user_id": "2"}, {"name": "Boethiah"}, [("user", "2")])
+
+    def test_invalidate_drops_only_dependent_entries(self):
+        """Does a write to one object drop exactly the responses built from it?"""
+        self.cache.invalidate([("user", "2")])
+        self.assertEqual(self.cache.get_response("get_login_user_info", {"user_id": "1"}), {"name": "Azura"})
+        self.assertIsNone(self.cache.get_response("get_matches_list", {"user_id": "1"}))
+        self.assertIsNone(self.cache.get_response("get_login_user_info", {"user_id": "2"}))
+        self.assertEqual(self.cache.invalidations, 2)
+
+    def test_returned_response_is_a_copy(self):
+        response = self.cache.get_response("get_login_user_info", {"user_id": "1"})
+        response["name"] = "corge"
+        self.assertEqual(self.cache.get_response("get_login_user_info", {"user_id": "1"}), {"name": "Azura"})
+
+    def test_eviction_forgets_tags(self):
+        """Once an entry is evicted, does invalidating its tags leave the other entries alone?"""
+        self.cache.put_response("get_login_user_info", {"user_id": "3"}, {"name": "Hircine"}, [("user", "3")])  # Evicts user 1's login info
+        self.cache.invalidate([("user", "1")])
+        self.assertEqual(self.cache.invalidations, 1)  # Only the matches list was still cached
+        self.assertEqual(len(self.cache), 2)
+
+class TestCircleCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = CircleCache(max_entries=2, ttl=60)
+        self.center = (40.7, -74.0)
+        self.items = ["near", "mid", "far"]
+        self.locations = [(40.7001, -74.0), (40.705, -74.0), (40.715, -74.0)] # About 11 m, 560 m, and 1.7 km north of center
+        self.cache.put_circle("stored", self.center, 2000, self.items, self.locations)
+
+    def test_contained_query_filters_cached_results(self):
+        results = self.cache.get_within("stored", (40.7001, -74.0), 1000)
+        self.assertEqual([item for distance, item in results], ["near", "mid"])
+        self.assertAlmostEqual(results[0][0], 0.0)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_uncontained_query_misses(self):
+        self.assertIsNone(self.cache.get_within("stored", (40.71, -74.0), 1000)) # Pokes out of the cached circle
+        self.assertIsNone(self.cache.get_within("yelp", self.center, 100)) # Other namespace
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_expires(self):
+        with unittest.mock.patch("caching.time.time", return_value=10 ** 12):
+            self.assertIsNone(self.cache.get_within("stored", self.center, 100))
+        self.assertEqual(self.cache.expirations, 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate_location(self):
+        self.cache.put_circle("yelp", (51.5, -0.1), 2000, [], [])
+        self.cache.invalidate_location((40.701, -74.0))
+        self.assertIsNone(self.cache.get_within("stored", self.center, 100))
+        self.assertEqual(self.cache.get_within("yelp", (51.5, -0.1), 100), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,12 @@
 import unittest
+import unittest.mock
 import json, time, datetime
 from freezegun import freeze_time
 
 from project_constants import *
-from database_api import DatabaseAPI
+from database_api import DatabaseAPI, DeadlineExceeded
+from caching import ResponseCache
+import caching
 import models
 import model_interfaces
 
@@ -394,6 +397,21 @@ class TestHelloWorldThings(unittest.TestCase):
         self.assertIsInstance(distance, float)
         self.assertIsInstance(datespot, models.Datespot)
     
+    def test_get_datespots_near_circle_cache(self):
+        """Is a search inside a recently searched circle answered from the circle cache, with the same results?"""
+        circle_cache = caching.CircleCache()
+        db = DatabaseAPI(json_map_filename=TEST_JSON_DB_NAME, circle_cache=circle_cache)
+        location = (40.737291166191476, -74.00704685527774)
+        wide_results = db.get_datespots_near({"location": location, "radius": 4000})
+        with unittest.mock.patch.object(model_interfaces.DatespotModelInterface, "query_datespot_objs_near") as query_datespot_objs_near, \
+                unittest.mock.patch.object(model_interfaces.DatespotModelInterface, "lookup_obj") as lookup_obj:
+            narrow_results = db.get_datespots_near({"location": location, "radius": 3000})
+        query_datespot_objs_near.assert_not_called()
+        lookup_obj.assert_not_called()  # Built from one read, not one per cached datespot
+        self.assertEqual(circle_cache.hits, 1)
+        self.assertEqual([datespot.id for distance, datespot in narrow_results],
+                        [datespot.id for distance, datespot in wide_results if distance < 3000])
+
     ### Tests for get_datespot_suggestions() ###
 
     def test_get_candidate_datespots(self):
@@ -414,15 +432,31 @@ class TestHelloWorldThings(unittest.TestCase):
         self.assertGreater(len(results), 0)
         # Terrezanos should be the only Datespot known to the DB here:
         self.assertEqual(results[0][1].id, self.terrezanos_id)
+
+    def test_get_candidate_datespots_reads_datafile_once(self):
+        """Are the candidates built from one read of the datespot datafile, rather than one read per candidate?"""
+        self.db.post_object({"object_model_name": "datespot", "object_data": {"name": "Domenico's", "location": self.boethiah_location}})
+        read_json = model_interfaces.DatespotModelInterface._read_json
+        with unittest.mock.patch.object(model_interfaces.DatespotModelInterface, "_read_json", autospec=True, side_effect=read_json) as counted_read_json:
+            results = self.db.get_candidate_datespots({"match_id": self.match_id_azura_boethiah})
+        self.assertGreater(len(results), 1)
+        self.assertLessEqual(counted_read_json.call_count, 1)
+
+    def test_get_candidate_datespots_stops_at_passed_deadline(self):
+        """Does the widening-radius search give up once the deadline has passed, instead of widening to a half-Earth radius?"""
+        expired_db = DatabaseAPI(json_map_filename=TEST_JSON_DB_NAME, deadline=time.time() - 1)
+        with self.assertRaises(DeadlineExceeded):  # Only one Datespot is known, so the search would otherwise keep widening
+            expired_db.get_candidate_datespots({"match_id": self.match_id_azura_boethiah})
     
     ### Tests for other public methods ###
-    def test_get_next_candidate(self):  # We have two Users in the DB, so one will be the other's candidate
+    def test_get_next_candidate(self):  # Azura already matched with the other two Users, so only the new one is a candidate
+        self.db.post_object({"object_model_name": "user", "object_data": {"name": "Mephala", "current_location": self.boethiah_location}})
         query_data = {
             "user_id": self.azura_id
         }
         result = self.db.get_next_candidate(query_data)
         candidate_name = result["name"]
-        self.assertEqual(self.boethiah_name, candidate_name)
+        self.assertEqual("Mephala", candidate_name)
 
     # TODO Post / get obj / get json for all of:
     #     user
@@ -465,6 +499,42 @@ class TestHelloWorldThings(unittest.TestCase):
         actual_result_data = self.db.get_suggestions_list({"match_id": self.match_id_azura_boethiah})
         self.assertEqual(actual_result_data, expected_result_data)
     
+    def test_iter_matches_list_matches_get_matches_list(self):
+        """Does the generator version yield the same items as the list version?"""
+        query_data = {"user_id": self.azura_id}
+        self.assertEqual(list(self.db.iter_matches_list(query_data)), self.db.get_matches_list(query_data))
+
+    def test_iter_suggestions_list_caches_once_exhausted(self):
+        cached_db = DatabaseAPI(json_map_filename=TEST_JSON_DB_NAME, response_cache=ResponseCache())
+        query_data = {"match_id": self.match_id_azura_boethiah}
+        suggestions = cached_db.iter_suggestions_list(query_data)
+        first_suggestion = next(suggestions)
+        self.assertEqual(len(cached_db._response_cache), 0)  # Not cached while partway through
+        self.assertEqual([first_suggestion] + list(suggestions), cached_db.get_suggestions_list(query_data))
+        self.assertEqual(cached_db._response_cache.hits, 1)
+
+    ### Tests for the response cache ###
+
+    def test_cached_login_info_invalidated_by_decision(self):
+        """Is a cached response reused until a write that changes it, and then recomputed?"""
+        cached_db = DatabaseAPI(json_map_filename=TEST_JSON_DB_NAME, response_cache=ResponseCache())
+        query_data = {"user_id": self.azura_id}
+        first_response = cached_db.get_login_user_info(query_data)
+        self.assertEqual(cached_db.get_login_user_info(query_data), first_response)
+        self.assertEqual(cached_db._response_cache.hits, 1)
+
+        cached_db.post_decision({"user_id": self.azura_id, "candidate_id": self.hircine_id, "outcome": True})
+        updated_response = cached_db.get_login_user_info(query_data)
+        self.assertIn(self.hircine_id, updated_response["pending_likes"])
+        self.assertEqual(cached_db._response_cache.hits, 1)
+
+    def test_cached_matches_list_invalidated_by_new_match(self):
+        cached_db = DatabaseAPI(json_map_filename=TEST_JSON_DB_NAME, response_cache=ResponseCache())
+        query_data = {"user_id": self.boethiah_id}
+        self.assertEqual(len(cached_db.get_matches_list(query_data)), 1)
+        cached_db.post_object({"object_model_name": "match", "object_data": {"user1_id": self.boethiah_id, "user2_id": self.hircine_id}})
+        self.assertEqual(len(cached_db.get_matches_list(query_data)), 2)
+
     # TODO: Challenging/robust test cases for get suggestions, probably in separate setUp data.
     #   - No initial queries inside radius
     #   - Never any queries on earth somehow, to confirm the radius-doubling while loop breaks eventually.
@@ -1,9 +1,16 @@
 import unittest
 
-import json, copy, sys
+import json, copy, sys, os
+from unittest import mock
 
-from database_server import DatabaseServer
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from database_server import DatabaseServer, BINARY_FRAME_HEADER, BINARY_FRAME_MARKER, ENCODING_JSON, ENCODING_MSGPACK, STATUS_OVERLOADED, STATUS_DEADLINE_EXCEEDED, DEFAULT_STREAM_CHUNK_SIZE
 from database_api import DatabaseAPI
+import time
 
 # TODO rename to "database_listener.py"
 
@@ -76,4 +83,283 @@ class TestDatabaseServer(unittest.TestCase):
         response = self.server._dispatch_request(self.valid_request_json)
         actual_status_code = json.loads(response)["status_code"]
 
-        self.assertEqual(actual_status_code, expected_status_code)
\ No newline at end of file
+        self.assertEqual(actual_status_code, expected_status_code)
+    ### Tests for batch requests ###
+
+    def _batch_request_json(self, calls: list) -> str:
+        return json.dumps({
+            "packet_size": 200,
+            "body_json": {
+                "method": "batch",
+                "query_data": {"calls": calls}
+            }
+        })
+
+    def test_batch_returns_one_result_per_call_in_order(self):
+        """Does a batch request return a list with one result per call, in the order the calls were sent?"""
+        calls = [self.valid_request_body_dict, self.invalid_request_method_body_dict, self.valid_request_body_dict]
+        response = json.loads(self.server._dispatch_request(self._batch_request_json(calls)))
+        self.assertEqual(response["status_code"], 0)
+        results = response["body_json"]
+        self.assertEqual([result["status_code"] for result in results], [0, 1, 0])
+        expected_user_info = self.db.get_login_user_info(self.valid_request_body_dict["query_data"])
+        self.assertEqual(results[0]["body_json"], expected_user_info)
+        self.assertEqual(results[1]["body_json"], self.server._error_messages["invalid method"]("corge_grault"))
+
+    def test_batch_call_without_query_data_returns_error(self):
+        """Does a batch call missing its query data come back as an error, without failing the rest of the batch?"""
+        bad_call = {"method": "get_login_user_info", "foo": {}}
+        response = json.loads(self.server._dispatch_request(self._batch_request_json([bad_call, self.valid_request_body_dict])))
+        results = response["body_json"]
+        self.assertEqual(results[0], {"status_code": 1, "body_json": self.server._error_messages["malformed request"]("missing query_data")})
+        self.assertEqual(results[1]["status_code"], 0)
+
+    def test_stream_without_query_data_returns_error(self):
+        server = DatabaseServer()
+        server._read_buffer += json.dumps({"stream": True, "body_json": {"method": "get_matches_list", "foo": {}}}).encode("utf-8")
+        server._enqueue_requests()
+        frames = [json.loads(response) for response in server._process_next_request()]
+        self.assertEqual([(frame["status_code"], frame["final"]) for frame in frames], [(1, True)])
+
+    def test_batch_rejects_nested_batch(self):
+        """Does a batch call that is itself a batch come back as an error without failing the whole batch?"""
+        nested_call = {"method": "batch", "query_data": {"calls": [self.valid_request_body_dict]}}
+        response = json.loads(self.server._dispatch_request(self._batch_request_json([nested_call, self.valid_request_body_dict])))
+        results = response["body_json"]
+        self.assertEqual(results[0], {"status_code": 1, "body_json": self.server._error_messages["nested batch"]()})
+        self.assertEqual(results[1]["status_code"], 0)
+
+    def test_batch_without_calls_list_returns_error(self):
+        request_json = json.dumps({"packet_size": 200, "body_json": {"method": "batch", "query_data": {}}})
+        response = json.loads(self.server._dispatch_request(request_json))
+        self.assertEqual(response["status_code"], 1)
+        self.assertEqual(response["body_json"], self.server._error_messages["invalid batch"]())
+
+    ### Tests for response encoding and request framing ###
+
+    def test_json_packet_size_is_response_byte_length(self):
+        """Does the JSON response state its own exact size in bytes?"""
+        response = self.server._dispatch_request(self.valid_request_json)
+        self.assertEqual(json.loads(response)["packet_size"], len(response.encode("utf-8")))
+
+    def test_json_packet_size_correct_across_digit_boundaries(self):
+        """Is the stated size still exact when adding the size's own digits pushes the length to a new power of ten?"""
+        for body_length in range(60, 140):
+            response = self.server._encode_response({"status_code": 0, "body_json": "x" * body_length})
+            self.assertEqual(json.loads(response)["packet_size"], len(response))
+
+    def test_split_request_frames_handles_concatenated_and_partial_frames(self):
+        """Are back-to-back JSON requests split apart, with a trailing partial request kept for the next read?"""
+        request_bytes = self.valid_request_json.encode("utf-8")
+        self.server._read_buffer = request_bytes + b" " + request_bytes + request_bytes[:10]
+        frames = self.server._split_request_frames()
+        self.assertEqual(frames, [(self.valid_request_dict, ENCODING_JSON, len(request_bytes)), (self.valid_request_dict, ENCODING_JSON, len(request_bytes) + 1)])
+        self.assertEqual(self.server._read_buffer, request_bytes[:10])
+        self.server._read_buffer += request_bytes[10:]
+        self.assertEqual(self.server._split_request_frames(), [(self.valid_request_dict, ENCODING_JSON, len(request_bytes))])
+        self.assertEqual(self.server._read_buffer, b"")
+
+    def test_split_request_frames_reports_malformed_json(self):
+        self.server._read_buffer = b'{"packet_size": 200, "body_json": }'
+        frames = self.server._split_request_frames()
+        self.assertEqual(len(frames), 1)
+        self.assertIn("error", frames[0][0])
+        response = json.loads(self.server._respond(*frames[0]))
+        self.assertEqual(response["status_code"], 1)
+
+    def test_respond_rejects_request_without_body(self):
+        response = json.loads(self.server._respond({"packet_size": 200}, ENCODING_JSON))
+        self.assertEqual(response["status_code"], 1)
+
+    def test_negotiate_encoding_falls_back_to_json(self):
+        request_json = json.dumps({"packet_size": 200, "body_json": {"method": "negotiate_encoding", "query_data": {"encodings": ["corge"]}}})
+        response = json.loads(self.server._dispatch_request(request_json))
+        self.assertEqual(response["body_json"], {"encoding": ENCODING_JSON})
+
+    @unittest.skipIf(msgpack is None, "msgpack not installed")
+    def test_negotiate_encoding_prefers_msgpack(self):
+        request_json = json.dumps({"packet_size": 200, "body_json": {"method": "negotiate_encoding", "query_data": {"encodings": ["msgpack", "json"]}}})
+        response = json.loads(self.server._dispatch_request(request_json))
+        self.assertEqual(response["body_json"], {"encoding": ENCODING_MSGPACK})
+
+    @unittest.skipIf(msgpack is None, "msgpack not installed")
+    def test_msgpack_request_gets_msgpack_response(self):
+        """Does a binary request frame get a binary response frame with the same content as the JSON response?"""
+        payload = msgpack.packb({"body_json": self.valid_request_body_dict})
+        self.server._read_buffer = BINARY_FRAME_HEADER.pack(BINARY_FRAME_MARKER, len(payload)) + payload
+        frames = self.server._split_request_frames()
+        self.assertEqual(frames, [({"body_json": self.valid_request_body_dict}, ENCODING_MSGPACK, BINARY_FRAME_HEADER.size + len(payload))])
+        response = self.server._respond(*frames[0])
+        marker, payload_size = BINARY_FRAME_HEADER.unpack_from(response)
+        self.assertEqual(marker, BINARY_FRAME_MARKER)
+        self.assertEqual(payload_size, len(response) - BINARY_FRAME_HEADER.size)
+        response_dict = msgpack.unpackb(response[BINARY_FRAME_HEADER.size:])
+        json_response_dict = json.loads(self.server._dispatch_request(self.valid_request_json))
+        del json_response_dict["packet_size"]
+        self.assertEqual(response_dict, json_response_dict)
+
+    ### Tests for server stats ###
+
+    def test_server_stats_count_calls_errors_and_bytes(self):
+        """Does get_server_stats report the calls, errors, and bytes of the requests handled so far?"""
+        request_bytes = self.valid_request_json.encode("utf-8")
+        invalid_request_json = json.dumps({"packet_size": 200, "body_json": self.invalid_request_method_body_dict})
+        self.server._read_buffer = request_bytes * 2 + invalid_request_json.encode("utf-8")
+        responses = [self.server._respond(*frame) for frame in self.server._split_request_frames()]
+        stats_request_json = json.dumps({"packet_size": 200, "body_json": {"method": "get_server_stats", "query_data": {}}})
+        stats = json.loads(self.server._dispatch_request(stats_request_json))["body_json"]
+
+        login_stats = stats["methods"]["get_login_user_info"]
+        self.assertEqual(login_stats["calls"], 2)
+        self.assertEqual(login_stats["errors"], 0)
+        self.assertEqual(login_stats["bytes_in"], 2 * len(request_bytes))
+        self.assertEqual(login_stats["bytes_out"], len(responses[0]) + len(responses[1]))
+        for percentile in ("p50", "p95", "p99"):
+            self.assertGreater(login_stats["latency_ms"][percentile], 0)
+            self.assertLessEqual(login_stats["latency_ms"][percentile], login_stats["latency_ms"]["max"])
+
+        invalid_stats = stats["methods"]["<invalid>"]  # The bogus method name shouldn't become a stats key
+        self.assertNotIn("corge_grault", stats["methods"])
+        self.assertEqual((invalid_stats["calls"], invalid_stats["errors"]), (1, 1))
+        self.assertEqual(stats["bytes_in"], sum(method_stats["bytes_in"] for method_stats in stats["methods"].values()))
+
+    def test_dump_stats_writes_stats_file(self):
+        stats_filename = "test/testing_server_stats.json"
+        server = DatabaseServer(stats_file=stats_filename, stats_interval=0)
+        server._dispatch_request(self.valid_request_json)
+        server._dump_stats()
+        with open(stats_filename) as fobj:
+            stats = json.load(fobj)
+        os.remove(stats_filename)
+        self.assertEqual(stats["methods"]["get_login_user_info"]["calls"], 1)
+
+    def test_signal_ready_writes_ready_file(self):
+        ready_filename = "test/testing_server_ready.json"
+        server = DatabaseServer(ready_file=ready_filename)
+        server.warm_up()
+        server._signal_ready()
+        with open(ready_filename) as fobj:
+            ready_info = json.load(fobj)
+        os.remove(ready_filename)
+        self.assertEqual(ready_info["pid"], os.getpid())
+        self.assertIsNotNone(ready_info["warm_up_seconds"])
+
+    ### Tests for admission control ###
+
+    def _request_bytes(self, method: str, query_data: dict, request_id: int) -> bytes:
+        return json.dumps({"packet_size": 200, "request_id": request_id, "body_json": {"method": method, "query_data": query_data}}).encode("utf-8")
+
+    def test_requests_over_class_limit_are_shed(self):
+        """Are requests beyond a class's queue limit answered "overloaded" right away, without affecting other classes?"""
+        server = DatabaseServer(queue_limits={"heavy": 2, "write": 1})
+        for request_id in range(4):
+            server._read_buffer += self._request_bytes("get_matches_list", {"user_id": "1"}, request_id)
+        server._read_buffer += self._request_bytes("get_login_user_info", {"user_id": "1"}, 4)
+        server._read_buffer += self._request_bytes("post_object", {"object_model_name": "user", "object_data": {}}, 5)
+        server._read_buffer += self._request_bytes("post_decision", {"user_id": "1", "candidate_id": "2", "outcome": True}, 6)
+        shed_responses = [json.loads(response) for response in server._enqueue_requests()]
+        self.assertEqual([response["status_code"] for response in shed_responses], [STATUS_OVERLOADED] * 3)
+        self.assertEqual([response["request_id"] for response in shed_responses], [2, 3, 6])
+        self.assertEqual(len(server._request_queue), 4)
+        self.assertEqual(server._server_stats()["methods"]["get_matches_list"]["shed"], 2)
+        self.assertEqual(server._server_stats()["methods"]["post_decision"]["shed"], 1)
+
+    def test_idle_jobs_refill_candidate_feeds_once_per_interval(self):
+        """Does the idle hook run the feed refill when it's due, and only then, and keep going after a failed refill?"""
+        server = DatabaseServer(feed_refill_interval=60, midpoint_refresh_interval=0)
+        with mock.patch.object(DatabaseAPI, "refill_candidate_feeds", side_effect=RuntimeError("corge")) as refill:
+            server._run_idle_jobs()
+            server._run_idle_jobs()
+        self.assertEqual(refill.call_count, 1)
+        self.assertEqual(server._server_stats()["methods"]["<refill_candidate_feeds>"]["errors"], 1)
+        with mock.patch.object(DatabaseAPI, "refill_candidate_feeds") as refill:
+            DatabaseServer(feed_refill_interval=0, midpoint_refresh_interval=0)._run_idle_jobs()
+        refill.assert_not_called()
+
+    def test_idle_jobs_recompute_match_midpoints_with_shared_cache(self):
+        """Does the midpoint recomputation get its own idle moment, and invalidate the server's shared response cache?"""
+        server = DatabaseServer(feed_refill_interval=60, midpoint_refresh_interval=60)
+        server._response_cache.put_response("get_suggestions_list", {"match_id": "m1"}, [], [("match", "m1")])
+        with mock.patch.object(DatabaseAPI, "refill_candidate_feeds", return_value=[]) as refill, \
+                mock.patch("model_interfaces.MatchModelInterface.recompute_midpoints", return_value=["m1"]) as recompute:
+            server._run_idle_jobs() # The refill comes first, and takes this whole idle moment
+            recompute.assert_not_called()
+            server._run_idle_jobs()
+            server._run_idle_jobs()
+        self.assertEqual((refill.call_count, recompute.call_count), (1, 1))
+        self.assertIsNone(server._response_cache.get_response("get_suggestions_list", {"match_id": "m1"}))
+        self.assertEqual(server._server_stats()["methods"]["<recompute_match_midpoints>"]["calls"], 1)
+
+    def test_interactive_requests_run_before_heavy_requests(self):
+        """Does a queued interactive request jump ahead of heavy requests that arrived earlier?"""
+        server = DatabaseServer()
+        server._read_buffer += self._request_bytes("get_matches_list", {"user_id": "1"}, 0)
+        server._read_buffer += self._request_bytes("get_suggestions_list", {"match_id": "corge"}, 1)
+        server._read_buffer += self._request_bytes("get_login_user_info", {"user_id": "1"}, 2)
+        self.assertEqual(server._enqueue_requests(), [])
+        response_ids = []
+        while server._request_queue:
+            for response in server._process_next_request():
+                response_ids.append(json.loads(response)["request_id"])
+        self.assertEqual(response_ids, [2, 0, 1])
+        self.assertIsNone(server._process_next_request())
+        self.assertEqual(server._queued_counts, {"interactive": 0, "write": 0, "heavy": 0})
+
+    ### Tests for request deadlines ###
+
+    def test_expired_request_is_not_run(self):
+        """Does a request whose deadline already passed come back with the deadline status code instead of a result?"""
+        expired_request_dict = dict(self.valid_request_dict, deadline=time.time() - 1)
+        response = json.loads(self.server._dispatch_request(json.dumps(expired_request_dict)))
+        self.assertEqual(response["status_code"], STATUS_DEADLINE_EXCEEDED)
+
+    def test_request_with_future_deadline_runs(self):
+        request_dict = dict(self.valid_request_dict, deadline=time.time() + 60)
+        response = json.loads(self.server._dispatch_request(json.dumps(request_dict)))
+        self.assertEqual(response["status_code"], 0)
+
+    def test_non_numeric_deadline_is_rejected(self):
+        request_dict = dict(self.valid_request_dict, deadline="soon")
+        response = json.loads(self.server._dispatch_request(json.dumps(request_dict)))
+        self.assertEqual(response["status_code"], 1)
+
+    ### Tests for streamed responses ###
+
+    def _stream_frames(self, server: DatabaseServer, method: str, query_data: dict, **envelope) -> list:
+        server._read_buffer += json.dumps(dict(envelope, stream=True, request_id=7, body_json={"method": method, "query_data": query_data})).encode("utf-8")
+        server._enqueue_requests()
+        return [json.loads(response) for response in server._process_next_request()]
+
+    def test_stream_splits_items_into_chunks(self):
+        items = [{"match_id": str(i)} for i in range(5)]
+        with mock.patch.object(DatabaseAPI, "iter_matches_list", lambda db, query_data: iter(items)):
+            frames = self._stream_frames(DatabaseServer(), "get_matches_list", {"user_id": "1"}, chunk_size=2)
+        self.assertEqual([frame["body_json"] for frame in frames], [items[0:2], items[2:4], items[4:]])
+        self.assertEqual([frame["stream_seq"] for frame in frames], [0, 1, 2])
+        self.assertEqual([frame["final"] for frame in frames], [False, False, True])
+        self.assertTrue(all(frame["request_id"] == 7 and frame["status_code"] == 0 for frame in frames))
+
+    def test_stream_error_ends_with_final_error_frame(self):
+        def failing_items(db, query_data):
+            yield {"match_id": "0"}
+            raise KeyError("corge")
+        with mock.patch.object(DatabaseAPI, "iter_matches_list", failing_items):
+            frames = self._stream_frames(DatabaseServer(), "get_matches_list", {"user_id": "1"}, chunk_size=1)
+        self.assertEqual([(frame["status_code"], frame["final"]) for frame in frames], [(0, False), (1, True)])
+
+    def test_stream_of_empty_list_is_one_final_frame(self):
+        server = DatabaseServer()
+        with mock.patch.object(DatabaseAPI, "iter_matches_list", lambda db, query_data: iter([])):
+            frames = self._stream_frames(server, "get_matches_list", {"user_id": "1"})
+        self.assertEqual(frames, [{"status_code": 0, "body_json": [], "final": True, "stream_seq": 0, "request_id": 7, "packet_size": frames[0]["packet_size"]}])
+        self.assertEqual(server._server_stats()["methods"]["get_matches_list"]["calls"], 1)
+
+    def test_stream_rejects_invalid_chunk_size(self):
+        frames = self._stream_frames(DatabaseServer(), "get_matches_list", {"user_id": "1"}, chunk_size=0)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0]["status_code"], 1)
+
+    def test_stream_flag_ignored_for_unstreamable_method(self):
+        frames = self._stream_frames(DatabaseServer(), "get_login_user_info", {"user_id": "1"})
+        self.assertEqual(len(frames), 1)
+        self.assertNotIn("stream_seq", frames[0])
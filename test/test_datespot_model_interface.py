@@ -116,6 +116,51 @@ class TestHelloWorldThings(unittest.TestCase):
         # update with a list:
         # todo
 
+    def test_spatial_index_follows_writes(self):
+        """Do radius queries reflect creates and deletes made through any instance, and edits made to the file directly?"""
+        query_location, radius = self.terrezanos_location, 1000
+        self.assertEqual([result[1] for result in self.api.query_datespot_ids_near(query_location, radius)], [self.terrezanos_id])
+
+        other_api = DatespotModelInterface(json_map_filename = TEST_JSON_DB_NAME)
+        nearby_data = {"name": "Terrezano's Annex", "location": (self.terrezanos_location[0] + 0.001, self.terrezanos_location[1])}
+        nearby_id = other_api.create(nearby_data)
+        self.assertEqual([result[1] for result in self.api.query_datespot_ids_near(query_location, radius)], [self.terrezanos_id, nearby_id])
+
+        other_api.delete(self.terrezanos_id)
+        self.assertEqual([result[1] for result in self.api.query_datespot_ids_near(query_location, radius)], [nearby_id])
+
+        with open("test/testing_mockDatespotDB.json", 'w') as fobj: # Rewrite the file without going through a model interface
+            json.dump({}, fobj)
+        self.assertEqual(self.api.query_datespot_ids_near(query_location, radius), [])
+
+    def test_is_known_name_location(self):
+        self.assertTrue(self.api.is_known_name_location("  terrezano's ", (self.terrezanos_location[0] + 0.0002, self.terrezanos_location[1]))) # About 22 m away
+        self.assertFalse(self.api.is_known_name_location("Terrezano's", (self.terrezanos_location[0] + 0.001, self.terrezanos_location[1]))) # About 110 m away
+        self.assertFalse(self.api.is_known_name_location("Domenico's", self.terrezanos_location))
+
+    def test_create_many_skips_known(self):
+        new_data_list = [
+            {"name": "Terrezano's", "location": self.terrezanos_location}, # Already known
+            {"name": "Domenico's", "location": (40.723889184134926, -73.97613846772394)},
+            {"name": "domenico's", "location": (40.72389, -73.97614)} # Duplicates the one before it
+        ]
+        new_ids = self.api.create_many(new_data_list)
+        self.assertEqual(len(new_ids), 1)
+        self.assertEqual(self.api.lookup_obj(new_ids[0]).name, "Domenico's")
+        self.assertEqual(self.api.query_num_datespots(), 2)
+        self.assertTrue(DatespotModelInterface(json_map_filename = TEST_JSON_DB_NAME).is_known_name_location("Domenico's", (40.72389, -73.97614)))
+
+    def test_query_datespots_knn(self):
+        nearby_id = self.api.create({"name": "Domenico's", "location": (40.723889184134926, -73.97613846772394)})
+        far_id = self.api.create({"name": "Faraway", "location": (51.5074, -0.1278)})
+        results = self.api.query_datespots_knn(self.terrezanos_location, 2)
+        self.assertEqual([result[1] for result in results], [self.terrezanos_id, nearby_id])
+        self.assertEqual(len(self.api.query_datespots_knn(self.terrezanos_location, 10)), 3)
+        self.api.delete(nearby_id)
+        self.assertEqual([result[1] for result in self.api.query_datespots_knn(self.terrezanos_location, 2)], [self.terrezanos_id, far_id])
+        with self.assertRaises(ValueError):
+            self.api.query_datespots_knn(self.terrezanos_location, 0)
+
 class TestQueriesOnPersistentDB(unittest.TestCase):
     """Tests using a persistent "real" DB rather than a separate DB initialized solely for testing purposes."""
 
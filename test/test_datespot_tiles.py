@@ -0,0 +1,82 @@
+import unittest
+import json, os, random, shutil, tempfile
+from unittest import mock
+
+from project_constants import *
+from datespot_tiles import TileStore, build_tiles
+from geo_utils import haversine
+from model_interfaces import DatespotModelInterface
+
+class TestDatespotTiles(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.directory = tempfile.mkdtemp()
+        self.tiles_directory = os.path.join(self.directory, "tiles")
+        self.datafile = os.path.join(self.directory, "datespots.json")
+        self.json_map = os.path.join(self.directory, "jsonMap.json")
+        self.locations = {}
+        for i in range(300): # Mostly in one metro area, with a few scattered worldwide
+            if i % 10:
+                self.locations[f"id{i}"] = (40.7 + random.uniform(-0.2, 0.2), -74.0 + random.uniform(-0.2, 0.2))
+            else:
+                self.locations[f"id{i}"] = (random.uniform(-89, 89), random.uniform(-180, 180))
+        with open(self.datafile, 'w') as fobj:
+            json.dump({datespot_id: {"datespot_id": datespot_id, "name": datespot_id, "location": location} for datespot_id, location in self.locations.items()}, fobj)
+        with open(self.json_map, 'w') as fobj:
+            json.dump({"datespot_data": self.datafile, "datespot_tiles": self.tiles_directory}, fobj)
+        self.manifest = build_tiles(self.json_map, self.tiles_directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matches_brute_force(self):
+        store = TileStore(self.tiles_directory)
+        for location, radius in [((40.7, -74.0), 3000), ((40.75, -73.9), 15000), ((0, 179.99), 5e6), ((89, 0), 1e6)]:
+            expected = sorted((haversine(location, object_location), object_id) for object_id, object_location in self.locations.items()
+                            if haversine(location, object_location) < radius)
+            self.assertEqual([result[1] for result in store.query_radius(location, radius)], [result[1] for result in expected])
+
+    def test_maps_only_covering_tiles(self):
+        store = TileStore(self.tiles_directory)
+        store.query_radius((40.7, -74.0), 1000)
+        self.assertLessEqual(store.open_tile_count, 4)
+        self.assertGreater(len(self.manifest["tiles"]), 4)
+
+    def test_model_interface_uses_fresh_tiles_only(self):
+        api = DatespotModelInterface(json_map_filename=self.json_map)
+        expected = api._spatial_index().query_radius((40.7, -74.0), 5000)
+        self.assertIsNotNone(api._tile_store())
+        self.assertEqual(api.query_datespot_ids_near((40.7, -74.0), 5000), expected)
+
+        new_id = api.create({"name": "Domenico's", "location": (40.7, -74.0)}) # Tiles no longer match the datafile
+        self.assertIsNone(api._tile_store())
+        self.assertIn(new_id, [result[1] for result in api.query_datespot_ids_near((40.7, -74.0), 100)])
+
+        build_tiles(self.json_map, self.tiles_directory)
+        self.assertIsNotNone(api._tile_store())
+        self.assertIn(new_id, [result[1] for result in api.query_datespot_ids_near((40.7, -74.0), 100)])
+
+    def test_tile_backed_query_reads_datafile_at_most_once(self):
+        api = DatespotModelInterface(json_map_filename=self.json_map)
+        self.assertIsNotNone(api._tile_store())
+        with mock.patch.object(DatespotModelInterface, "_read_json", autospec=True, side_effect=DatespotModelInterface._read_json) as read_json:
+            results = api.query_datespot_objs_near((40.7, -74.0), 10000)
+            self.assertGreater(len(results), 1)
+            self.assertEqual(read_json.call_count, 1)
+            self.assertEqual([datespot.id for distance, datespot in results], [result[1] for result in api.query_datespot_ids_near((40.7, -74.0), 10000)])
+            api.query_datespot_objs_near((40.7, -74.0), 10000) # Data already current
+            self.assertEqual(read_json.call_count, 1)
+
+    def test_tile_store_lookup_skips_parsing_once_cached(self):
+        api = DatespotModelInterface(json_map_filename=self.json_map)
+        tile_store = api._tile_store()
+        self.assertIsNotNone(tile_store)
+        with mock.patch("json.load", side_effect=AssertionError("parsed JSON on the hot path")):
+            self.assertIs(DatespotModelInterface(json_map_filename=self.json_map)._tile_store(), tile_store)
+
+        build_tiles(self.json_map, self.tiles_directory) # Rebuilt tiles get reopened
+        self.assertIsNot(api._tile_store(), tile_store)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-import random
+import doctest, random
 
 from geo_utils import *
 
@@ -52,6 +52,125 @@ class TestHaversine(unittest.TestCase):
         expected = expectedGCDistanceNYCtoToronto
         self.assertAlmostEqual(actual, expected, delta=expected*maxDelta)
 
+class TestVectorizedHaversine(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.origin = (40.7128, -74.0060)
+        self.locations = [(random.uniform(-90, 90), random.uniform(-180, 180)) for i in range(500)]
+        self.nearby_locations = [(self.origin[0] + random.uniform(-0.05, 0.05), self.origin[1] + random.uniform(-0.05, 0.05)) for i in range(500)]
+
+    def test_one_to_many_matches_scalar(self):
+        distances = haversine_one_to_many(self.origin, self.locations + self.nearby_locations)
+        for location, distance in zip(self.locations + self.nearby_locations, distances):
+            self.assertAlmostEqual(distance, haversine(self.origin, location), delta=1e-6)
+
+    def test_matrix_matches_scalar(self):
+        distances = haversine_matrix(self.locations[:20], self.nearby_locations[:30])
+        self.assertEqual(distances.shape, (20, 30))
+        for i in range(20):
+            for j in range(30):
+                self.assertAlmostEqual(distances[i][j], haversine(self.locations[i], self.nearby_locations[j]), delta=1e-6)
+
+    def test_pairwise_matches_scalar(self):
+        distances = haversine_pairwise(self.locations, self.nearby_locations)
+        centers = midpoints(self.locations, self.nearby_locations)
+        for i in range(len(self.locations)):
+            self.assertAlmostEqual(distances[i], haversine(self.locations[i], self.nearby_locations[i]), delta=1e-6)
+            self.assertEqual(tuple(centers[i]), midpoint(self.locations[i], self.nearby_locations[i]))
+
+    def test_indices_within_radius(self):
+        radius = 3000
+        expected = [i for i, location in enumerate(self.nearby_locations) if haversine(self.origin, location) < radius]
+        self.assertEqual(list(indices_within_radius(self.origin, self.nearby_locations, radius)), expected)
+
+    def test_empty_locations(self):
+        self.assertEqual(len(haversine_one_to_many(self.origin, [])), 0)
+        self.assertEqual(len(indices_within_radius(self.origin, [], 1000)), 0)
+
+class TestBoundingBoxPrefilter(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.locations = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for i in range(2000)]
+
+    def assert_matches_full_scan(self, origin, radius):
+        expected = sorted((haversine(origin, location), i) for i, location in enumerate(self.locations) if haversine(origin, location) < radius)
+        indices, distances = query_radius(origin, self.locations, radius)
+        self.assertEqual(list(indices), [i for distance, i in expected])
+        self.assertTrue(all(abs(distances[j] - expected[j][0]) < 1e-6 for j in range(len(expected))))
+
+    def test_matches_full_scan(self):
+        for origin in [(40.7, -74.0), (0, 0), (-33.9, 151.2)]:
+            self.assert_matches_full_scan(origin, 1500000)
+
+    def test_antimeridian(self):
+        boxes = bounding_box((10, 179.5), 200000)
+        self.assertEqual(len(boxes), 2)
+        self.locations += [(10, -179.9), (10, 179.9)]
+        self.assert_matches_full_scan((10, 179.5), 200000)
+        self.assert_matches_full_scan((-20, -179.8), 1000000)
+
+    def test_pole(self):
+        boxes = bounding_box((89.5, 10), 200000)
+        self.assertEqual(boxes, [(boxes[0][0], 90.0, -180.0, 180.0)])
+        self.locations += [(89.9, -170), (89.9, 100)]
+        self.assert_matches_full_scan((89.5, 10), 200000)
+        self.assert_matches_full_scan((-88, 45), 500000)
+
+    def test_box_contains_circle(self):
+        origin, radius = (60, 30), 100000
+        (min_lat, max_lat, min_lon, max_lon), = bounding_box(origin, radius)
+        for bearing in range(0, 360, 5): # Points just inside the circle at every bearing must fall inside the box
+            delta = radius * 0.999 / (EARTH_RADIUS_KM * 1000)
+            lat1, lon1, theta = radians(origin[0]), radians(origin[1]), radians(bearing)
+            lat2 = asin(sin(lat1) * cos(delta) + cos(lat1) * sin(delta) * cos(theta))
+            lon2 = lon1 + np.arctan2(sin(theta) * sin(delta) * cos(lat1), cos(delta) - sin(lat1) * sin(lat2))
+            self.assertTrue(in_bounding_boxes([(degrees(lat2), degrees(lon2))], [(min_lat, max_lat, min_lon, max_lon)])[0])
+
+class TestEquirectangular(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(5)
+        self.pairs = []
+        for i in range(3000): # Pairs up to 20 km apart, at every latitude short of the poles, some straddling the antimeridian
+            lat, lon = rng.uniform(-89.5, 89.5), rng.choice([rng.uniform(-180, 180), rng.uniform(179.9, 180)])
+            other = (lat + rng.uniform(-0.15, 0.15) * cos(radians(lat)), lon + rng.uniform(-0.15, 0.15))
+            other = (max(-89.9, min(89.9, other[0])), other[1] - 360 if other[1] > 180 else other[1])
+            self.pairs.append(((lat, lon), other))
+
+    def test_within_error_bound_of_haversine(self):
+        for location1, location2 in self.pairs:
+            exact, approximate = haversine(location1, location2), equirectangular(location1, location2)
+            bound = equirectangular_error_bound(exact, max(abs(location1[0]), abs(location2[0])))
+            self.assertLessEqual(abs(approximate - exact), exact * bound + 1e-6)
+
+    def test_error_bound_docstring_examples(self):
+        """Do the worked examples in equirectangular_error_bound's docstring match what it returns?"""
+        runner = doctest.DocTestRunner()
+        for test in doctest.DocTestFinder().find(equirectangular_error_bound, globs={"equirectangular_error_bound": equirectangular_error_bound}):
+            results = runner.run(test)
+            self.assertGreater(results.attempted, 0)
+            self.assertEqual(results.failed, 0)
+
+    def test_vectorized_matches_scalar(self):
+        origin = self.pairs[0][0]
+        others = [location2 for location1, location2 in self.pairs]
+        distances = equirectangular_one_to_many(origin, others)
+        for i, location in enumerate(others):
+            self.assertAlmostEqual(distances[i], equirectangular(origin, location), delta=1e-6)
+
+    def test_query_radius_membership_stays_exact(self):
+        rng = random.Random(6)
+        for origin in [(40.7, -74.0), (78.2, 15.6), (-10, 179.99)]:
+            locations = [(origin[0] + rng.uniform(-0.03, 0.03), origin[1] + rng.uniform(-0.1, 0.1)) for i in range(3000)]
+            locations = [(lat, lon - 360 if lon > 180 else lon) for lat, lon in locations]
+            radius = 2000
+            indices, distances = query_radius(origin, locations, radius)
+            expected = {i for i, location in enumerate(locations) if haversine(origin, location) < radius}
+            self.assertEqual(set(indices), expected)
+            self.assertTrue(all(distances[j] <= distances[j + 1] for j in range(len(distances) - 1)))
+
 class TestMidpoint(unittest.TestCase):
 
     def test_midpoint(self):
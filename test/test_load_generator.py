@@ -0,0 +1,118 @@
+import unittest
+import json
+import os
+import queue
+import threading
+
+from database_server import DatabaseServer
+import shm_transport
+from load_generator import InProcessTransport, FifoTransport, ShmTransport, load_request_log, synthetic_requests, run_load, split_json_frames, DEFAULT_SYNTHETIC_MIX
+from project_constants import *
+
+class ScriptedTransport(FifoTransport):
+    """FifoTransport whose server is a function from each request to the response bytes sent back for it."""
+
+    def __init__(self, reply, timeout: float=5.0):
+        self._timeout = timeout
+        self._reply = reply
+        self._chunks = queue.Queue()
+        self._start_reader()
+
+    def close(self) -> None:
+        self._chunks.put(b"")
+        self._reader.join()
+
+    def _write_request(self, request_bytes: bytes) -> None:
+        self._chunks.put(self._reply(json.loads(request_bytes)))
+
+    def _read_chunk(self) -> bytes:
+        return self._chunks.get()
+
+class TestLoadGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.log_filename = "test/testing_requestLog.jsonl"
+        with open(MOCK_JSON_DB_MAP, 'r') as fobj:
+            json_map = json.load(fobj)
+        with open(json_map["user_data"], 'r') as fobj:
+            self.user_id = list(json.load(fobj))[0]
+        with open(self.log_filename, 'w') as fobj:
+            fobj.write(json.dumps({"body_json": {"method": "get_login_user_info", "query_data": {"user_id": self.user_id}}}) + "\n")
+            fobj.write("\n")
+            fobj.write(json.dumps({"method": "get_matches_list", "query_data": {"user_id": self.user_id}}) + "\n")
+            fobj.write(json.dumps({"method": "not_a_method", "query_data": {}}) + "\n")
+
+    def tearDown(self):
+        os.remove(self.log_filename)
+
+    def test_load_request_log_wraps_bare_bodies(self):
+        requests = load_request_log(self.log_filename)
+        self.assertEqual(len(requests), 3)
+        for request_dict in requests:
+            self.assertIn("method", request_dict["body_json"])
+
+    def test_replay_report(self):
+        requests = load_request_log(self.log_filename) * 5
+        report = run_load(InProcessTransport(), requests, concurrency=3)
+        self.assertEqual(report["requests"], 15)
+        self.assertEqual(report["status_counts"], {"0": 10, "1": 5})
+        self.assertAlmostEqual(report["error_rate"], 5 / 15, places=3)
+        self.assertGreater(report["throughput_rps"], 0)
+        self.assertLessEqual(report["latency_ms"]["p50"], report["latency_ms"]["p99"])
+
+    def test_shm_transport(self):
+        """Does the shared-memory transport match concurrent responses to their requests, through a live server loop?"""
+        server, channel_name = DatabaseServer(feed_refill_interval=0, midpoint_refresh_interval=0), f"testing_load_generator_{os.getpid()}"
+        channel = shm_transport.ShmChannel(channel_name, create=True)
+        stopped = threading.Event()
+        def serve():
+            while not stopped.is_set():
+                server._serve_shm(channel, timeout=0 if server._request_queue else 0.05)
+        server_thread = threading.Thread(target=serve)
+        server_thread.start()
+        try:
+            transport = ShmTransport(channel_name)
+            report = run_load(transport, load_request_log(self.log_filename) * 4, concurrency=3)
+            transport.close()
+        finally:
+            stopped.set()
+            server_thread.join()
+            channel.close()
+            channel.unlink()
+        self.assertEqual(report["status_counts"], {"0": 8, "1": 4})
+
+    def test_malformed_response_fails_outstanding_requests(self):
+        """Does a response frame that won't decode fail the requests waiting on the stream, rather than leave them to time out?"""
+        transport = ScriptedTransport(lambda request_dict: b'{"request_id": %d, "status_code": ]}' % request_dict["request_id"])
+        with self.assertRaises(ConnectionError):
+            transport.send({"body_json": {"method": "get_login_user_info", "query_data": {"user_id": self.user_id}}})
+        with self.assertRaises(ConnectionError): # Reader has stopped, so later requests fail right away too
+            transport.send({"body_json": {"method": "get_login_user_info", "query_data": {"user_id": self.user_id}}})
+        transport._reader.join()
+
+    def test_response_without_request_id_counts_as_error(self):
+        def reply(request_dict):
+            if request_dict["request_id"] == 1: # Lost its request_id, so its request can only time out
+                return json.dumps({"status_code": 1, "body_json": "Malformed request"}).encode("utf-8")
+            return json.dumps({"request_id": request_dict["request_id"], "status_code": 0, "body_json": {}}).encode("utf-8")
+        transport = ScriptedTransport(reply, timeout=0.2)
+        report = run_load(transport, load_request_log(self.log_filename))
+        transport.close()
+        self.assertEqual(report["status_counts"], {"0": 2, "transport error: TimeoutError": 1, "unmatched response": 1})
+        self.assertEqual(report["error_rate"], 0.5)
+        self.assertEqual(transport.unmatched_responses, [{"status_code": 1, "body_json": "Malformed request"}])
+
+    def test_synthetic_requests(self):
+        requests = synthetic_requests(50)
+        self.assertEqual(len(requests), 50)
+        self.assertEqual(requests, synthetic_requests(50))  # Same seed, same requests
+        for request_dict in requests:
+            self.assertIn(request_dict["body_json"]["method"], DEFAULT_SYNTHETIC_MIX)
+
+    def test_split_json_frames(self):
+        frames, remaining = split_json_frames(b'{"a": "}"} {"b": 2}{"c": ')
+        self.assertEqual(frames, [{"a": "}"}, {"b": 2}])
+        self.assertEqual(remaining, b'{"c": ')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -69,6 +69,24 @@ class TestHelloWorldThings(unittest.TestCase):
         # matchObj.id should be identical to the known match key:
         self.assertEqual(matchObj.id, self.knownMatchKey)
 
+    def test_recompute_midpoints(self):
+        self.assertEqual(self.api.recompute_midpoints(), []) # Midpoint stored at creation, and nobody moved
+
+        self.user_api.update(self.userKeyMiltrudd, {"current_location": [41.001, -72.0]}) # Moves the midpoint about 56 m
+        self.assertEqual(self.api.recompute_midpoints(threshold=500), [])
+        self.user_api.update(self.userKeyMiltrudd, {"current_location": [42.0, -72.0]})
+        self.assertEqual(self.api.recompute_midpoints(threshold=500), [self.knownMatchKey])
+        self.assertTrue(self.api.suggestion_candidates_needed(self.knownMatchKey))
+        match_data = self.api._data[self.knownMatchKey]
+        expected_midpoint = ((40.746667 + 42.0) / 2, (-74.001111 + -72.0) / 2)
+        self.assertAlmostEqual(match_data["midpoint"][0], expected_midpoint[0])
+        self.assertAlmostEqual(match_data["midpoint"][1], expected_midpoint[1])
+        self.assertAlmostEqual(match_data["distance"], self.api.lookup_obj(self.knownMatchKey).distance)
+        self.assertEqual(self.api.recompute_midpoints(threshold=500), []) # Already flagged
+
+        self.api.sync(self.api.lookup_obj(self.knownMatchKey)) # Syncing refreshed suggestions clears the flag
+        self.assertNotIn("suggestions_stale", self.api._data[self.knownMatchKey])
+
 # todo need very thorough testing of the get_suggestions stuff. Very buggy and slapped together as of 5/13.
 
 if __name__ == '__main__':
@@ -95,6 +95,13 @@ class TestHelloWorldThings(unittest.TestCase):
     def test_init(self):
         self.assertIsInstance(self.message_obj, models.Message)
     
+    def test_tastes_keywords_loaded_once_and_sorted(self):
+        """Do Messages share a single sorted keywords list?"""
+        keywords = models.nlp_resources.tastes_keywords()
+        self.assertIs(keywords, self.message_obj._tastes_keywords)
+        self.assertIs(keywords, self.multisentence_message_obj._tastes_keywords)
+        self.assertEqual(keywords, sorted(keywords))
+
     def test_eq(self):
         """Does the custom __eq__() behave as expected?"""
         self.assertTrue(self.message_obj == self.message_obj)
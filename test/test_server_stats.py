@@ -0,0 +1,41 @@
+import unittest
+import random
+
+from server_stats import LatencyHistogram, ServerStats, HISTOGRAM_GROWTH_FACTOR
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.samples = [random.uniform(0.001, 0.5) for i in range(5000)]
+        self.histogram = LatencyHistogram()
+        for sample in self.samples:
+            self.histogram.record(sample)
+
+    def test_percentiles_within_bucket_error(self):
+        """Is each estimated percentile within one bucket's width of the exact percentile?"""
+        sorted_samples = sorted(self.samples)
+        for percent in (50, 95, 99):
+            exact = sorted_samples[int(len(sorted_samples) * percent / 100) - 1]
+            estimate = self.histogram.percentile(percent)
+            self.assertGreaterEqual(estimate, exact / HISTOGRAM_GROWTH_FACTOR)
+            self.assertLessEqual(estimate, exact * HISTOGRAM_GROWTH_FACTOR)
+
+    def test_empty_histogram(self):
+        self.assertEqual(LatencyHistogram().summary()["p99"], 0.0)
+
+class TestServerStats(unittest.TestCase):
+
+    def test_snapshot_totals(self):
+        stats = ServerStats()
+        stats.record_call("foo", 0.01)
+        stats.record_call("foo", 0.02, error=True)
+        stats.record_bytes("foo", 10, 100)
+        stats.record_bytes("bar", 5, 50)
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot["methods"]["foo"]["calls"], 2)
+        self.assertEqual(snapshot["methods"]["foo"]["errors"], 1)
+        self.assertEqual((snapshot["bytes_in"], snapshot["bytes_out"]), (15, 150))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import json, os, shutil, tempfile
+from unittest import mock
+
+from shm_transport import RingBuffer, ShmChannel
+from database_server import DatabaseServer
+
+class TestRingBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.shm_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.shm_dir, "ring")
+        self.writer = RingBuffer(self.path, capacity=16, create=True)
+        self.reader = RingBuffer(self.path)
+
+    def tearDown(self):
+        self.writer.close()
+        self.reader.close()
+        shutil.rmtree(self.shm_dir)
+
+    def test_opener_gets_creator_capacity(self):
+        self.assertEqual(self.reader.capacity, 16)
+
+    def test_refuses_weakly_ordered_cpus(self):
+        with mock.patch("platform.machine", return_value="aarch64"):
+            with self.assertRaises(RuntimeError):
+                RingBuffer(self.path)
+
+    def test_write_stops_when_full(self):
+        self.assertEqual(self.writer.write(b"x" * 20), 16)
+        self.assertEqual(self.writer.write(b"y"), 0)
+        self.assertEqual(self.reader.read(), b"x" * 16)
+
+    def test_bytes_wrap_around_in_order(self):
+        """Does the stream come out intact when writes and reads wrap past the end of the data area?"""
+        written, read = b"", b""
+        for i in range(20):
+            chunk = bytes([65 + i]) * 7
+            self.assertEqual(self.writer.write(chunk), 7)
+            written += chunk
+            read += self.reader.read(max_bytes=5) + self.reader.read()
+        self.assertEqual(read, written)
+        self.assertEqual(self.reader.readable(), 0)
+
+    def test_wait_readable(self):
+        self.assertFalse(self.reader.wait_readable(timeout=0.02))
+        self.writer.write(b"abc")
+        self.assertTrue(self.reader.wait_readable(timeout=0.02))
+
+class TestShmServer(unittest.TestCase):
+
+    def test_request_and_response_through_channel(self):
+        shm_dir = tempfile.mkdtemp()
+        server_channel = ShmChannel("testing", create=True, shm_dir=shm_dir)
+        client_channel = ShmChannel("testing", shm_dir=shm_dir)
+        try:
+            request = {"request_id": 3, "body_json": {"method": "get_server_stats", "query_data": {}}}
+            client_channel.requests.write_all(json.dumps(request).encode("utf-8"))
+            DatabaseServer()._serve_shm(server_channel, timeout=0.1)
+            self.assertTrue(client_channel.responses.wait_readable(timeout=1))
+            response = json.loads(client_channel.responses.read())
+            self.assertEqual((response["status_code"], response["request_id"]), (0, 3))
+        finally:
+            client_channel.close()
+            server_channel.close()
+            server_channel.unlink()
+            shutil.rmtree(shm_dir)
+
+if __name__ == '__main__':
+    unittest.main()
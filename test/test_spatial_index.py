@@ -0,0 +1,128 @@
+import unittest
+import random
+
+from spatial_index import GeoGridIndex, NameLocationIndex, UnitVectorKDTree
+from geo_utils import haversine
+
+class TestGeoGridIndex(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.index = GeoGridIndex(cell_degrees=1.0)  # Coarse cells, so that queries span many of them
+        self.locations = {}
+        for i in range(2000):
+            location = (random.uniform(-90, 90), random.uniform(-180, 180))
+            self.locations[str(i)] = location
+            self.index.insert(str(i), location)
+
+    def _brute_force(self, location, radius):
+        return sorted((haversine(location, object_location), object_id) for object_id, object_location in self.locations.items()
+                        if haversine(location, object_location) < radius)
+
+    def assert_same_results(self, location, radius):
+        expected = self._brute_force(location, radius)
+        actual = self.index.query_radius(location, radius)
+        self.assertEqual([result[1] for result in actual], [result[1] for result in expected])
+        for (actual_distance, actual_id), (expected_distance, expected_id) in zip(actual, expected):
+            self.assertAlmostEqual(actual_distance, expected_distance, delta=1e-6)
+
+    def test_matches_brute_force(self):
+        for i in range(50):
+            self.assert_same_results((random.uniform(-80, 80), random.uniform(-180, 180)), random.choice([1e4, 3e5, 1e6, 5e6]))
+
+    def test_antimeridian_and_poles(self):
+        for location in [(10, 179.9), (-45, -179.5), (89.5, 0), (-89.9, 120), (0, 180)]:
+            self.assert_same_results(location, 800000)
+
+    def test_insert_moves_and_remove(self):
+        self.index.insert("0", (40.0, -74.0))
+        self.index.remove("1")
+        self.assertIn("0", [result[1] for result in self.index.query_radius((40.0, -74.0), 10)])
+        self.assertNotIn("1", self.index)
+        self.assertEqual(len(self.index), 1999)
+
+    def test_iter_nearest_matches_brute_force(self):
+        for location in [(40.7, -74.0), (10, 179.9), (-89.9, 120), (0, 180)]:
+            expected = sorted((haversine(location, object_location), object_id) for object_id, object_location in self.locations.items())
+            actual = list(self.index.iter_nearest(location))
+            self.assertEqual([result[1] for result in actual], [result[1] for result in expected])
+
+    def test_iter_nearest_sparse_and_lazy(self):
+        sparse_index = GeoGridIndex()  # Fine cells, with the objects far apart
+        sparse_index.insert("a", (40.0, -74.0))
+        sparse_index.insert("b", (-33.9, 151.2))
+        sparse_index.insert("c", (40.001, -74.001))
+        nearest = sparse_index.iter_nearest((40.0, -74.0))
+        self.assertEqual([next(nearest)[1], next(nearest)[1]], ["a", "c"])
+        self.assertEqual(next(nearest)[1], "b")
+        self.assertEqual(list(GeoGridIndex().iter_nearest((0, 0))), [])
+
+class TestNameLocationIndex(unittest.TestCase):
+
+    def test_find(self):
+        index = NameLocationIndex()
+        index.insert("a", (40.0, -74.0), "Terrezano's")
+        index.insert("b", (10.0, 179.99999), "Antimeridian Cafe")
+        self.assertEqual(index.find("TERREZANO'S", (40.0003, -74.0), 50), "a") # Different cell, about 33 m away
+        self.assertIsNone(index.find("Terrezano's", (40.001, -74.0), 50))
+        self.assertIsNone(index.find("Domenico's", (40.0, -74.0), 50))
+        self.assertEqual(index.find("antimeridian  cafe", (10.0, -179.99999), 50), "b")
+        index.insert("a", (41.0, -74.0), "Terrezano's")
+        self.assertIsNone(index.find("Terrezano's", (40.0, -74.0), 50))
+        index.remove("a")
+        self.assertNotIn("a", index)
+        self.assertEqual(len(index), 1)
+
+    def test_near_pole(self):
+        index = NameLocationIndex()
+        index.insert("a", (89.99999, 0), "Polar Bistro")
+        self.assertEqual(index.find("Polar Bistro", (89.99999, 180), 50), "a")
+
+class TestUnitVectorKDTree(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.tree = UnitVectorKDTree(leaf_size=8)
+        self.locations = {}
+        for i in range(3000):
+            self._insert(str(i), (random.uniform(-90, 90), random.uniform(-180, 180)))
+        self.tree.rebuild()
+
+    def _insert(self, object_id, location):
+        self.locations[object_id] = location
+        self.tree.insert(object_id, location)
+
+    def assert_knn_matches_brute_force(self, location, k):
+        expected = sorted((haversine(location, object_location), object_id) for object_id, object_location in self.locations.items())[:k]
+        actual = self.tree.query_knn(location, k)
+        self.assertEqual([result[1] for result in actual], [result[1] for result in expected])
+        for (actual_distance, actual_id), (expected_distance, expected_id) in zip(actual, expected):
+            self.assertAlmostEqual(actual_distance, expected_distance, delta=1e-6)
+
+    def test_matches_brute_force(self):
+        for i in range(50):
+            self.assert_knn_matches_brute_force((random.uniform(-90, 90), random.uniform(-180, 180)), random.choice([1, 3, 10, 40]))
+
+    def test_antimeridian_and_poles(self):
+        for location in [(10, 179.99), (-45, -180), (90, 0), (-90, 0)]:
+            self.assert_knn_matches_brute_force(location, 10)
+
+    def test_pending_inserts_and_tombstones(self):
+        """Are inserts, moves, and removals since the last rebuild reflected in queries?"""
+        for i in range(0, 3000, 97):
+            self.tree.remove(str(i))
+            del self.locations[str(i)]
+        self._insert("new", (40.0, -74.0))
+        self._insert("5", (40.0001, -74.0))  # Moved
+        self.assertEqual([result[1] for result in self.tree.query_knn((40.0, -74.0), 2)], ["new", "5"])
+        self.assert_knn_matches_brute_force((40.0, -74.0), 25)
+        self.assertEqual(len(self.tree), len(self.locations))
+
+    def test_k_larger_than_size(self):
+        tree = UnitVectorKDTree()
+        tree.insert("a", (0, 0))
+        self.assertEqual(len(tree.query_knn((1, 1), 5)), 1)
+        self.assertEqual(UnitVectorKDTree().query_knn((1, 1), 5), [])
+
+if __name__ == '__main__':
+    unittest.main()
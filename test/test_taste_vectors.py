@@ -0,0 +1,35 @@
+import unittest
+import random
+
+import numpy as np
+
+from taste_vectors import *
+
+class TestTasteVectors(unittest.TestCase):
+
+    def test_taste_vector(self):
+        vector = taste_vector({"bagel": [0.8, 3], "brazilian": [-0.4, 1], "not a keyword": [1.0, 5]})
+        self.assertEqual(len(vector), len(vocabulary_index()))
+        self.assertAlmostEqual(vector[vocabulary_index()["bagel"]], 0.6)
+        self.assertAlmostEqual(vector[vocabulary_index()["brazilian"]], -0.2)
+        self.assertEqual(np.count_nonzero(vector), 2)
+
+    def test_cosine_similarities_match_scalar(self):
+        rng = np.random.default_rng(1)
+        vector, matrix, weights = rng.uniform(-1, 1, 10), rng.uniform(-1, 1, (50, 10)), rng.uniform(0, 2, 10)
+        matrix[7] = 0 # No tastes
+        similarities = cosine_similarities(vector, matrix, weights)
+        for i in range(50):
+            norm = np.sqrt(np.sum(weights * vector ** 2) * np.sum(weights * matrix[i] ** 2))
+            self.assertAlmostEqual(similarities[i], np.sum(weights * vector * matrix[i]) / norm if norm else 0.0)
+        self.assertTrue(np.all(cosine_similarities(np.zeros(10), matrix) == 0))
+
+    def test_top_k(self):
+        random.seed(2)
+        scores = np.array([random.choice([0.0, 0.25, 0.5, 1.0]) for i in range(300)])
+        for k in [0, 1, 10, 150, 300, 400]:
+            expected = sorted(range(len(scores)), key=lambda i: (-scores[i], i))[:k]
+            self.assertEqual(list(top_k(scores, k)), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -145,3 +145,28 @@ class TestHelloWorldThings(unittest.TestCase):
         for match in self.azura_user_obj.match_partners:
             self.assertEqual(match, expected_order[i])
             i += 1
+
+    def test_exclusions(self):
+        """Are the User itself, its match partners, and Users it decided on kept in a sorted exclusions list?"""
+        self.assertEqual(self.azura_user_obj.exclusions, [self.azura_id, self.boethiah_id, self.hircine_id])
+        self.assertFalse(self.boethiah_user_obj.is_excluded(self.hircine_id))
+        self.boethiah_user_obj._blacklist(self.hircine_user_obj)
+        self.assertTrue(self.boethiah_user_obj.is_excluded(self.hircine_id))
+        self.assertEqual(self.hircine_user_obj.exclusions, [self.hircine_id]) # Decisions don't leak between Users through default arguments
+
+        legacy_user_obj = models.User(user_id="4", name="Mephala", current_location=self.azura_location, pending_likes={"9": time.time()}, match_blacklist={"10": time.time()})
+        self.assertEqual(legacy_user_obj.exclusions, ["10", "4", "9"])
+
+    def test_next_candidate_skips_excluded(self):
+        self.boethiah_user_obj.candidates.extend([models.Candidate(user_id, name, self.azura_location) for user_id, name in
+                                                  [(self.boethiah_id, self.boethiah_name), (self.azura_id, self.azura_name), (self.hircine_id, self.hircine_name)]])
+        self.boethiah_user_obj._blacklist(self.azura_user_obj)
+        self.assertEqual(self.boethiah_user_obj.next_candidate().id, self.hircine_id)
+
+    def test_next_candidate_none_when_all_excluded(self):
+        self.assertIsNone(self.boethiah_user_obj.next_candidate())
+        self.boethiah_user_obj.candidates.extend([models.Candidate(user_id, name, self.azura_location) for user_id, name in
+                                                  [(self.boethiah_id, self.boethiah_name), (self.azura_id, self.azura_name)]])
+        self.boethiah_user_obj._blacklist(self.azura_user_obj)
+        self.assertIsNone(self.boethiah_user_obj.next_candidate())
+        self.assertEqual(len(self.boethiah_user_obj.candidates), 0)
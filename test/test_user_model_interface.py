@@ -1,5 +1,7 @@
 import unittest
+import unittest.mock
 import json
+import collections
 
 from project_constants import *
 try:
@@ -138,6 +140,80 @@ class TestHelloWorldThings(unittest.TestCase):
     # todo add test for current logic wrt tastes (updating the weighted average)
 
 
+    def test_spatial_index_follows_location_updates(self):
+        """Do nearby-user queries reflect predominant locations updated through another instance, without re-reading per candidate?"""
+        self.assertEqual([result[1].id for result in self.api.query_users_currently_near_location(self.azura_location, 1000)], [self.azura_id])
+
+        other_api = UserModelInterface(json_map_filename=TEST_JSON_DB_NAME)
+        other_api.update(self.boethiah_id, {"predominant_location": (self.azura_location[0] + 0.001, self.azura_location[1])})
+        with unittest.mock.patch.object(UserModelInterface, "_lookup_candidate_obj") as lookup_candidate_obj:
+            query_results = self.api.query_users_currently_near_location(self.azura_location, 1000)
+        lookup_candidate_obj.assert_not_called()
+        self.assertEqual([result[1].id for result in query_results], [self.boethiah_id, self.azura_id]) # Nearest at the end
+
+        other_api.update(self.boethiah_id, {"predominant_location": (51.5074, -0.1278)})
+        self.assertEqual([result[1].id for result in self.api.query_users_currently_near_location(self.azura_location, 1000)], [self.azura_id])
+
+    def test_candidate_feed(self):
+        """Is the next candidate served from the head of the stored feed, nearest first, and dropped from it once decided on?"""
+        for i in range(3):
+            self.api.create({"name": f"Feed {i}", "current_location": (self.azura_location[0] + 0.001 * (i + 1), self.azura_location[1]), "force_key": f"feed{i}"})
+        self.api.create({"name": "Faraway", "current_location": (51.5074, -0.1278), "force_key": "faraway"})
+        self.assertEqual(self.api.lookup_obj(self.azura_id).candidates, collections.deque()) # Looking up a user doesn't refill their feed
+
+        self.assertIn(self.azura_id, self.api.refill_candidate_feeds())
+        self.assertEqual(self.api._data[self.azura_id]["candidates"], ["feed0", "feed1", "feed2", self.boethiah_id]) # No self, nothing out of range
+        self.assertEqual(self.api.refill_candidate_feeds([self.azura_id]), []) # Already holds everyone in range
+
+        with unittest.mock.patch.object(UserModelInterface, "_spatial_index") as spatial_index:
+            self.assertEqual(self.api.query_next_candidate(self.azura_id), "feed0")
+            self.api.blacklist(self.azura_id, "feed0")
+            self.api.add_to_pending_likes(self.azura_id, "feed1")
+            self.assertEqual(self.api.query_next_candidate(self.azura_id), "feed2")
+        spatial_index.assert_not_called()
+
+        self.api._data[self.azura_id]["candidates"] = []
+        self.api._write_json(changed_ids=[self.azura_id])
+        self.api.refill_candidate_feeds([self.azura_id])
+        self.assertEqual(self.api._data[self.azura_id]["candidates"], ["feed2", self.boethiah_id]) # Decided-on users aren't queued again
+        query_results = self.api.query_users_currently_near_location(self.azura_location, exclusions=self.api._data[self.azura_id]["exclusions"])
+        self.assertEqual([result[1].id for result in query_results], [self.boethiah_id, "feed2"])
+
+        self.api.update(self.azura_id, {"predominant_location": (51.5074, -0.1278)})
+        self.assertEqual(self.api.query_next_candidate(self.azura_id), "faraway") # Moving empties the feed, and an empty feed is refilled on demand
+
+    def test_liked_by_index(self):
+        """Does a like land in the liked user's liked-by index and near the front of their feed, including for users stored before the index existed?"""
+        self.api.create({"name": "Hircine", "current_location": self.boethiah_location, "force_key": "3"})
+        self.api.refill_candidate_feeds([self.boethiah_id])
+        self.assertEqual(self.api._data[self.boethiah_id]["candidates"], ["3", self.azura_id])
+        self.api.add_to_pending_likes(self.azura_id, self.boethiah_id)
+        self.assertTrue(self.api.lookup_is_liked_by(self.boethiah_id, self.azura_id))
+        self.assertFalse(self.api.lookup_is_liked_by(self.azura_id, self.boethiah_id))
+        self.assertEqual(self.api._data[self.boethiah_id]["candidates"], ["3", self.azura_id]) # Already right behind the head
+
+        for user_data in self.api._data.values(): # Simulate users stored before the index existed
+            del user_data["liked_by"]
+            user_data["candidates"] = []
+        self.api._write_json()
+        self.api.add_to_pending_likes("3", self.boethiah_id)
+        self.assertEqual(self.api._data[self.boethiah_id]["liked_by"].keys(), {self.azura_id, "3"})
+        self.assertEqual(self.api._data[self.boethiah_id]["candidates"], ["3"])
+        self.api.create({"name": "Mephala", "current_location": self.boethiah_location, "force_key": "4"})
+        self.api.refill_candidate_feeds([self.boethiah_id])
+        self.assertEqual(self.api._data[self.boethiah_id]["candidates"], ["3", self.azura_id, "4"]) # Likers ahead of nearer users
+        self.assertTrue(UserModelInterface(json_map_filename=TEST_JSON_DB_NAME).lookup_is_liked_by(self.boethiah_id, self.azura_id))
+
+    def test_refill_ranks_by_taste_similarity(self):
+        """Are the most taste-similar of the nearby users queued first, with users of no shared tastes left nearest first?"""
+        self.api._data[self.azura_id]["tastes"] = {"bagel": [0.9, 4], "brazilian": [-0.5, 2]}
+        for i, tastes in enumerate([{}, {"bagel": [-0.9, 4]}, {"bagel": [0.8, 2], "brazilian": [-0.6, 3]}, {"bagel": [0.5, 1]}]):
+            self.api._data[f"taste{i}"] = dict(self.api._data[self.boethiah_id], user_id=f"taste{i}", name=f"Taste {i}", tastes=tastes,
+                                               predominant_location=[self.azura_location[0] + 0.001 * (i + 1), self.azura_location[1]])
+        self.api._write_json()
+        self.api.refill_candidate_feeds([self.azura_id], feed_size=4)
+        self.assertEqual(self.api._data[self.azura_id]["candidates"], ["taste2", "taste3", "taste0", self.boethiah_id])
+
 class TestMatchCandidates(unittest.TestCase):
     """Tests on the persistent mock DB."""
 